@@ -0,0 +1,214 @@
+"""
+asyncio fetch engine for generation runs, as an alternative to one thread pool per generation
+
+A single AsyncFetchEngine owns one event loop (on a background thread), one pooled aiohttp session, one token-bucket
+rate limiter and one cap on in-flight requests. Every generation that is given the same engine shares all of them,
+so running several generations at once no longer multiplies the load on the API
+
+The engine plugs into the crawl planner, so rows are still built by PokemonData from the fetched resources:
+    with AsyncFetchEngine(requests_per_second=20) as engine:
+        process_multiple_generations_in_parallel([1, 2, 3], engine=engine)
+"""
+
+import asyncio
+import time
+from threading import Thread
+
+import pokeapi_client
+from instrumentation import metrics
+from resource_projection import project
+from retry_queue import record_failure, record_success
+from response_cache import CacheMissError
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: allows bursts of up to capacity requests, refilled at rate tokens per second
+    pause() empties the bucket for a while, so that one 429 response slows down every request rather than just one
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    self.refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class AsyncFetchEngine:
+    """
+    Fetches PokeAPI resources through the shared response cache, with:
+    - base_url: the API to call, e.g. a StubServer's base_url for local runs
+    - requests_per_second, burst: token-bucket rate limit shared by every request the engine makes
+    - max_in_flight: the most requests allowed to be waiting on a response at once
+    - max_retries: attempts made after a 429 or 5xx response before giving up on a resource
+    """
+
+    def __init__(self, base_url=None, requests_per_second=20, burst=10, max_in_flight=16, max_retries=5,
+                 timeout=pokeapi_client.REQUEST_TIMEOUT):
+        self.base_url = base_url or pokeapi_client.BASE_URL
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.loop = None
+        self.thread = None
+        self.session = None
+        self.bucket = None
+        self.in_flight = None
+
+        self.latencies = []
+        self.stats = {'requests': 0, 'cache_hits': 0, 'rate_limited': 0, 'retries': 0, 'failed': 0}
+        self.started_at = None
+
+    # Start of lifecycle methods. The loop runs on its own thread so that synchronous callers can share it
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.run(self.open())
+        self.started_at = time.monotonic()
+        return self
+
+    async def open(self):
+        import aiohttp  # Only needed once the engine is actually started
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self.bucket = TokenBucket(self.requests_per_second, self.burst)
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, coroutine):
+        # Runs a coroutine on the engine's loop from any thread, blocking until it completes
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # Start of fetching methods
+    async def call_api(self, endpoint, resource_id):
+        url = f"{self.base_url}/{endpoint}/{resource_id}/"
+
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            async with self.in_flight:
+                started = time.monotonic()
+                async with self.session.get(url) as response:
+                    self.stats['requests'] += 1
+                    pokeapi_client.count('requests')
+
+                    retry = response.status == 429 or response.status >= 500
+                    if response.status == 429:
+                        self.stats['rate_limited'] += 1
+                        # Everyone backs off, not just this request
+                        self.bucket.pause(float(response.headers.get('Retry-After', 2 ** attempt)))
+                    if not retry or attempt == self.max_retries:
+                        response.raise_for_status()
+                        pokeapi_client.record_etag(endpoint, resource_id, response.headers.get('ETag'))
+                        data = await response.json()
+                        self.latencies.append(time.monotonic() - started)
+                        return data
+
+            # The response and the in-flight slot are both released before backing off, so other requests carry on
+            self.stats['retries'] += 1
+            await asyncio.sleep(min(2 ** attempt * 0.1, 5))
+
+    async def fetch(self, endpoint, resource_id):
+        """
+        Returns the JSON for a resource, from the shared response cache if possible
+        The cache and retry queue are SQLite files, so they are read and written on worker threads rather than
+        blocking every other request on the event loop
+        """
+        response_cache = pokeapi_client.get_cache()
+
+        started = time.perf_counter()
+        data = await asyncio.to_thread(response_cache.get, endpoint, resource_id)
+        if data is not None:
+            self.stats['cache_hits'] += 1
+            pokeapi_client.count('cache_hits')
+            metrics.record_fetch(endpoint, time.perf_counter() - started, cache_hit=True)
+            return project(endpoint, data)
+
+        if pokeapi_client.offline:
+            raise CacheMissError(f"{endpoint}/{resource_id} is not cached and offline mode is enabled")
+
+        try:
+            data = project(endpoint, await self.call_api(endpoint, resource_id))
+        except Exception as e:
+            await asyncio.to_thread(record_failure, endpoint, resource_id, e)
+            raise
+        await asyncio.to_thread(response_cache.set, endpoint, resource_id, data)
+        await asyncio.to_thread(record_success, endpoint, resource_id)
+        metrics.record_fetch(endpoint, time.perf_counter() - started, cache_hit=False)
+        return data
+
+    async def fetch_all_async(self, keys):
+        results = await asyncio.gather(*(self.fetch(*key) for key in keys), return_exceptions=True)
+
+        resolved = dict()
+        failed = dict()
+        for key, result in zip(keys, results):
+            if isinstance(result, Exception):
+                self.stats['failed'] += 1
+                failed[key] = str(result) or type(result).__name__
+            else:
+                resolved[key] = result
+        return resolved, failed
+
+    def fetch_all(self, keys):
+        """
+        Synchronous wrapper: fetches every (endpoint, resource id) in keys, returning (resolved, failed) dictionaries
+        """
+        return self.run(self.fetch_all_async(list(keys)))
+
+    def get_json(self, endpoint, resource_id):
+        # Same signature as pokeapi_client.get_json, for single lookups
+        return self.run(self.fetch(endpoint, resource_id))
+
+    def summary(self):
+        """
+        Throughput and latency figures for everything the engine has fetched so far
+        """
+        latencies = sorted(self.latencies)
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+        return dict(self.stats, elapsed_s=elapsed, requests_per_s=self.stats['requests'] / elapsed if elapsed else 0,
+                    latency_p50_s=percentile(0.5), latency_p95_s=percentile(0.95))
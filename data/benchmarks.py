@@ -0,0 +1,280 @@
+"""
+Benchmarks for the dataset creation pipeline, run against a local PokeAPI stand-in rather than the live API
+
+The fixtures are an api-data style directory covering every generation the default grids crawl (Gens 1, 2 and 4 in
+full), plus Sylveon so that Eevee's evolution chain is complete. They can be generated deterministically with
+fixture_tree.py, which is what run does when no fixture directory is given, or recorded from the API (or a warm
+cache) for real response shapes. Each benchmark starts a StubServer over the fixtures, with configurable latency,
+jitter and error rate, and runs a scenario with a cold cache and its own retry queue:
+- generation: process_generation for one generation
+- parallel: process_multiple_generations_in_parallel across several generations
+over a grid of parameters (batch_size, max_threads, use_planner, max_workers...). For every combination it reports
+throughput, fetch latency p50/p95, request counts and peak memory. Results can be saved as a baseline, and a later
+run compared against it, failing if anything has regressed beyond a tolerance. benchmark_baseline.json, next to this
+file, was measured on the generated fixtures with the settings it records. Rows and request counts should match it
+exactly; timings and memory depend on the machine, so regenerate it with --save-baseline before comparing on another
+
+Usage:
+    python benchmarks.py run --latency 0.02 --jitter 0.01   # Generated fixtures, compared with benchmark_baseline.json
+    python benchmarks.py generate fixtures
+    python benchmarks.py record fixtures   # From the API, or a warm cache
+    python benchmarks.py run fixtures --latency 0.02 --jitter 0.01 --save-baseline --baseline my_baseline.json
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pokeapi_client
+import retry_queue
+from evolution_index import EvolutionChainIndex
+from fixture_tree import write_fixture_tree
+from generation_datasets import process_generation, process_multiple_generations_in_parallel
+from instrumentation import metrics
+from pokemondata import PokemonData
+from stub_server import StubServer
+
+# Every generation crawled by DEFAULT_GRIDS, plus Sylveon to complete Eevee's chain. Megas, Gigantamax forms and
+# Wormadam's cloaks come in as varieties
+REPRESENTATIVE_SLICE = list(range(1, 252)) + list(range(387, 494)) + [700]
+
+SCENARIOS = {
+    'generation': lambda params: process_generation(
+        params['generation'], batch_size=params['batch_size'], use_planner=params['use_planner'],
+        max_threads=params['max_threads']
+    ),
+    'parallel': lambda params: process_multiple_generations_in_parallel(
+        params['generations'], batch_size=params['batch_size'], max_workers=params['max_workers'],
+        use_planner=params['use_planner'], max_threads=params['max_threads']
+    ),
+}
+
+DEFAULT_GRIDS = {
+    'generation': {
+        'generation': [1], 'use_planner': [False, True], 'batch_size': [5, 10, 20], 'max_threads': [4, 8, 16]
+    },
+    'parallel': {
+        'generations': [[1, 2, 4]], 'use_planner': [False, True], 'batch_size': [10], 'max_workers': [1, 3],
+        'max_threads': [4, 8]
+    },
+}
+
+
+def write_fixture(root, endpoint, resource_id, data):
+    directory = os.path.join(root, 'api', 'v2', endpoint, str(resource_id))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'index.json'), 'w') as file_manager:
+        json.dump(data, file_manager)
+
+
+def generate_fixtures(root, dex_nums=REPRESENTATIVE_SLICE):
+    """
+    Generates deterministic stand-in fixtures for dex_nums (see fixture_tree.py), returning the number of resources
+    """
+    return write_fixture_tree(root, dex_nums)
+
+
+def record_fixtures(root, dex_nums=REPRESENTATIVE_SLICE, fetch=pokeapi_client.get_json):
+    """
+    Records every species, variety and evolution chain the pipeline needs for dex_nums into an api-data style
+    directory that StubServer can serve. Goes through the response cache, so a warm cache can be recorded offline
+    Returns the number of resources recorded
+    """
+    recorded = set()
+
+    def record(endpoint, resource_id):
+        if (endpoint, resource_id) not in recorded:
+            write_fixture(root, endpoint, resource_id, fetch(endpoint, resource_id))
+            recorded.add((endpoint, resource_id))
+
+    for dex_num in dex_nums:
+        record('pokemon-species', dex_num)
+        species = fetch('pokemon-species', dex_num)
+        for variety in species['varieties']:
+            record('pokemon', pokeapi_client.id_from_url(variety['pokemon']['url']))
+        if species.get('evolution_chain'):
+            record('evolution-chain', pokeapi_client.id_from_url(species['evolution_chain']['url']))
+
+    return len(recorded)
+
+
+def expand_grid(grid):
+    """
+    Every combination of a {parameter: [values]} grid, as a list of {parameter: value} dictionaries
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def result_key(scenario, params):
+    return scenario + ':' + ','.join(f"{name}={params[name]}" for name in sorted(params))
+
+
+def count_rows(work_dir):
+    rows = 0
+    for path in glob.glob(os.path.join(work_dir, 'pokemon_data_gen*.csv')):
+        with open(path) as file_manager:
+            rows += max(sum(1 for _ in file_manager) - 1, 0)
+    return rows
+
+
+def run_scenario(root, scenario, params, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+    """
+    Runs one scenario with one set of parameters against a fresh StubServer and a cold cache, in a scratch
+    directory, returning its measurements
+    """
+    previous_base_url, previous_cache, previous_offline = pokeapi_client.BASE_URL, pokeapi_client.cache, \
+        pokeapi_client.offline
+    previous_index = PokemonData.evolution_index
+    previous_queue = retry_queue.retry_queue
+    previous_dir = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as work_dir, \
+            StubServer(root, latency=latency, jitter=jitter, error_rate=error_rate, seed=seed) as stub:
+        # Injected errors are queued here, rather than in the real queue that repair.py works through
+        scenario_queue = retry_queue.set_retry_queue(os.path.join(work_dir, 'retry_queue.sqlite'))
+        try:
+            pokeapi_client.BASE_URL = stub.base_url
+            pokeapi_client.set_cache(os.path.join(work_dir, 'cache.sqlite'))
+            PokemonData.evolution_index = EvolutionChainIndex(PokemonData.pseudo_base_forms)  # No memo between runs
+            pokeapi_client.reset_request_stats()
+            metrics.reset()
+            os.chdir(work_dir)
+
+            tracemalloc.start()
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):  # The pipeline prints a line per Pokémon
+                SCENARIOS[scenario](params)
+            seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            os.chdir(previous_dir)
+            pokeapi_client.cache.close()
+            scenario_queue.close()
+            retry_queue.retry_queue = previous_queue
+            pokeapi_client.BASE_URL, pokeapi_client.cache, pokeapi_client.offline = previous_base_url, \
+                previous_cache, previous_offline
+            PokemonData.evolution_index = previous_index
+
+        rows = count_rows(work_dir)
+        latency_summary = metrics.fetch_latency()
+        return {
+            'rows': rows,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(rows / seconds, 2) if seconds else 0.0,
+            'p50_ms': latency_summary['p50_ms'],
+            'p95_ms': latency_summary['p95_ms'],
+            'requests': sum(stub.request_counts.values()),
+            'requests_by_outcome': dict(stub.request_counts),
+            'peak_mb': round(peak / 2 ** 20, 2),
+        }
+
+
+def run_benchmarks(root, grids=DEFAULT_GRIDS, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+    """
+    Runs every scenario over every combination in its grid, returning {result key: measurements}
+    """
+    results = dict()
+    for scenario, grid in grids.items():
+        for params in expand_grid(grid):
+            key = result_key(scenario, params)
+            results[key] = run_scenario(root, scenario, params, latency, jitter, error_rate, seed)
+            print(f"{key}: {results[key]}")
+            if results[key]['requests_by_outcome']['not_found']:
+                print(f"{key}: the fixtures don't cover everything this scenario crawls, so it partly times 404s")
+    return results
+
+
+def save_baseline(results, path, settings):
+    # The settings are kept alongside the results, under a key that no result key can take
+    with open(path, 'w') as file_manager:
+        json.dump(dict(results, settings=settings), file_manager, indent=1, sort_keys=True)
+
+
+def compare_with_baseline(results, baseline, tolerance=0.2):
+    """
+    Returns a message for every measurement that is worse than the baseline by more than tolerance (a proportion):
+    lower throughput, higher p95 latency or peak memory, or more requests for the same work
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+
+        if result['rows_per_second'] < base['rows_per_second'] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {result['rows_per_second']} rows/s, "
+                               f"baseline {base['rows_per_second']}")
+        if base['p95_ms'] and result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{key}: p95 latency {result['p95_ms']}ms, baseline {base['p95_ms']}ms")
+        if result['peak_mb'] > base['peak_mb'] * (1 + tolerance):
+            regressions.append(f"{key}: peak memory {result['peak_mb']}MB, baseline {base['peak_mb']}MB")
+        if result['requests'] > base['requests']:
+            regressions.append(f"{key}: {result['requests']} requests, baseline {base['requests']}")
+        if result['rows'] != base['rows']:
+            regressions.append(f"{key}: {result['rows']} rows, baseline {base['rows']}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local PokeAPI stand-in")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = subparsers.add_parser('record', help="Record fixtures from the API (or a warm cache)")
+    record_parser.add_argument('root')
+    record_parser.add_argument('--dex', type=int, nargs='*', default=REPRESENTATIVE_SLICE)
+
+    generate_parser = subparsers.add_parser('generate', help="Generate deterministic stand-in fixtures")
+    generate_parser.add_argument('root')
+    generate_parser.add_argument('--dex', type=int, nargs='*', default=REPRESENTATIVE_SLICE)
+
+    run_parser = subparsers.add_parser('run', help="Run the benchmark grids")
+    run_parser.add_argument('root', nargs='?', default=None, help="Fixtures (default: generated into a scratch dir)")
+    run_parser.add_argument('--scenario', choices=list(SCENARIOS), nargs='*', default=list(SCENARIOS))
+    run_parser.add_argument('--latency', type=float, default=0.0)
+    run_parser.add_argument('--jitter', type=float, default=0.0)
+    run_parser.add_argument('--error-rate', type=float, default=0.0)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                               'benchmark_baseline.json'))
+    run_parser.add_argument('--save-baseline', action='store_true')
+    run_parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        print(f"Recorded {record_fixtures(args.root, args.dex)} resources into {args.root}")
+        sys.exit()
+    if args.command == 'generate':
+        print(f"Generated {generate_fixtures(args.root, args.dex)} resources into {args.root}")
+        sys.exit()
+
+    run_settings = {'fixtures': 'recorded' if args.root else 'generated', 'latency': args.latency,
+                    'jitter': args.jitter, 'error_rate': args.error_rate, 'seed': args.seed}
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        if args.root is None:
+            generate_fixtures(fixture_dir)
+        benchmark_results = run_benchmarks(args.root or fixture_dir,
+                                           {scenario: DEFAULT_GRIDS[scenario] for scenario in args.scenario},
+                                           args.latency, args.jitter, args.error_rate, args.seed)
+    if args.save_baseline:
+        save_baseline(benchmark_results, args.baseline, run_settings)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline_results = json.load(baseline_file)
+        if baseline_results.get('settings', run_settings) != run_settings:
+            print(f"The baseline was measured with {baseline_results['settings']}, not {run_settings}")
+        found = compare_with_baseline(benchmark_results, baseline_results, args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,228 @@
+"""
+Planning stage for generation runs: lists every PokeAPI resource needed for a range of dex numbers, deduplicates them
+into a fetch graph, fetches each one exactly once in dependency order, and only then builds the PokemonData rows
+
+Dependency order is:
+1. pokemon-species, one per dex number
+2. pokemon (the default variety, plus every other variety if requested) and evolution-chain, both discovered from the
+   species data. Chains shared by several species (e.g. Eevee's) are only planned once
+Only the resources the requested fields depend on are planned (see PokemonData.field_dependencies). If neither the
+fields nor the varieties need the species, each dex number's default Pokémon is planned directly in a single level
+"""
+
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pokeapi_client
+from instrumentation import queued
+from pokemondata import PokemonData
+
+
+class FetchGraph:
+    """
+    The deduplicated set of resources for a run, keyed by (endpoint, resource id) and grouped into dependency levels
+    """
+
+    def __init__(self):
+        self.levels = []
+        self.planned = set()
+        self.resolved = dict()
+        self.failed = dict()
+        self.incomplete = set()  # Dex numbers whose rows couldn't all be built, filled in by build_rows
+
+    def add_level(self):
+        self.levels.append([])
+
+    def add(self, endpoint, resource_id):
+        key = (endpoint, resource_id)
+        if key not in self.planned:  # Resources shared between dex numbers are only planned once
+            self.planned.add(key)
+            self.levels[-1].append(key)
+
+    def get(self, endpoint, resource_id):
+        return self.resolved.get((endpoint, resource_id))
+
+    def resolve_level(self, fetch, max_workers=8):
+        """
+        Fetches every resource in the most recent level concurrently, recording failures rather than raising them
+        fetch is called as fetch(endpoint, resource_id) and should return the resource's JSON
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(queued(fetch), *key): key for key in self.levels[-1]}
+
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    self.resolved[key] = future.result()
+                except Exception as e:
+                    self.failed[key] = str(e)
+
+    def resolve_level_with(self, engine):
+        # For fetch engines that resolve a whole level at once, such as AsyncFetchEngine
+        resolved, failed = engine.fetch_all(self.levels[-1])
+        self.resolved.update(resolved)
+        self.failed.update(failed)
+
+    def resolve(self, fetch, max_workers, engine):
+        if engine is not None:
+            self.resolve_level_with(engine)
+        else:
+            self.resolve_level(fetch, max_workers)
+
+    def planned_counts(self):
+        counts = dict()
+        for endpoint, _ in self.planned:
+            counts[endpoint] = counts.get(endpoint, 0) + 1
+        return counts
+
+
+def plan_and_fetch(start, end, process_varieties=True, fetch=pokeapi_client.get_json, max_workers=8, engine=None,
+                   resources=None):
+    """
+    Builds and resolves the fetch graph for the dex numbers in range(start, end)
+    Resources are fetched with a thread pool of max_workers threads, or by the engine if one is given
+    resources limits the plan to what the requested fields need (see PokemonData.resources_for)
+    """
+    graph = FetchGraph()
+    resources = resources if resources is not None else PokemonData.resources_for()
+
+    if 'species' not in resources and not process_varieties:
+        # A default variety shares its species' id, so it can be fetched without looking at the species first
+        graph.add_level()
+        for dex_num in range(start, end):
+            graph.add('pokemon', dex_num)
+        graph.resolve(fetch, max_workers, engine)
+        return graph
+
+    # Level 1: the species, which name every variety and the evolution chain
+    graph.add_level()
+    for dex_num in range(start, end):
+        graph.add('pokemon-species', dex_num)
+    graph.resolve(fetch, max_workers, engine)
+
+    # Level 2: everything discovered from the species data
+    graph.add_level()
+    for dex_num in range(start, end):
+        species = graph.get('pokemon-species', dex_num)
+        if species is None:
+            continue
+
+        for variety in species['varieties']:
+            if process_varieties or variety['is_default']:
+                graph.add('pokemon', pokeapi_client.id_from_url(variety['pokemon']['url']))
+
+        evolution_chain = species.get('evolution_chain')
+        if evolution_chain and 'evolution_chain' in resources:
+            graph.add('evolution-chain', pokeapi_client.id_from_url(evolution_chain['url']))
+    graph.resolve(fetch, max_workers, engine)
+
+    return graph
+
+
+def build_rows(graph, start, end, error_log, process_varieties=True, evolution_index=None, table=None, fields=None):
+    """
+    Builds PokemonData rows from a resolved fetch graph, without making any further lookups
+    Rows are produced in the same order as process_pokemon_batch: each default variety followed by its other varieties
+    If a PokemonTable is given, rows are appended to it rather than returned as dictionaries
+    fields projects the rows onto the given columns
+    """
+    pokemon_data = []
+    log_messages = []
+    evolution_index = evolution_index or PokemonData.evolution_index
+
+    for (endpoint, chain_id), chain in graph.resolved.items():
+        if endpoint == 'evolution-chain':
+            evolution_index.add_chain(chain_id, pokeapi_client.Resource(chain))
+
+    for dex_num in range(start, end):
+        if ('pokemon-species', dex_num) not in graph.planned:
+            # Planned without the species, so there is only the default variety, fetched by dex number
+            pokemon = graph.get('pokemon', dex_num)
+            if pokemon is None:
+                error_message = f"Error processing {dex_num}: {graph.failed.get(('pokemon', dex_num))}"
+                graph.incomplete.add(dex_num)
+                log_messages.append(error_message)
+                print(error_message)
+                continue
+
+            row = PokemonData(dex_num, error_log, evolution_index=evolution_index,
+                              pokemon_data=pokeapi_client.Resource(pokemon), fields=fields)
+            if table is not None:
+                table.append(row)
+            else:
+                pokemon_data.append(row.to_dict())
+            log_messages.append(f"{datetime.now()}: finished {dex_num}")
+            continue
+
+        species = graph.get('pokemon-species', dex_num)
+        if species is None:
+            error_message = f"Error processing {dex_num}: {graph.failed.get(('pokemon-species', dex_num))}"
+            graph.incomplete.add(dex_num)
+            log_messages.append(error_message)
+            print(error_message)
+            continue
+
+        # The default variety comes first, as the original variety does when processing in batches
+        varieties = sorted(species['varieties'], key=lambda v: not v['is_default'])
+        if not process_varieties:
+            varieties = [variety for variety in varieties if variety['is_default']]
+
+        for variety in varieties:
+            pokemon_id = pokeapi_client.id_from_url(variety['pokemon']['url'])
+            try:
+                pokemon = graph.get('pokemon', pokemon_id)
+                if pokemon is None:
+                    raise LookupError(graph.failed.get(('pokemon', pokemon_id), f"pokemon {pokemon_id} not fetched"))
+
+                row = PokemonData(pokemon_id, error_log, pokeapi_client.Resource(species), evolution_index,
+                                  pokeapi_client.Resource(pokemon), fields)
+                if table is not None:
+                    table.append(row)
+                else:
+                    pokemon_data.append(row.to_dict())
+                log_messages.append(f"{datetime.now()}: finished {dex_num} {variety['pokemon']['name']}")
+
+            except Exception as e:
+                error_message = f"Error processing {dex_num} {variety['pokemon']['name']}: {str(e)}"
+                graph.incomplete.add(dex_num)
+                log_messages.append(error_message)
+                print(error_message)
+
+    return pokemon_data, log_messages
+
+
+def make_report(graph, stats_before, stats_after):
+    """
+    Summarises how many requests were planned and how many were actually issued over HTTP
+    """
+    return {
+        'planned': graph.planned_counts(),
+        'planned_total': len(graph.planned),
+        'requests_issued': stats_after['requests'] - stats_before['requests'],
+        'cache_hits': stats_after['cache_hits'] - stats_before['cache_hits'],
+        'failed': len(graph.failed),
+        'incomplete': sorted(graph.incomplete)
+    }
+
+
+def process_pokemon_with_planner(start, end, error_log, process_varieties=True, max_workers=8, engine=None,
+                                 fetch=pokeapi_client.get_json, evolution_index=None, table=None, fields=None):
+    """
+    Planned alternative to process_pokemon_in_batches, returning the rows, log messages and a run report
+    fetch can be swapped out for another source of PokeAPI JSON, such as a local dump (see dump_ingest.py)
+    fields projects the rows onto the given columns, and only the resources they need are fetched
+    """
+    stats_before = pokeapi_client.get_request_stats()
+
+    graph = plan_and_fetch(start, end, process_varieties, fetch, max_workers, engine, PokemonData.resources_for(fields))
+    pokemon_data, log_messages = build_rows(graph, start, end, error_log, process_varieties, evolution_index, table,
+                                            fields)
+
+    report = make_report(graph, stats_before, pokeapi_client.get_request_stats())
+    report_message = (f"{datetime.now()}: planned {report['planned_total']} requests {report['planned']}, "
+                      f"issued {report['requests_issued']}, cache hits {report['cache_hits']}, "
+                      f"failed {report['failed']}")
+    log_messages.append(report_message)
+    print(report_message)
+
+    return pokemon_data, log_messages, report
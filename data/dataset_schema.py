@@ -0,0 +1,260 @@
+"""
+Schema for the generated datasets, and a typed columnar writer/reader to go with it
+
+PokemonData fills any field it can't parse with the sentinels "missing"/"missing attribute", and to_dict joins lists
+into space-separated strings, so every column written by save_to_csv comes back from pd.read_csv as object dtype.
+Here every column has a fixed dtype instead:
+- Proper nulls (pd.NA) in place of the sentinels
+- Small integers for stats and counts, booleans for the is_* flags
+- Categoricals for growth_rate, color and shape
+- Real list columns for types, abilities, varieties and egg_groups
+Typed frames can be written to Parquet or Arrow (Feather), optionally partitioned by generation
+"""
+
+import ast
+import re
+
+import pandas as pd
+
+MISSING_VALUES = {'missing', 'missing attribute', 'None', 'nan', ''}
+
+# Column -> dtype, in the same order as PokemonData.to_dict
+SCHEMA = {
+    'dex_num': 'Int16',
+    'name': 'string',
+    'species': 'string',
+    'generation': 'Int8',
+    'types': 'list',
+    'abilities': 'list',
+    'hidden_ability': 'string',
+    'varieties': 'list',
+
+    'female_rate': 'Int8',
+    'has_gender_differences': 'boolean',
+    'capture_rate': 'UInt8',
+    'growth_rate': 'category',
+    'base_happiness': 'UInt8',
+
+    'hatch_counter': 'UInt8',
+    'egg_groups': 'list',
+
+    'bst': 'Int16',
+    'hp': 'UInt8',
+    'attack': 'UInt8',
+    'defense': 'UInt8',
+    'sp_attack': 'UInt8',
+    'sp_defense': 'UInt8',
+    'speed': 'UInt8',
+
+    'evolves_from': 'string',
+    'evolutionary_stage': 'Int8',
+
+    'is_starter': 'boolean',
+    'is_pseudo': 'boolean',
+    'is_legendary': 'boolean',
+    'is_mythical': 'boolean',
+    'is_baby': 'boolean',
+    'is_ultra_beast': 'boolean',
+    'is_paradox': 'boolean',
+    'is_mega': 'boolean',
+    'is-totem': 'boolean',
+    'is_gmax': 'boolean',
+
+    'color': 'category',
+    'shape': 'category',
+    'height_m': 'Float32',
+    'weight_kg': 'Float32'
+}
+
+LIST_COLUMNS = [column for column, dtype in SCHEMA.items() if dtype == 'list']
+STAT_COLUMNS = ['hp', 'attack', 'defense', 'sp_attack', 'sp_defense', 'speed']
+
+
+def is_missing(value):
+    if value is None or value is pd.NA:
+        return True
+    if isinstance(value, float) and value != value:  # NaN
+        return True
+    return isinstance(value, str) and value.strip() in MISSING_VALUES
+
+
+def parse_list(value):
+    """
+    Parses any of the list formats found in the datasets back into a list of strings:
+    - Python lists, as produced by PokemonData before to_dict
+    - Space-separated strings, as written by to_dict (e.g. 'grass poison')
+    - Python list reprs (e.g. "['overgrow']") and numpy array reprs (e.g. "['grass' 'poison']") from the v0.2 CSVs
+    Sentinel values become pd.NA, while genuinely empty lists stay empty
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, str) and value.strip() == '[]':
+        return []
+    if is_missing(value):
+        return [] if value == '' else pd.NA
+
+    value = value.strip()
+    if value.startswith('['):
+        # numpy reprs leave out the commas between items, which ast needs
+        return list(ast.literal_eval(re.sub(r"'\s+'", "', '", value)))
+    return value.split()
+
+
+def parse_bool(value):
+    if is_missing(value):
+        return pd.NA
+    if isinstance(value, str):
+        return value.strip() == 'True'
+    return bool(value)
+
+
+def to_typed_frame(data):
+    """
+    Converts rows from PokemonData.to_dict (a list of dictionaries), or a DataFrame read from any of the dataset CSVs,
+    into a DataFrame following SCHEMA. Columns that aren't in SCHEMA are dropped, and missing ones are left out
+    """
+    df = pd.DataFrame(data)
+    typed = dict()
+
+    for column, dtype in SCHEMA.items():
+        if column not in df:
+            continue
+        values = df[column]
+
+        if dtype == 'list':
+            typed[column] = values.map(parse_list).astype(object)
+        elif dtype == 'boolean':
+            typed[column] = values.map(parse_bool).astype('boolean')
+        elif dtype == 'string' or dtype == 'category':
+            strings = values.map(lambda v: pd.NA if is_missing(v) else str(v))
+            typed[column] = strings.astype('string' if dtype == 'string' else 'category')
+        else:
+            numbers = pd.to_numeric(values.map(lambda v: pd.NA if is_missing(v) else v), errors='coerce')
+            typed[column] = numbers.astype(dtype)
+
+    return pd.DataFrame(typed)
+
+
+def matches_schema(df):
+    """
+    Whether a DataFrame already follows SCHEMA exactly, e.g. one built by PokemonTable
+    """
+    if not isinstance(df, pd.DataFrame) or list(df.columns) != list(SCHEMA):
+        return False
+    return all(str(df[column].dtype) == ('object' if dtype == 'list' else dtype) for column, dtype in SCHEMA.items())
+
+
+def read_dataset(paths):
+    """
+    Reads one or more dataset CSVs (generation outputs or the v0.2 datasets) into a single typed DataFrame
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    frames = [pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths]
+    return to_typed_frame(pd.concat(frames, ignore_index=True))
+
+
+def read_dataset_chunks(path, chunk_size=10000, columns=None):
+    """
+    Reads a dataset CSV as typed frames of up to chunk_size rows, optionally of only the given columns
+    """
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size, usecols=columns):
+        yield to_typed_frame(chunk)
+
+
+def arrow_table(df):
+    import pyarrow as pa  # Only needed when writing columnar output
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def save_typed(data, path, output_format='parquet', partition_by_generation=False):
+    """
+    Writes rows or a DataFrame as typed columnar output
+    - output_format: 'parquet' or 'feather' (Arrow IPC)
+    - partition_by_generation: for Parquet, writes a directory with one partition per generation
+    """
+    df = data if matches_schema(data) else to_typed_frame(data)
+
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        if partition_by_generation:
+            pq.write_to_dataset(arrow_table(df), path, partition_cols=['generation'])
+        else:
+            pq.write_table(arrow_table(df), path)
+    elif output_format == 'feather':
+        import pyarrow.feather as feather
+
+        feather.write_feather(arrow_table(df), path)
+    else:
+        raise ValueError(f"Unknown output format {output_format}")
+
+
+def save_typed_from_csv(path, output, output_format='parquet', chunk_size=10000):
+    """
+    Converts a dataset CSV into the same typed output as save_typed(read_dataset(path)), holding no more than
+    chunk_size rows in memory. A first pass over the categorical columns collects their categories, so that every
+    chunk is written with the same dictionaries
+    """
+    import pyarrow as pa
+
+    header = pd.read_csv(path, dtype=str, nrows=0).columns
+    category_columns = [column for column, dtype in SCHEMA.items() if dtype == 'category' and column in header]
+    categories = {column: set() for column in category_columns}
+    if category_columns:
+        for chunk in read_dataset_chunks(path, chunk_size, category_columns):
+            for column in category_columns:
+                categories[column].update(chunk[column].dropna())
+
+    writer = None
+    try:
+        for chunk in read_dataset_chunks(path, chunk_size):
+            for column in category_columns:
+                chunk[column] = chunk[column].cat.set_categories(sorted(categories[column]))
+            table = arrow_table(chunk)
+
+            if writer is None:
+                # Lists are always lists of strings, even where the first chunk's are all empty or null
+                schema = pa.schema([pa.field(field.name, pa.list_(pa.string())) if field.name in LIST_COLUMNS
+                                    else field for field in table.schema], metadata=table.schema.metadata)
+                if output_format == 'parquet':
+                    import pyarrow.parquet as pq
+
+                    writer = pq.ParquetWriter(output, schema)
+                elif output_format == 'feather':
+                    writer = pa.ipc.new_file(output, schema,
+                                             options=pa.ipc.IpcWriteOptions(compression='lz4'))  # As write_feather
+                else:
+                    raise ValueError(f"Unknown output format {output_format}")
+            writer.write_table(table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:  # No rows, so nothing to take a schema from
+        save_typed(read_dataset(path), output, output_format)
+
+
+def read_typed(path):
+    """
+    Reads Parquet (a file or a partitioned directory) or Feather output back into a typed DataFrame
+    """
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    table = feather.read_table(path) if str(path).endswith('.feather') else pq.read_table(path)
+
+    # A partition column comes back dictionary-encoded, so it is decoded to match the schema again
+    if 'generation' in table.column_names and pa.types.is_dictionary(table.schema.field('generation').type):
+        position = table.column_names.index('generation')
+        table = table.set_column(position, 'generation', table['generation'].cast(pa.int8()))
+    df = table.to_pandas()
+
+    # List columns come back as arrays
+    for column in LIST_COLUMNS:
+        if column in df:
+            df[column] = df[column].map(lambda v: list(v) if v is not None else pd.NA).astype(object)
+
+    return df[[column for column in SCHEMA if column in df]]
@@ -0,0 +1,331 @@
+"""
+Binary snapshots of a generated dataset, memory-mapped on load so that analysis scripts don't re-parse any CSV text
+
+A snapshot is a directory holding a manifest.json and one set of .npy files per column of dataset_schema.SCHEMA:
+- Numeric and boolean columns: <column>.values.npy, plus <column>.mask.npy if the column has any nulls
+- String and categorical columns: <column>.codes.npy, dictionary-encoded against a sorted dictionary in the manifest,
+  with -1 for null
+- List columns (types, abilities, varieties, egg_groups): <column>.offsets.npy and <column>.values.npy, row i's items
+  being values[offsets[i]:offsets[i + 1]] (dictionary-encoded the same way), plus <column>.mask.npy for null lists
+Opening a snapshot only reads the manifest. Each column's arrays are memory-mapped read-only the first time they are
+used, so opening costs the same however many rows there are, and concurrent processes share the same page cache
+
+process_generation writes one next to its output (pokemon_data_gen<N>.snapshot). A streaming run's output is
+snapshotted straight from the CSV, a chunk at a time (see write_snapshot_from_csv), so it never has to hold every row
+in memory. To snapshot several generations
+together: python dataset_snapshot.py pokemon_data_gen*.csv --output pokemon_data.snapshot
+Then, in an analysis script:
+    df = Snapshot('pokemon_data.snapshot').frame()  # Follows SCHEMA, so matches_schema(df) is True
+    speeds = Snapshot('pokemon_data.snapshot').arrays('speed')['values']  # Zero-copy
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import SCHEMA, matches_schema, read_dataset, read_dataset_chunks, to_typed_frame
+
+SNAPSHOT_FORMAT = 1
+
+# Schema dtype -> numpy dtype of the values file
+NUMERIC_DTYPES = {'Int8': np.int8, 'UInt8': np.uint8, 'Int16': np.int16, 'Float32': np.float32, 'boolean': np.bool_}
+
+
+def snapshot_path(output_file):
+    return os.path.splitext(output_file)[0] + '.snapshot'
+
+
+def dictionary_encode(values):
+    """
+    Returns (codes, dictionary) for a sequence of strings, with -1 as the code for null
+    """
+    categorical = pd.Categorical(values)
+    dtype = np.int16 if len(categorical.categories) < 2 ** 15 else np.int32
+    return categorical.codes.astype(dtype), [str(category) for category in categorical.categories]
+
+
+def encode_column(series, dtype):
+    """
+    Returns (arrays to save, manifest entry) for one typed column
+    """
+    if dtype in NUMERIC_DTYPES:
+        mask = series.isna().to_numpy()
+        arrays = {'values': series.to_numpy(dtype=NUMERIC_DTYPES[dtype], na_value=0)}
+        entry = {'kind': 'numeric', 'dtype': dtype}
+    elif dtype == 'list':
+        lists = [value if isinstance(value, list) else [] for value in series]
+        mask = np.array([not isinstance(value, list) for value in series], dtype=bool)
+        offsets = np.concatenate(([0], np.cumsum([len(items) for items in lists]))).astype(np.int64)
+        codes, dictionary = dictionary_encode([str(item) for items in lists for item in items])
+        arrays = {'offsets': offsets, 'values': codes}
+        entry = {'kind': 'list', 'dtype': dtype, 'dictionary': dictionary}
+    else:
+        codes, dictionary = dictionary_encode(series.astype('string'))
+        mask = codes < 0
+        arrays = {'codes': codes}
+        entry = {'kind': 'dictionary', 'dtype': dtype, 'dictionary': dictionary}
+
+    if mask.any() and entry['kind'] != 'dictionary':  # Dictionary codes carry their own nulls
+        arrays['mask'] = mask
+    entry['files'] = sorted(arrays)
+    return arrays, entry
+
+
+def write_snapshot(data, directory):
+    """
+    Writes rows or a DataFrame as a snapshot, in the same row order as save_to_csv. The snapshot is written into a
+    scratch directory and then swapped into place, so readers never see a partial one
+    """
+    df = data if matches_schema(data) else to_typed_frame(data)
+    if 'dex_num' in df:
+        df = df.sort_values('dex_num', kind='stable')  # Keeps varieties in order, as save_to_csv does
+    df = df.reset_index(drop=True)
+
+    directory = os.path.abspath(directory)
+    scratch = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix='.snapshot-')
+    try:
+        manifest = {'format': SNAPSHOT_FORMAT, 'rows': len(df), 'columns': dict()}
+        for column, dtype in SCHEMA.items():
+            if column not in df:
+                continue
+            arrays, manifest['columns'][column] = encode_column(df[column], dtype)
+            for name, array in arrays.items():
+                np.save(os.path.join(scratch, f'{column}.{name}.npy'), np.ascontiguousarray(array))
+
+        with open(os.path.join(scratch, 'manifest.json'), 'w') as file_manager:
+            json.dump(manifest, file_manager)
+        replace_directory(scratch, directory)
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return directory
+
+
+def replace_directory(scratch, directory):
+    # Processes still reading a replaced snapshot keep their mappings, since open files outlive the unlink
+    previous = None
+    if os.path.exists(directory):
+        previous = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix='.snapshot-old-')
+        os.rename(directory, os.path.join(previous, 'snapshot'))
+    os.rename(scratch, directory)
+    if previous is not None:
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def scan_csv(path, chunk_size):
+    """
+    First pass of write_snapshot_from_csv: the row count, whether the rows are in dex order, and for each column
+    whether it has nulls, its dictionary of strings and its number of list items
+    """
+    rows, in_order, previous = 0, True, -1
+    columns = dict()
+    for chunk in read_dataset_chunks(path, chunk_size):
+        if 'dex_num' in chunk:
+            dex_nums = chunk['dex_num'].to_numpy(dtype=np.float64, na_value=np.inf)  # Unparsed dex numbers sort last
+            if len(dex_nums):
+                in_order = in_order and previous <= dex_nums[0] and bool(np.all(np.diff(dex_nums) >= 0))
+                previous = dex_nums[-1]
+        rows += len(chunk)
+
+        for column in chunk:
+            dtype = SCHEMA[column]
+            scan = columns.setdefault(column, {'nulls': False, 'dictionary': set(), 'items': 0})
+            if dtype in NUMERIC_DTYPES:
+                scan['nulls'] |= bool(chunk[column].isna().any())
+            elif dtype == 'list':
+                lists = [value for value in chunk[column] if isinstance(value, list)]
+                scan['nulls'] |= len(lists) < len(chunk)
+                scan['items'] += sum(len(items) for items in lists)
+                scan['dictionary'].update(str(item) for items in lists for item in items)
+            else:
+                scan['dictionary'].update(chunk[column].dropna().astype(str))
+    return rows, in_order, columns
+
+
+def write_snapshot_from_csv(path, directory, chunk_size=10000):
+    """
+    Writes a dataset CSV as a snapshot identical to write_snapshot(read_dataset(path)), holding no more than
+    chunk_size rows in memory. A first pass collects each column's dictionary, and a second writes every chunk
+    straight into memory-mapped .npy files. CSVs that aren't in dex order are read whole and sorted instead
+    """
+    rows, in_order, scanned = scan_csv(path, chunk_size)
+    if not rows or not in_order:
+        return write_snapshot(read_dataset(path), directory)
+
+    directory = os.path.abspath(directory)
+    scratch = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix='.snapshot-')
+    try:
+        manifest = {'format': SNAPSHOT_FORMAT, 'rows': rows, 'columns': dict()}
+        outputs = dict()  # Column -> {array name: memory-mapped .npy file}
+        for column, dtype in SCHEMA.items():
+            if column not in scanned:
+                continue
+            scan = scanned[column]
+            dictionary = sorted(scan['dictionary'])
+            codes_dtype = np.int16 if len(dictionary) < 2 ** 15 else np.int32
+            if dtype in NUMERIC_DTYPES:
+                shapes = {'values': (NUMERIC_DTYPES[dtype], rows)}
+                entry = {'kind': 'numeric', 'dtype': dtype}
+            elif dtype == 'list':
+                shapes = {'offsets': (np.int64, rows + 1), 'values': (codes_dtype, scan['items'])}
+                entry = {'kind': 'list', 'dtype': dtype, 'dictionary': dictionary}
+            else:
+                shapes = {'codes': (codes_dtype, rows)}
+                entry = {'kind': 'dictionary', 'dtype': dtype, 'dictionary': dictionary}
+            if scan['nulls']:
+                shapes['mask'] = (np.bool_, rows)
+
+            entry['files'] = sorted(shapes)
+            manifest['columns'][column] = entry
+            outputs[column] = {
+                name: open_npy(os.path.join(scratch, f'{column}.{name}.npy'), array_dtype, length)
+                for name, (array_dtype, length) in shapes.items()
+            }
+
+        start, item_start = 0, dict()
+        for chunk in read_dataset_chunks(path, chunk_size):
+            end = start + len(chunk)
+            for column, arrays in outputs.items():
+                item_start[column] = write_chunk(chunk[column], manifest['columns'][column], arrays, start, end,
+                                                 item_start.get(column, 0))
+            start = end
+
+        for arrays in outputs.values():
+            for array in arrays.values():
+                if isinstance(array, np.memmap):
+                    array.flush()
+        outputs.clear()  # Closes the memory maps
+
+        with open(os.path.join(scratch, 'manifest.json'), 'w') as file_manager:
+            json.dump(manifest, file_manager)
+        replace_directory(scratch, directory)
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    return directory
+
+
+def open_npy(path, dtype, length):
+    # np.memmap can't map an empty file, so empty arrays are saved directly
+    if not length:
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.empty(0, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(length,))
+
+
+def write_chunk(series, entry, arrays, start, end, item_start):
+    """
+    Writes one chunk of a column into its arrays at rows [start, end), returning where the next chunk's list items
+    start
+    """
+    if entry['kind'] == 'numeric':
+        arrays['values'][start:end] = series.to_numpy(dtype=arrays['values'].dtype, na_value=0)
+        if 'mask' in arrays:
+            arrays['mask'][start:end] = series.isna().to_numpy()
+    elif entry['kind'] == 'list':
+        lists = [value if isinstance(value, list) else [] for value in series]
+        if 'mask' in arrays:
+            arrays['mask'][start:end] = [not isinstance(value, list) for value in series]
+        lengths = np.cumsum([len(items) for items in lists], dtype=np.int64)
+        if start == 0:
+            arrays['offsets'][0] = 0
+        arrays['offsets'][start + 1:end + 1] = item_start + lengths
+        item_end = item_start + (int(lengths[-1]) if len(lengths) else 0)
+        items = pd.Categorical([str(item) for items in lists for item in items], categories=entry['dictionary'])
+        arrays['values'][item_start:item_end] = items.codes
+        return item_end
+    else:
+        codes = pd.Categorical(series.astype('string'), categories=entry['dictionary']).codes
+        arrays['codes'][start:end] = codes
+    return item_start
+
+
+class Snapshot:
+    """
+    A read-only view of a snapshot directory, memory-mapping each column's arrays on first use
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as file_manager:
+            self.manifest = json.load(file_manager)
+        if self.manifest['format'] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format {self.manifest['format']} in {directory}")
+        self.mapped = dict()
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    @property
+    def columns(self):
+        return list(self.manifest['columns'])
+
+    def arrays(self, column):
+        """
+        The column's raw arrays (values/mask, codes, or offsets/values/mask) as read-only memory maps
+        """
+        if column not in self.mapped:
+            self.mapped[column] = {
+                name: np.load(os.path.join(self.directory, f'{column}.{name}.npy'), mmap_mode='r')
+                for name in self.manifest['columns'][column]['files']
+            }
+        return self.mapped[column]
+
+    def dictionary(self, column):
+        return self.manifest['columns'][column]['dictionary']
+
+    def mask(self, column):
+        arrays = self.arrays(column)
+        return arrays['mask'] if 'mask' in arrays else np.zeros(len(self), dtype=bool)
+
+    def series(self, column, strings='string'):
+        """
+        One column as a pandas Series with its schema dtype. Numeric and categorical columns wrap the mapped arrays
+        without copying them, while string and list columns have to build Python objects
+        - strings: 'category' returns string columns as categoricals too, which skips building the strings
+        """
+        entry = self.manifest['columns'][column]
+        arrays = self.arrays(column)
+
+        if entry['kind'] == 'numeric':
+            if entry['dtype'] == 'boolean':
+                values = pd.arrays.BooleanArray(arrays['values'], self.mask(column))
+            elif entry['dtype'].startswith('Float'):
+                values = pd.arrays.FloatingArray(arrays['values'], self.mask(column))
+            else:
+                values = pd.arrays.IntegerArray(arrays['values'], self.mask(column))
+        elif entry['kind'] == 'dictionary':
+            values = pd.Categorical.from_codes(arrays['codes'], categories=entry['dictionary'])
+            if entry['dtype'] == 'string' and strings == 'string':
+                values = pd.array(np.asarray(values, dtype=object), dtype='string')
+        else:
+            items = np.asarray(entry['dictionary'], dtype=object)[arrays['values']]
+            offsets = arrays['offsets']
+            mask = self.mask(column)
+            values = np.empty(len(self), dtype=object)
+            values[:] = [pd.NA if mask[row] else items[offsets[row]:offsets[row + 1]].tolist()
+                         for row in range(len(self))]
+
+        return pd.Series(values, name=column)
+
+    def frame(self, columns=None, strings='string'):
+        """
+        The snapshot (or some of its columns) as a DataFrame following dataset_schema.SCHEMA
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({column: self.series(column, strings) for column in columns})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write generated dataset CSVs as one memory-mapped snapshot")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--output', default='pokemon_data.snapshot')
+    args = parser.parse_args()
+
+    written = write_snapshot(read_dataset(args.paths), args.output)
+    print(f"Wrote {len(Snapshot(written))} rows to {written}")
@@ -0,0 +1,377 @@
+"""
+Offline ingest from a local copy of PokeAPI's published data, instead of one HTTP request per resource
+
+Two layouts are supported:
+- CSV dump (the data/v2/csv directory of the PokeAPI repository): the tables are read once into in-memory lookup
+  tables, and PokeAPI-shaped JSON for pokemon, pokemon-species and evolution-chain is assembled from them
+- JSON dump (the api-data repository, laid out as <root>/api/v2/<endpoint>/<id>/index.json): responses are read
+  straight from disk
+
+Both provide get_json(endpoint, resource_id) like pokeapi_client, so rows are still built by PokemonData and are
+identical to those built from the API. To switch a generation run over: process_generation(3, dump_dir='path')
+A dump replaces the API entirely: a resource missing from it, evolution chains included, fails its rows
+
+fixtures/dump holds a slice of dex numbers in both layouts (made by fixture_tree.py), and the rows pokeapi_client
+builds from the same slice served by stub_server.py, so that parity can be checked without the API:
+    python dump_ingest.py
+    python dump_ingest.py --record  (rewrites the slice and its expected rows)
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from functools import lru_cache
+
+import pokeapi_client
+from resource_projection import project
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'dump')
+FIXTURE_RANGES = [(1, 7), (133, 137)]  # Megas and Gigantamax forms, and Eevee's branching chain
+
+
+def read_table(csv_dir, table):
+    with open(os.path.join(csv_dir, f'{table}.csv'), newline='', encoding='utf-8') as file_manager:
+        return list(csv.DictReader(file_manager))
+
+
+def to_int(value):
+    return int(value) if value not in ('', None) else None
+
+
+def to_bool(value):
+    return value == '1'
+
+
+def reference(endpoint, resource_id, name=None):
+    # PokeAPI's NamedAPIResource/APIResource shape: a name (where the resource has one) and a URL
+    result = {'url': f"{pokeapi_client.BASE_URL}/{endpoint}/{resource_id}/"}
+    if name is not None:
+        result['name'] = name
+    return result
+
+
+class CsvDump:
+    """
+    Lookup tables built from the PokeAPI CSV dump, used to assemble pokemon, pokemon-species and evolution-chain
+    responses with the same fields that PokemonData reads
+    """
+
+    def __init__(self, csv_dir):
+        self.csv_dir = csv_dir
+
+        # Small identifier tables: id -> name
+        self.names = {
+            table: {to_int(row['id']): row['identifier'] for row in read_table(csv_dir, table)}
+            for table in ('stats', 'types', 'abilities', 'egg_groups', 'generations', 'growth_rates',
+                          'pokemon_colors', 'pokemon_shapes')
+        }
+
+        self.pokemon = {to_int(row['id']): row for row in read_table(csv_dir, 'pokemon')}
+        self.species = {to_int(row['id']): row for row in read_table(csv_dir, 'pokemon_species')}
+        self.pokemon_ids = {row['identifier']: pokemon_id for pokemon_id, row in self.pokemon.items()}
+        self.species_ids = {row['identifier']: species_id for species_id, row in self.species.items()}
+
+        # One-to-many tables, grouped by their owning Pokémon or species
+        self.stats = self.group(read_table(csv_dir, 'pokemon_stats'), 'pokemon_id', 'stat_id')
+        self.types = self.group(read_table(csv_dir, 'pokemon_types'), 'pokemon_id', 'slot')
+        self.abilities = self.group(read_table(csv_dir, 'pokemon_abilities'), 'pokemon_id', 'slot')
+        self.egg_groups = self.group(read_table(csv_dir, 'pokemon_egg_groups'), 'species_id')
+        self.varieties = self.group(self.pokemon.values(), 'species_id', 'id')
+        self.chain_members = self.group(self.species.values(), 'evolution_chain_id', 'order')
+
+    @staticmethod
+    def group(rows, key, sort_key=None):
+        groups = dict()
+        for row in rows:
+            groups.setdefault(to_int(row[key]), []).append(row)
+        if sort_key:
+            for members in groups.values():
+                members.sort(key=lambda row: to_int(row[sort_key]))
+        return groups
+
+    def named(self, table, endpoint, resource_id):
+        resource_id = to_int(resource_id)
+        if resource_id is None:
+            return None
+        return reference(endpoint, resource_id, self.names[table][resource_id])
+
+    def pokemon_json(self, pokemon_id):
+        row = self.pokemon[pokemon_id]
+        species_id = to_int(row['species_id'])
+
+        return {
+            'id': pokemon_id,
+            'name': row['identifier'],
+            'height': to_int(row['height']),
+            'weight': to_int(row['weight']),
+            'is_default': to_bool(row['is_default']),
+            'species': reference('pokemon-species', species_id, self.species[species_id]['identifier']),
+            'types': [
+                {'slot': to_int(t['slot']), 'type': self.named('types', 'type', t['type_id'])}
+                for t in self.types.get(pokemon_id, [])
+            ],
+            'abilities': [
+                {'slot': to_int(a['slot']), 'is_hidden': to_bool(a['is_hidden']),
+                 'ability': self.named('abilities', 'ability', a['ability_id'])}
+                for a in self.abilities.get(pokemon_id, [])
+            ],
+            'stats': [
+                {'base_stat': to_int(s['base_stat']), 'effort': to_int(s['effort']),
+                 'stat': self.named('stats', 'stat', s['stat_id'])}
+                for s in self.stats.get(pokemon_id, [])
+            ]
+        }
+
+    def species_json(self, species_id):
+        row = self.species[species_id]
+        evolves_from_id = to_int(row['evolves_from_species_id'])
+
+        return {
+            'id': species_id,
+            'name': row['identifier'],
+            'order': to_int(row['order']),
+            'generation': self.named('generations', 'generation', row['generation_id']),
+            'gender_rate': to_int(row['gender_rate']),
+            'has_gender_differences': to_bool(row['has_gender_differences']),
+            'capture_rate': to_int(row['capture_rate']),
+            'growth_rate': self.named('growth_rates', 'growth-rate', row['growth_rate_id']),
+            'base_happiness': to_int(row['base_happiness']),
+            'hatch_counter': to_int(row['hatch_counter']),
+            'egg_groups': [
+                self.named('egg_groups', 'egg-group', e['egg_group_id']) for e in self.egg_groups.get(species_id, [])
+            ],
+            'evolves_from_species': (
+                reference('pokemon-species', evolves_from_id, self.species[evolves_from_id]['identifier'])
+                if evolves_from_id else None
+            ),
+            'evolution_chain': reference('evolution-chain', to_int(row['evolution_chain_id'])),
+            'is_legendary': to_bool(row['is_legendary']),
+            'is_mythical': to_bool(row['is_mythical']),
+            'is_baby': to_bool(row['is_baby']),
+            'color': self.named('pokemon_colors', 'pokemon-color', row['color_id']),
+            'shape': self.named('pokemon_shapes', 'pokemon-shape', row['shape_id']),
+            'varieties': [
+                {'is_default': to_bool(v['is_default']),
+                 'pokemon': reference('pokemon', to_int(v['id']), v['identifier'])}
+                for v in sorted(self.varieties.get(species_id, []), key=lambda v: not to_bool(v['is_default']))
+            ]
+        }
+
+    def evolution_chain_json(self, chain_id):
+        members = self.chain_members[chain_id]
+
+        def link(species_row):
+            species_id = to_int(species_row['id'])
+            return {
+                'species': reference('pokemon-species', species_id, species_row['identifier']),
+                'is_baby': to_bool(species_row['is_baby']),
+                'evolves_to': [link(m) for m in members if to_int(m['evolves_from_species_id']) == species_id]
+            }
+
+        root = next(m for m in members if not to_int(m['evolves_from_species_id']))
+        return {'id': chain_id, 'chain': link(root)}
+
+    def get_json(self, endpoint, resource_id):
+        """
+        Same signature as pokeapi_client.get_json, raising KeyError for resources that aren't in the dump
+        """
+        if endpoint == 'pokemon':
+            return self.pokemon_json(self.pokemon_ids.get(resource_id, resource_id))
+        if endpoint == 'pokemon-species':
+            return self.species_json(self.species_ids.get(resource_id, resource_id))
+        if endpoint == 'evolution-chain':
+            return self.evolution_chain_json(resource_id)
+        raise KeyError(f"{endpoint} is not available from the CSV dump")
+
+
+class JsonDump:
+    """
+    Reads responses from a local copy of PokeAPI's api-data repository
+    """
+
+    def __init__(self, root):
+        self.api_root = os.path.join(root, 'api', 'v2')
+        self.name_ids = dict()  # Lazily built per endpoint, since the static files are only stored by id
+
+    def path(self, endpoint, resource_id):
+        return os.path.join(self.api_root, endpoint, str(resource_id), 'index.json')
+
+    def resolve_name(self, endpoint, name):
+        if endpoint not in self.name_ids:
+            names = dict()
+            for resource_id in os.listdir(os.path.join(self.api_root, endpoint)):
+                if resource_id.isdigit():
+                    with open(self.path(endpoint, resource_id), encoding='utf-8') as file_manager:
+                        names[json.load(file_manager).get('name')] = int(resource_id)
+            self.name_ids[endpoint] = names
+        return self.name_ids[endpoint][name]
+
+    def get_json(self, endpoint, resource_id):
+        if isinstance(resource_id, str) and not resource_id.isdigit():
+            resource_id = self.resolve_name(endpoint, resource_id)
+        try:
+            with open(self.path(endpoint, resource_id), encoding='utf-8') as file_manager:
+                return project(endpoint, json.load(file_manager))
+        except FileNotFoundError:
+            raise KeyError(f"{endpoint}/{resource_id} is not in the JSON dump")
+
+
+@lru_cache(maxsize=None)
+def load_dump(dump_dir):
+    """
+    Loads a dump once per process, so that generations processed in parallel share the same lookup tables
+    The layout is detected from the directory contents
+    """
+    if os.path.isdir(os.path.join(dump_dir, 'api', 'v2')):
+        return JsonDump(dump_dir)
+    return CsvDump(dump_dir)
+
+
+def dump_evolution_index(dump_dir):
+    """
+    An EvolutionChainIndex that reads chains from the dump alone, so that a chain missing from the dump fails the rows
+    that need it instead of being fetched from the API
+    """
+    from evolution_index import EvolutionChainIndex
+    from pokemondata import PokemonData
+
+    return EvolutionChainIndex(PokemonData.pseudo_base_forms, fetch=load_dump(dump_dir).get_json)
+
+
+def check_parity(dump_dir, start, end, error_log='pokemon_errors_parity.txt'):
+    """
+    Builds rows for range(start, end) both from the dump and through pokeapi_client (its cache or the API), and
+    returns a list of (name, column, client value, dump value) for every value that differs
+    """
+    from crawl_planner import process_pokemon_with_planner
+    from evolution_index import EvolutionChainIndex
+    from pokemondata import PokemonData
+
+    # Separate evolution indexes, so that neither backend is served chains fetched by the other
+    dump_rows, _, _ = process_pokemon_with_planner(start, end, error_log, fetch=load_dump(dump_dir).get_json,
+                                                   evolution_index=dump_evolution_index(dump_dir))
+    client_rows, _, _ = process_pokemon_with_planner(start, end, error_log,
+                                                     evolution_index=EvolutionChainIndex(PokemonData.pseudo_base_forms))
+
+    dump_by_name = {row['name']: row for row in dump_rows}
+    differences = []
+    for row in client_rows:
+        other = dump_by_name.get(row['name'], {})
+        for column, value in row.items():
+            if str(value) != str(other.get(column)):
+                differences.append((row['name'], column, value, other.get(column)))
+
+    return differences
+
+
+def build_fixture_rows(fetch, evolution_index, error_log=os.devnull):
+    """
+    Builds the rows for every range in FIXTURE_RANGES, rendered to CSV text as save_to_csv would write them
+    """
+    import pandas as pd
+    from crawl_planner import process_pokemon_with_planner
+
+    rows = []
+    for start, end in FIXTURE_RANGES:
+        rows += process_pokemon_with_planner(start, end, error_log, fetch=fetch, evolution_index=evolution_index)[0]
+    return pd.DataFrame(rows).to_csv(index=False, lineterminator='\n')
+
+
+def record_fixture(fixture_dir=FIXTURE_DIR):
+    """
+    Writes the fixture slice in both layouts, then builds its expected rows through pokeapi_client from a StubServer
+    serving the JSON layout, so that they don't depend on any of the dump code
+    """
+    import tempfile
+
+    import retry_queue
+    from evolution_index import EvolutionChainIndex
+    from fixture_tree import write_csv_dump, write_fixture_tree
+    from pokemondata import PokemonData
+    from stub_server import StubServer
+
+    dex_nums = [dex_num for start, end in FIXTURE_RANGES for dex_num in range(start, end)]
+    write_fixture_tree(os.path.join(fixture_dir, 'json'), dex_nums, padding=False)
+    write_csv_dump(os.path.join(fixture_dir, 'csv'), dex_nums)
+
+    previous_base_url, previous_cache, previous_queue = pokeapi_client.BASE_URL, pokeapi_client.cache, \
+        retry_queue.retry_queue
+    with tempfile.TemporaryDirectory() as work_dir, StubServer(os.path.join(fixture_dir, 'json')) as stub:
+        try:
+            pokeapi_client.BASE_URL = stub.base_url
+            pokeapi_client.set_cache(os.path.join(work_dir, 'cache.sqlite'))
+            retry_queue.set_retry_queue(os.path.join(work_dir, 'retry_queue.sqlite'))
+            expected = build_fixture_rows(pokeapi_client.get_json, EvolutionChainIndex(PokemonData.pseudo_base_forms))
+        finally:
+            pokeapi_client.cache.close()
+            retry_queue.retry_queue.close()
+            pokeapi_client.BASE_URL, pokeapi_client.cache, retry_queue.retry_queue = previous_base_url, \
+                previous_cache, previous_queue
+
+    with open(os.path.join(fixture_dir, 'expected_rows.csv'), 'w', encoding='utf-8') as file_manager:
+        file_manager.write(expected)
+
+
+def check_fixture(fixture_dir=FIXTURE_DIR):
+    """
+    Builds the fixture slice's rows from each layout, returning a list of (layout, name, column, expected value, dump
+    value) for every value that differs from expected_rows.csv, and for any row either side is missing
+    """
+    with open(os.path.join(fixture_dir, 'expected_rows.csv'), newline='', encoding='utf-8') as file_manager:
+        expected = {row['name']: row for row in csv.DictReader(file_manager)}
+
+    differences = []
+    for layout in ('json', 'csv'):
+        dump_dir = os.path.join(fixture_dir, layout)
+        rendered = build_fixture_rows(load_dump(dump_dir).get_json, dump_evolution_index(dump_dir))
+        built = {row['name']: row for row in csv.DictReader(io.StringIO(rendered))}
+
+        for name in sorted(set(expected) | set(built)):
+            expected_row, built_row = expected.get(name, {}), built.get(name, {})
+            for column in expected_row or built_row:
+                if expected_row.get(column) != built_row.get(column):
+                    differences.append((layout, name, column, expected_row.get(column), built_row.get(column)))
+
+    return differences
+
+
+def check_missing_chain(fixture_dir=FIXTURE_DIR):
+    """
+    Builds dex numbers 1-3 from a copy of the JSON slice without their evolution chain, returning the dex numbers
+    reported incomplete if none of their rows were built and no request was made, and raising AssertionError otherwise
+    """
+    import shutil
+    import tempfile
+
+    from crawl_planner import process_pokemon_with_planner
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dump_dir = os.path.join(work_dir, 'json')
+        shutil.copytree(os.path.join(fixture_dir, 'json'), dump_dir)
+        shutil.rmtree(os.path.join(dump_dir, 'api', 'v2', 'evolution-chain', '1'))
+
+        stats_before = pokeapi_client.get_request_stats()
+        rows, _, report = process_pokemon_with_planner(1, 4, os.devnull, fetch=load_dump(dump_dir).get_json,
+                                                       evolution_index=dump_evolution_index(dump_dir))
+        stats_after = pokeapi_client.get_request_stats()
+
+    assert not rows, [row['name'] for row in rows]
+    assert report['incomplete'] == [1, 2, 3], report['incomplete']
+    assert stats_after == stats_before, (stats_before, stats_after)
+    return report['incomplete']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check dump parity against the committed fixture slice")
+    parser.add_argument('--record', action='store_true', help="Rewrite the fixture slice and its expected rows")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture()
+    differences = check_fixture()
+    for difference in differences:
+        print(difference)
+    print(f"{len(differences)} differences from the expected rows")
+    print(f"Missing chain fails dex numbers {check_missing_chain()} without a request")
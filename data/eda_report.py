@@ -0,0 +1,207 @@
+"""
+Stats by type, generation and evolutionary stage, summarised for every group in one vectorised pass
+
+The types column is exploded once into (row, type) pairs. Then for each stat, group means come from a bincount, group
+histograms from a bincount over (group, bin) codes, and group quantiles from a single lexsort on (group, value), so
+no per-group DataFrame is ever filtered or copied. Plots are then drawn from those summaries alone
+
+Usage:
+    python eda_report.py pokemon_data_gen*.csv --output eda_report
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import STAT_COLUMNS, matches_schema, read_dataset, to_typed_frame
+from type_effectiveness import TYPES
+
+STATS = ['bst'] + STAT_COLUMNS
+GROUPINGS = ['type', 'generation', 'evolutionary_stage']
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def group_codes(df, grouping):
+    """
+    Returns (row positions, group codes, group labels) for a grouping, exploding the types column for 'type' so that
+    dual-type Pokémon count towards both of their types
+    """
+    if grouping == 'type':
+        type_lists = [types if isinstance(types, list) else [] for types in df['types']]
+        rows = np.repeat(np.arange(len(df)), [len(types) for types in type_lists])
+        values = pd.Categorical([t for types in type_lists for t in types], categories=TYPES)
+        codes, labels = values.codes, list(TYPES)
+    else:
+        values = pd.Categorical(df[grouping].to_numpy(dtype=object, na_value=None))
+        rows, codes, labels = np.arange(len(df)), values.codes, list(values.categories)
+
+    known = codes >= 0
+    return rows[known], codes[known].astype(np.int64), labels
+
+
+def group_quantiles(codes, values, group_count, quantiles):
+    """
+    Linearly interpolated quantiles of values within every group, as a (groups, quantiles) array
+    """
+    if not len(values):
+        return np.full((group_count, len(quantiles)), np.nan)
+
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    counts = np.bincount(codes, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    positions = (counts[:, None] - 1) * np.asarray(quantiles)[None, :]
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    fraction = positions - lower
+
+    empty = counts == 0
+    lower_values = sorted_values[np.where(empty[:, None], 0, starts[:, None] + lower)]
+    upper_values = sorted_values[np.where(empty[:, None], 0, starts[:, None] + upper)]
+    result = lower_values + (upper_values - lower_values) * fraction
+    result[empty] = np.nan
+    return result
+
+
+class GroupSummary:
+    """
+    Counts, means, quantiles and histograms of every stat for every group of one grouping
+    """
+
+    def __init__(self, grouping, labels, counts, means, quantiles, histograms, bin_edges):
+        self.grouping = grouping
+        self.labels = labels
+        self.counts = counts  # (groups,)
+        self.means = means  # (groups, stats)
+        self.quantiles = quantiles  # (groups, stats, quantiles)
+        self.histograms = histograms  # (groups, stats, bins)
+        self.bin_edges = bin_edges  # stat -> edges
+
+    def to_frame(self):
+        """
+        One row per group, with the count and each stat's mean and quantiles
+        """
+        columns = {'count': self.counts}
+        for s, stat in enumerate(STATS):
+            columns[f'{stat}_mean'] = self.means[:, s]
+            for q, quantile in enumerate(QUANTILES):
+                columns[f'{stat}_q{int(quantile * 100):02d}'] = self.quantiles[:, s, q]
+        return pd.DataFrame(columns, index=pd.Index(self.labels, name=self.grouping))
+
+
+def stat_matrix(df):
+    stats = np.column_stack([df[stat].to_numpy(dtype=float, na_value=np.nan) for stat in STAT_COLUMNS])
+    if 'bst' in df:
+        bst = df['bst'].to_numpy(dtype=float, na_value=np.nan)
+    else:
+        bst = stats.sum(axis=1)  # The v0.2 CSVs predate the bst column
+    return np.column_stack([bst, stats])
+
+
+def summarise(data, groupings=GROUPINGS, bins=30):
+    """
+    Summarises every stat for every group of each grouping, returning {grouping: GroupSummary}
+    """
+    df = data if matches_schema(data) else to_typed_frame(data)
+    df = df.reset_index(drop=True)
+    stats = stat_matrix(df)
+
+    # The same bin edges for every group, so that their histograms can be compared directly
+    bin_edges = dict()
+    for s, stat in enumerate(STATS):
+        known = stats[:, s][~np.isnan(stats[:, s])]
+        bin_edges[stat] = np.histogram_bin_edges(known if len(known) else [0, 1], bins=bins)
+
+    summaries = dict()
+    for grouping in groupings:
+        rows, codes, labels = group_codes(df, grouping)
+        group_count = len(labels)
+        means = np.full((group_count, len(STATS)), np.nan)
+        quantiles = np.full((group_count, len(STATS), len(QUANTILES)), np.nan)
+        histograms = np.zeros((group_count, len(STATS), bins), dtype=np.int64)
+
+        for s, stat in enumerate(STATS):
+            values = stats[rows, s]
+            known = ~np.isnan(values)
+            stat_codes, values = codes[known], values[known]
+
+            counts = np.bincount(stat_codes, minlength=group_count)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means[:, s] = np.bincount(stat_codes, weights=values, minlength=group_count) / counts
+            quantiles[:, s] = group_quantiles(stat_codes, values, group_count, QUANTILES)
+
+            bin_numbers = np.clip(np.searchsorted(bin_edges[stat], values, side='right') - 1, 0, bins - 1)
+            histograms[:, s] = np.bincount(stat_codes * bins + bin_numbers,
+                                           minlength=group_count * bins).reshape(group_count, bins)
+
+        summaries[grouping] = GroupSummary(grouping, labels, np.bincount(codes, minlength=group_count), means,
+                                           quantiles, histograms, bin_edges)
+    return summaries
+
+
+def plot_summary(summary, output_dir):
+    """
+    Draws a box plot of every stat by group, and small-multiple BST histograms, from a GroupSummary
+    """
+    from matplotlib import pyplot as plt  # Only needed for rendering
+
+    present = [g for g in range(len(summary.labels)) if summary.counts[g]]
+
+    figure, axes = plt.subplots(len(STATS), 1, figsize=(max(8, len(present) * 0.6), 3 * len(STATS)))
+    for s, stat in enumerate(STATS):
+        # Whiskers at the 5th/95th percentiles, from the precomputed quantiles rather than the raw values
+        boxes = [{
+            'label': str(summary.labels[g]), 'whislo': summary.quantiles[g, s, 0], 'q1': summary.quantiles[g, s, 1],
+            'med': summary.quantiles[g, s, 2], 'q3': summary.quantiles[g, s, 3], 'whishi': summary.quantiles[g, s, 4],
+            'mean': summary.means[g, s], 'fliers': []
+        } for g in present]
+        axes[s].bxp(boxes, showmeans=True)
+        axes[s].set_ylabel(stat)
+    axes[0].set_title(f'Stats by {summary.grouping.replace("_", " ")}')
+    figure.tight_layout()
+    figure.savefig(os.path.join(output_dir, f'stats_by_{summary.grouping}.png'))
+    plt.close(figure)
+
+    columns = 6
+    grid_rows = -(-len(present) // columns)
+    figure, axes = plt.subplots(grid_rows, columns, figsize=(3 * columns, 2.5 * grid_rows), sharex=True, squeeze=False)
+    edges = summary.bin_edges['bst']
+    widths = np.diff(edges)
+    for position, g in enumerate(present):
+        ax = axes[position // columns, position % columns]
+        histogram = summary.histograms[g, 0]
+        ax.stairs(histogram / max(histogram.sum(), 1) / widths, edges, fill=True)
+        ax.set_title(str(summary.labels[g]))
+    for position in range(len(present), grid_rows * columns):
+        axes[position // columns, position % columns].axis('off')
+    figure.suptitle(f'BST proportions by {summary.grouping.replace("_", " ")}')
+    figure.tight_layout()
+    figure.savefig(os.path.join(output_dir, f'bst_by_{summary.grouping}.png'))
+    plt.close(figure)
+
+
+def write_report(data, output_dir='eda_report', groupings=GROUPINGS, bins=30, plots=True):
+    """
+    Regenerates the stats by type/generation/evolutionary stage report: a summary CSV and plots per grouping
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summaries = summarise(data, groupings, bins)
+    for grouping, summary in summaries.items():
+        summary.to_frame().to_csv(os.path.join(output_dir, f'stats_by_{grouping}.csv'))
+        if plots:
+            plot_summary(summary, output_dir)
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stats by type, generation and evolutionary stage")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--output', default='eda_report')
+    parser.add_argument('--bins', type=int, default=30)
+    parser.add_argument('--no-plots', action='store_true')
+    args = parser.parse_args()
+
+    write_report(read_dataset(args.paths), args.output, bins=args.bins, plots=not args.no_plots)
@@ -0,0 +1,94 @@
+from threading import Lock
+
+import pokeapi_client
+
+
+class EvolutionChainIndex:
+    """
+    Walks each evolution chain once and records, for every species in it:
+    - stage: -1 for single-stage Pokémon, 0 for unevolved, 1 for first evolutions and 2 for second evolutions
+    - base_form: the name of the unevolved species at the root of the chain
+    - is_pseudo: whether the chain belongs to a pseudo-legendary Pokémon
+    Every member of the chain is then served from that record, rather than each species and variety fetching the
+    chain again. Safe to share between the worker threads in process_pokemon_in_batches
+    - store: optionally, anything with get(endpoint, id) and set(endpoint, id, data) (e.g. the ResponseCache) to keep
+      the walked records in, so that separate processes can share them too
+    - fetch: optionally, a get_json(endpoint, id) to read chains through instead of pokeapi_client, e.g. a local dump's
+      (see dump_ingest.dump_evolution_index), so that a chain it doesn't have fails rather than going to the API
+    """
+
+    STORE_ENDPOINT = 'evolution-index'
+
+    def __init__(self, pseudo_base_forms=(), store=None, fetch=None):
+        self.pseudo_base_forms = set(pseudo_base_forms)
+        self.store = store
+        self.fetch = fetch
+        self.chains = dict()  # Chain id -> {species name: record}
+        self.lock = Lock()
+        self.chain_locks = dict()
+
+    def get_chain_lock(self, chain_id):
+        with self.lock:
+            return self.chain_locks.setdefault(chain_id, Lock())
+
+    def build_chain(self, evolution_chain):
+        chain = evolution_chain.chain
+        base_form = chain.species.name
+        is_pseudo = base_form in self.pseudo_base_forms
+
+        records = dict()
+        # Single-stage Pokémon are the only ones whose root has nothing to evolve into
+        root_stage = 0 if chain.evolves_to else -1
+        to_visit = [(chain, root_stage)]
+        while to_visit:
+            link, stage = to_visit.pop()
+            records[link.species.name] = {'stage': stage, 'base_form': base_form, 'is_pseudo': is_pseudo}
+            to_visit.extend((evolution, stage + 1) for evolution in link.evolves_to)
+
+        return records
+
+    def get_chain(self, chain_id):
+        # Per-chain locks mean that two threads wanting the same chain fetch it once, without blocking other chains
+        records = self.chains.get(chain_id)
+        if records is None:
+            with self.get_chain_lock(chain_id):
+                records = self.chains.get(chain_id)
+                if records is None:
+                    records = self.load_chain(chain_id)
+                    self.chains[chain_id] = records
+        return records
+
+    def load_chain(self, chain_id):
+        records = self.store.get(self.STORE_ENDPOINT, chain_id) if self.store is not None else None
+        if records is None:
+            records = self.build_chain(self.fetch_chain(chain_id))
+            if self.store is not None:
+                self.store.set(self.STORE_ENDPOINT, chain_id, records)
+        return records
+
+    def fetch_chain(self, chain_id):
+        if self.fetch is None:
+            return pokeapi_client.evolution_chain(chain_id)
+        return pokeapi_client.Resource(self.fetch('evolution-chain', chain_id))
+
+    def add_chain(self, chain_id, evolution_chain):
+        # For chains that have already been fetched elsewhere, e.g. by the crawl planner
+        with self.get_chain_lock(chain_id):
+            if chain_id not in self.chains:
+                self.chains[chain_id] = self.build_chain(evolution_chain)
+
+    def lookup(self, chain_id, species_name):
+        records = self.get_chain(chain_id)  # A chain that can't be fetched fails the row, not just this field
+        try:
+            return records[species_name]
+        except KeyError:
+            raise AttributeError(f"{species_name} is not part of evolution chain {chain_id}")
+
+    def get_stage(self, chain_id, species_name):
+        return self.lookup(chain_id, species_name)['stage']
+
+    def get_base_form(self, chain_id, species_name):
+        return self.lookup(chain_id, species_name)['base_form']
+
+    def get_is_pseudo(self, chain_id, species_name):
+        return self.lookup(chain_id, species_name)['is_pseudo']
@@ -0,0 +1,246 @@
+"""
+Feature store for the predictive tasks (legendary/pseudo/starter/baby status, type from stats, evolutionary stage from
+stats): the dataset is encoded into a numeric design matrix once, saved as .npy files, and memory-mapped from then on
+
+Encoding, driven by dataset_schema.SCHEMA:
+- Numbers as they are, and booleans as 0/1
+- One-hot columns for categories (growth_rate, color, shape, hidden_ability)
+- Multi-hot columns for the list columns (types, abilities, egg_groups)
+- A null mask for every source column, since "missing"/"missing attribute" values are encoded as 0. Columns with any
+  missing values also get a <column>_missing indicator feature
+Identifying columns (dex_num, name, species, evolves_from, varieties) are left out, since they would only leak labels
+Prediction targets are stored separately as integer labels, with -1 for missing
+
+Each store lives in <root>/<dataset hash>/, so a store is only ever built once per version of the data. Rebuilding
+one for the same data just opens the existing files:
+    store = build_feature_store(['pokemon_data_gen1.csv', 'pokemon_data_gen2.csv'])
+    features, labels = store.design('is_legendary')
+
+Usage: python feature_store.py pokemon_data_gen*.csv --root feature_store
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import LIST_COLUMNS, SCHEMA, matches_schema, read_dataset, to_typed_frame
+from type_coverage import dataset_version
+from type_effectiveness import TYPES
+
+EXCLUDED_COLUMNS = ['dex_num', 'name', 'species', 'evolves_from', 'varieties']
+CATEGORY_COLUMNS = [column for column, dtype in SCHEMA.items()
+                    if dtype in ('category', 'string') and column not in EXCLUDED_COLUMNS]
+MULTI_HOT_COLUMNS = [column for column in LIST_COLUMNS if column not in EXCLUDED_COLUMNS]
+
+# Target -> the column its labels come from
+TARGETS = {
+    'is_legendary': 'is_legendary',
+    'is_mythical': 'is_mythical',
+    'is_pseudo': 'is_pseudo',
+    'is_starter': 'is_starter',
+    'is_baby': 'is_baby',
+    'evolutionary_stage': 'evolutionary_stage',
+    'primary_type': 'types',
+}
+STAGES = [-1, 0, 1, 2]
+
+
+def is_paths(data):
+    return isinstance(data, str) or (isinstance(data, (list, tuple)) and bool(data)
+                                     and all(isinstance(path, str) for path in data))
+
+
+def source_version(data):
+    """
+    The dataset hash a store is versioned by: of the files' bytes for paths, so that a store can be found without
+    parsing any CSV, or of every column for rows and DataFrames
+    """
+    if is_paths(data):
+        digest = hashlib.sha1()
+        for path in ([data] if isinstance(data, str) else data):
+            with open(path, 'rb') as file_manager:
+                digest.update(file_manager.read())
+        return digest.hexdigest()[:16]
+
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    return f"{dataset_version(df, list(df.columns)) & (2 ** 64 - 1):016x}"
+
+
+def encode_column(values, column, dtype):
+    """
+    Encodes one typed column as (feature matrix, feature names, null mask)
+    """
+    if column in MULTI_HOT_COLUMNS:
+        missing = values.isna().to_numpy()
+        lists = [value if isinstance(value, list) else [] for value in values]
+        vocabulary = TYPES if column == 'types' else sorted({item for items in lists for item in items})
+        positions = {item: position for position, item in enumerate(vocabulary)}
+        encoded = np.zeros((len(values), len(vocabulary)), dtype=np.float32)
+        rows = np.repeat(np.arange(len(lists)), [len(items) for items in lists])
+        items = [positions.get(item, -1) for items in lists for item in items]
+        known = np.asarray(items, dtype=np.int64) >= 0
+        encoded[rows[known], np.asarray(items, dtype=np.int64)[known]] = 1
+        names = [f"{column}={item}" for item in vocabulary]
+    elif column in CATEGORY_COLUMNS:
+        categories = pd.Categorical(values.astype(object).where(values.notna(), None))
+        missing = categories.codes < 0
+        encoded = np.zeros((len(values), len(categories.categories)), dtype=np.float32)
+        encoded[np.flatnonzero(~missing), categories.codes[~missing]] = 1
+        names = [f"{column}={category}" for category in categories.categories]
+    else:
+        numbers = values.astype('Float64').to_numpy(dtype=np.float32, na_value=np.nan)
+        missing = np.isnan(numbers)
+        encoded = np.where(missing, 0, numbers)[:, None].astype(np.float32)
+        names = [column]
+
+    if missing.any():
+        encoded = np.column_stack([encoded, missing.astype(np.float32)])
+        names.append(f"{column}_missing")
+    return encoded, names, missing
+
+
+def encode_labels(df, target):
+    column = TARGETS[target]
+    if column not in df:
+        return np.full(len(df), -1, dtype=np.int16), []
+    if target == 'primary_type':
+        codes = [TYPES.index(types[0]) if isinstance(types, list) and types and types[0] in TYPES else -1
+                 for types in df[column]]
+        return np.asarray(codes, dtype=np.int16), list(TYPES)
+    if target == 'evolutionary_stage':
+        stages = df[column].to_numpy(dtype=float, na_value=np.nan)
+        codes = np.full(len(df), -1, dtype=np.int16)
+        for code, stage in enumerate(STAGES):
+            codes[stages == stage] = code
+        return codes, STAGES
+
+    flags = df[column].astype('boolean')
+    return np.where(flags.isna(), -1, flags.fillna(False).astype(int)).astype(np.int16), [False, True]
+
+
+def encode(df):
+    """
+    Encodes a typed frame, returning (features, null mask, metadata)
+    """
+    blocks, names, sources, nulls, source_columns = [], [], [], [], []
+    for column, dtype in SCHEMA.items():
+        if column not in df or column in EXCLUDED_COLUMNS:
+            continue
+        encoded, column_names, missing = encode_column(df[column], column, dtype)
+        blocks.append(encoded)
+        names.extend(column_names)
+        sources.extend([column] * len(column_names))
+        nulls.append(missing)
+        source_columns.append(column)
+
+    features = np.column_stack(blocks) if blocks else np.zeros((len(df), 0), dtype=np.float32)
+    null_mask = np.column_stack(nulls) if nulls else np.zeros((len(df), 0), dtype=bool)
+    metadata = {
+        'rows': len(df),
+        'features': names,
+        'sources': sources,
+        'source_columns': source_columns,
+        'row_names': df['name'].astype(str).tolist() if 'name' in df else [],
+        'targets': dict(),
+    }
+    return features, null_mask, metadata
+
+
+def write_store(df, directory):
+    """
+    Writes a store into a scratch directory first and then moves it into place, so that a half-written store is
+    never opened (e.g. by workers reading it while another run is building it)
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=parent)
+    try:
+        features, null_mask, metadata = encode(df)
+        np.save(os.path.join(scratch, 'features.npy'), features)
+        np.save(os.path.join(scratch, 'nulls.npy'), null_mask)
+        for target in TARGETS:
+            labels, classes = encode_labels(df, target)
+            np.save(os.path.join(scratch, f'labels_{target}.npy'), labels)
+            metadata['targets'][target] = [str(label) for label in classes]
+        with open(os.path.join(scratch, 'metadata.json'), 'w') as file_manager:
+            json.dump(metadata, file_manager)
+    except Exception:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(scratch, directory)
+    except OSError:
+        shutil.rmtree(scratch, ignore_errors=True)
+        if not os.path.isdir(directory):  # Otherwise another run finished the same store first
+            raise
+
+
+class FeatureStore:
+    """
+    A built store, with every array memory-mapped read-only so that any number of processes can share it
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'metadata.json')) as file_manager:
+            self.metadata = json.load(file_manager)
+        self.features = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+        self.nulls = np.load(os.path.join(directory, 'nulls.npy'), mmap_mode='r')
+        self.feature_names = self.metadata['features']
+        self.sources = np.array(self.metadata['sources'])
+
+    def labels(self, target):
+        return np.load(os.path.join(self.directory, f'labels_{target}.npy'), mmap_mode='r')
+
+    def classes(self, target):
+        return self.metadata['targets'][target]
+
+    def columns(self, sources=None, exclude=()):
+        """
+        Positions of the features encoded from the given source columns (all of them by default), less any excluded
+        """
+        selected = np.ones(len(self.sources), dtype=bool) if sources is None else np.isin(self.sources, list(sources))
+        return np.flatnonzero(selected & ~np.isin(self.sources, list(exclude)))
+
+    def design(self, target, sources=None, exclude=None):
+        """
+        Returns (features, labels) for a target, leaving out rows without a label and, by default, every feature
+        encoded from the target's own column
+        """
+        exclude = [TARGETS[target]] if exclude is None else exclude
+        labels = self.labels(target)
+        rows = np.flatnonzero(labels >= 0)
+        return self.features[np.ix_(rows, self.columns(sources, exclude))], np.asarray(labels[rows])
+
+
+def build_feature_store(data, root='feature_store'):
+    """
+    Returns the FeatureStore for a dataset (CSV paths, rows, or a DataFrame), encoding it only if no store exists yet
+    for this version of the data
+    """
+    directory = os.path.join(root, source_version(data))
+    if not os.path.isdir(directory):
+        if is_paths(data):
+            df = read_dataset(data)
+        else:
+            df = data if matches_schema(data) else to_typed_frame(data)
+        write_store(df.reset_index(drop=True), directory)
+    return FeatureStore(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode datasets into a memory-mapped feature store")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--root', default='feature_store')
+    args = parser.parse_args()
+
+    feature_store = build_feature_store(args.paths, args.root)
+    print(f"{feature_store.directory}: {feature_store.features.shape[0]} rows, "
+          f"{feature_store.features.shape[1]} features")
@@ -0,0 +1,309 @@
+"""
+A deterministic stand-in for PokeAPI's api-data dump, so that the StubServer runs (sharded_crawl.py local,
+benchmarks.py) and the dump checks (dump_ingest.py) work from a checkout, without recording anything from the API
+
+A handful of species are written out by hand, with real types, stats and abilities and the varieties and evolution
+chains that exercise the edge cases: Megas and Gigantamax forms, Eevee's branching chain, Wormadam's cloaks, Gastly's
+missing shape and Shedinja. Every other dex number asked for gets filler: a made-up name, with types, stats and
+abilities drawn from a random.Random seeded by its dex number, in a chain of up to three consecutive filler species.
+The same dex numbers always give the same tree, byte for byte
+
+Responses carry the keys the pipeline reads (see resource_projection.py), padded with moves and flavour text unless
+padding is unset, so that projection costs about what it does on real responses
+
+write_csv_dump writes the same data as the tables of PokeAPI's CSV dump instead, for dump_ingest.CsvDump
+
+Usage: python fixture_tree.py <root> [--dex 1 2 3 ...] [--no-padding | --csv]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+
+import pokeapi_client
+from pokemondata import PokemonData
+
+TYPES = ['normal', 'fighting', 'flying', 'poison', 'ground', 'rock', 'bug', 'ghost', 'steel', 'fire', 'water',
+         'grass', 'electric', 'psychic', 'ice', 'dragon', 'dark', 'fairy']
+STATS = ['hp', 'attack', 'defense', 'special-attack', 'special-defense', 'speed']
+ROMAN_NUMERALS = ['i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix']
+FILLER_ABILITIES = ['overgrow', 'blaze', 'torrent', 'levitate', 'intimidate', 'sturdy', 'swift-swim', 'chlorophyll',
+                    'fluffy', 'thick-fat', 'flash-fire', 'water-absorb']
+
+# Dex number: (species name, default Pokémon name, types, stats, [(ability, is hidden)], chain id, evolves from,
+# [(form name, types, stats, abilities)])
+NOTABLE_SPECIES = {
+    1: ('bulbasaur', 'bulbasaur', ['grass', 'poison'], [45, 49, 49, 65, 65, 45],
+        [('overgrow', False), ('chlorophyll', True)], 1, None, []),
+    2: ('ivysaur', 'ivysaur', ['grass', 'poison'], [60, 62, 63, 80, 80, 60],
+        [('overgrow', False), ('chlorophyll', True)], 1, 'bulbasaur', []),
+    3: ('venusaur', 'venusaur', ['grass', 'poison'], [80, 82, 83, 100, 100, 80],
+        [('overgrow', False), ('chlorophyll', True)], 1, 'ivysaur',
+        [('venusaur-mega', ['grass', 'poison'], [80, 100, 123, 122, 120, 80], [('thick-fat', False)]),
+         ('venusaur-gmax', ['grass', 'poison'], [80, 82, 83, 100, 100, 80],
+          [('overgrow', False), ('chlorophyll', True)])]),
+    4: ('charmander', 'charmander', ['fire'], [39, 52, 43, 60, 50, 65],
+        [('blaze', False), ('solar-power', True)], 2, None, []),
+    5: ('charmeleon', 'charmeleon', ['fire'], [58, 64, 58, 80, 65, 80],
+        [('blaze', False), ('solar-power', True)], 2, 'charmander', []),
+    6: ('charizard', 'charizard', ['fire', 'flying'], [78, 84, 78, 109, 85, 100],
+        [('blaze', False), ('solar-power', True)], 2, 'charmeleon',
+        [('charizard-mega-x', ['fire', 'dragon'], [78, 130, 111, 130, 85, 100], [('tough-claws', False)])]),
+    92: ('gastly', 'gastly', ['ghost', 'poison'], [30, 35, 30, 100, 35, 80], [('levitate', False)], 40, None, []),
+    133: ('eevee', 'eevee', ['normal'], [55, 55, 50, 45, 65, 55],
+          [('run-away', False), ('adaptability', False), ('anticipation', True)], 67, None, []),
+    134: ('vaporeon', 'vaporeon', ['water'], [130, 65, 60, 110, 95, 65],
+          [('water-absorb', False), ('hydration', True)], 67, 'eevee', []),
+    135: ('jolteon', 'jolteon', ['electric'], [65, 65, 60, 110, 95, 130],
+          [('volt-absorb', False), ('quick-feet', True)], 67, 'eevee', []),
+    136: ('flareon', 'flareon', ['fire'], [65, 130, 60, 95, 110, 65],
+          [('flash-fire', False), ('guts', True)], 67, 'eevee', []),
+    147: ('dratini', 'dratini', ['dragon'], [41, 64, 45, 50, 50, 50],
+          [('shed-skin', False), ('marvel-scale', True)], 84, None, []),
+    148: ('dragonair', 'dragonair', ['dragon'], [61, 84, 65, 70, 70, 70],
+          [('shed-skin', False), ('marvel-scale', True)], 84, 'dratini', []),
+    149: ('dragonite', 'dragonite', ['dragon', 'flying'], [91, 134, 95, 100, 100, 80],
+          [('inner-focus', False), ('multiscale', True)], 84, 'dragonair', []),
+    151: ('mew', 'mew', ['psychic'], [100, 100, 100, 100, 100, 100], [('synchronize', False)], 90, None, []),
+    292: ('shedinja', 'shedinja', ['bug', 'ghost'], [1, 90, 45, 30, 30, 40], [('wonder-guard', False)], 146, None,
+          []),
+    413: ('wormadam', 'wormadam-plant', ['bug', 'grass'], [60, 59, 85, 79, 105, 36],
+          [('anticipation', False), ('overcoat', True)], 213, None,
+          [('wormadam-sandy', ['bug', 'ground'], [60, 79, 105, 59, 85, 36],
+            [('anticipation', False), ('overcoat', True)])]),
+    700: ('sylveon', 'sylveon', ['fairy'], [95, 65, 65, 110, 130, 60],
+          [('cute-charm', False), ('pixilate', True)], 67, 'eevee', []),
+}
+
+# The dex numbers the notable species are chosen to cover, and the default for a fixture tree
+DEFAULT_DEX = sorted(NOTABLE_SPECIES)
+
+
+def reference(endpoint, resource_id, name=None):
+    result = {'url': f"{pokeapi_client.BASE_URL}/{endpoint}/{resource_id}/"}
+    if name is not None:
+        result['name'] = name
+    return result
+
+
+def generation_of(dex_num):
+    generations = [generation for generation, start in PokemonData.generation_start_dict.items() if start <= dex_num]
+    return max(generations)
+
+
+def filler_species(dex_num, chain_base):
+    """
+    Makes up a species for dex_num, in the chain starting at chain_base and evolving from the dex number before it
+    """
+    rng = random.Random(dex_num)
+    types = rng.sample(TYPES, rng.choice([1, 2]))
+    stats = [rng.randint(20, 150) for _ in STATS]
+    abilities = [(ability, index == 1) for index, ability in enumerate(rng.sample(FILLER_ABILITIES, 2))]
+    evolves_from = None if dex_num == chain_base else f"fillermon-{dex_num - 1}"
+    name = f"fillermon-{dex_num}"
+    return name, name, types, stats, abilities, 2000 + chain_base, evolves_from, []
+
+
+def species_entries(dex_nums):
+    """
+    {dex number: species entry}, in the NOTABLE_SPECIES layout, for every dex number asked for
+    """
+    entries = dict()
+    chain_base = None
+    for dex_num in sorted(set(dex_nums)):
+        if dex_num in NOTABLE_SPECIES:
+            entries[dex_num] = NOTABLE_SPECIES[dex_num]
+            chain_base = None
+            continue
+        # Filler chains are runs of up to three consecutive filler dex numbers
+        if chain_base is None or dex_num - 1 not in entries or dex_num - chain_base >= 3:
+            chain_base = dex_num
+        entries[dex_num] = filler_species(dex_num, chain_base)
+    return entries
+
+
+def pokemon_response(pokemon_id, name, species_id, species_name, types, stats, abilities, padding):
+    response = {
+        'id': pokemon_id, 'name': name, 'species': reference('pokemon-species', species_id, species_name),
+        'types': [{'slot': slot, 'type': reference('type', TYPES.index(type_name) + 1, type_name)}
+                  for slot, type_name in enumerate(types, 1)],
+        'stats': [{'base_stat': value, 'effort': 0, 'stat': reference('stat', index, stat)}
+                  for index, (stat, value) in enumerate(zip(STATS, stats), 1)],
+        'abilities': [{'ability': reference('ability', 1, ability), 'is_hidden': hidden, 'slot': slot}
+                      for slot, (ability, hidden) in enumerate(abilities, 1)],
+        'height': 7 + pokemon_id % 10, 'weight': 69 + pokemon_id,
+    }
+    if padding:  # Keys the projection drops
+        response['moves'] = [{'move': reference('move', move, f"move-{move}"),
+                              'version_group_details': [{'level_learned_at': 1}]} for move in range(1, 30)]
+        response['sprites'] = {'front_default': "x" * 50}
+        response['game_indices'] = []
+        response['held_items'] = []
+    return response
+
+
+def species_response(dex_num, entry, varieties, padding):
+    species_name, _, _, _, _, chain_id, evolves_from = entry[:7]
+    rng = random.Random(-dex_num)
+    response = {
+        'id': dex_num, 'name': species_name, 'order': dex_num,
+        'generation': reference('generation', generation_of(dex_num),
+                                f"generation-{ROMAN_NUMERALS[generation_of(dex_num) - 1]}"),
+        'gender_rate': -1 if dex_num == 151 else rng.choice([0, 1, 4, 8]),
+        'has_gender_differences': dex_num == 3, 'capture_rate': rng.choice([3, 45, 90, 190, 255]),
+        'growth_rate': reference('growth-rate', 4, 'medium-slow'), 'base_happiness': 50, 'hatch_counter': 20,
+        'egg_groups': [reference('egg-group', 1, 'monster'), reference('egg-group', 7, 'plant')],
+        'evolves_from_species': None, 'evolution_chain': reference('evolution-chain', chain_id),
+        'is_legendary': False, 'is_mythical': dex_num == 151, 'is_baby': False,
+        'color': reference('pokemon-color', 5, 'green'),
+        'shape': None if dex_num == 92 else reference('pokemon-shape', 8, 'quadruped'),
+        'varieties': varieties,
+    }
+    if evolves_from is not None:
+        response['evolves_from_species'] = reference('pokemon-species', 0, evolves_from)
+    if padding:
+        response['flavor_text_entries'] = [{'flavor_text': "y" * 200}] * 20
+    return response
+
+
+def write_response(root, endpoint, resource_id, data):
+    directory = os.path.join(root, 'api', 'v2', endpoint, str(resource_id))
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'index.json'), 'w') as file_manager:
+        json.dump(data, file_manager, sort_keys=True)
+
+
+def fixture_responses(dex_nums=DEFAULT_DEX, padding=True):
+    """
+    Yields (endpoint, resource id, response) for every species, Pokémon and evolution chain that dex_nums need
+    Forms get Pokémon ids from 10001 up, in dex order, as they do on PokeAPI
+    """
+    entries = species_entries(dex_nums)
+    ids_by_name = {entry[0]: dex_num for dex_num, entry in entries.items()}
+    form_ids = iter(range(10001, 20000))
+    chains = dict()
+
+    for dex_num, entry in sorted(entries.items()):
+        species_name, pokemon_name, types, stats, abilities, chain_id, evolves_from, forms = entry
+        varieties = [{'is_default': True, 'pokemon': reference('pokemon', dex_num, pokemon_name)}]
+        yield 'pokemon', dex_num, pokemon_response(dex_num, pokemon_name, dex_num, species_name, types, stats,
+                                                   abilities, padding)
+        for form_name, form_types, form_stats, form_abilities in forms:
+            form_id = next(form_ids)
+            varieties.append({'is_default': False, 'pokemon': reference('pokemon', form_id, form_name)})
+            yield 'pokemon', form_id, pokemon_response(form_id, form_name, dex_num, species_name, form_types,
+                                                       form_stats, form_abilities, padding)
+
+        species = species_response(dex_num, entry, varieties, padding)
+        if evolves_from is not None:
+            species['evolves_from_species'] = reference('pokemon-species', ids_by_name[evolves_from], evolves_from)
+        yield 'pokemon-species', dex_num, species
+        chains.setdefault(chain_id, []).append((species_name, dex_num, evolves_from))
+
+    for chain_id, members in sorted(chains.items()):
+        def node(name, dex_num):
+            return {'species': reference('pokemon-species', dex_num, name), 'is_baby': False,
+                    'evolution_details': [],
+                    'evolves_to': [node(member, member_num) for member, member_num, parent in members
+                                   if parent == name]}
+
+        base_name, base_num, _ = next(member for member in members if member[2] is None)
+        yield 'evolution-chain', chain_id, {'id': chain_id, 'baby_trigger_item': None,
+                                            'chain': node(base_name, base_num)}
+
+
+def write_fixture_tree(root, dex_nums=DEFAULT_DEX, padding=True):
+    """
+    Writes fixture_responses(dex_nums) under root, laid out like the api-data dump, returning how many were written
+    """
+    written = 0
+    for endpoint, resource_id, data in fixture_responses(dex_nums, padding):
+        write_response(root, endpoint, resource_id, data)
+        written += 1
+    return written
+
+
+def write_csv_dump(csv_dir, dex_nums=DEFAULT_DEX):
+    """
+    Writes the same species, Pokémon and chains as fixture_responses(dex_nums), as the tables of PokeAPI's CSV dump
+    that dump_ingest.CsvDump reads, returning how many rows were written
+    """
+    def resource_id(resource):
+        return '' if resource is None else pokeapi_client.id_from_url(resource['url'])
+
+    def flag(value):
+        return '1' if value else '0'
+
+    names = {table: dict() for table in ('stats', 'types', 'abilities', 'egg_groups', 'generations', 'growth_rates',
+                                         'pokemon_colors', 'pokemon_shapes')}
+    ability_ids = dict()  # The fixture's ability references all share an id, so abilities are numbered here
+    tables = {table: [] for table in ('pokemon', 'pokemon_species', 'pokemon_stats', 'pokemon_types',
+                                      'pokemon_abilities', 'pokemon_egg_groups')}
+
+    for endpoint, response_id, data in fixture_responses(dex_nums, padding=False):
+        if endpoint == 'pokemon':
+            species_id = resource_id(data['species'])
+            tables['pokemon'].append({'id': response_id, 'identifier': data['name'], 'species_id': species_id,
+                                      'height': data['height'], 'weight': data['weight'],
+                                      'is_default': flag(response_id == species_id)})
+            for stat in data['stats']:
+                names['stats'][resource_id(stat['stat'])] = stat['stat']['name']
+                tables['pokemon_stats'].append({'pokemon_id': response_id, 'stat_id': resource_id(stat['stat']),
+                                                'base_stat': stat['base_stat'], 'effort': stat['effort']})
+            for slot in data['types']:
+                names['types'][resource_id(slot['type'])] = slot['type']['name']
+                tables['pokemon_types'].append({'pokemon_id': response_id, 'type_id': resource_id(slot['type']),
+                                                'slot': slot['slot']})
+            for slot in data['abilities']:
+                ability_id = ability_ids.setdefault(slot['ability']['name'], len(ability_ids) + 1)
+                names['abilities'][ability_id] = slot['ability']['name']
+                tables['pokemon_abilities'].append({'pokemon_id': response_id, 'ability_id': ability_id,
+                                                    'is_hidden': flag(slot['is_hidden']), 'slot': slot['slot']})
+
+        elif endpoint == 'pokemon-species':
+            for table, key in (('generations', 'generation'), ('growth_rates', 'growth_rate'),
+                               ('pokemon_colors', 'color'), ('pokemon_shapes', 'shape')):
+                if data[key] is not None:
+                    names[table][resource_id(data[key])] = data[key]['name']
+            for egg_group in data['egg_groups']:
+                names['egg_groups'][resource_id(egg_group)] = egg_group['name']
+                tables['pokemon_egg_groups'].append({'species_id': response_id, 'egg_group_id': resource_id(egg_group)})
+
+            tables['pokemon_species'].append({
+                'id': response_id, 'identifier': data['name'], 'generation_id': resource_id(data['generation']),
+                'evolves_from_species_id': resource_id(data['evolves_from_species']),
+                'evolution_chain_id': resource_id(data['evolution_chain']), 'color_id': resource_id(data['color']),
+                'shape_id': resource_id(data['shape']), 'gender_rate': data['gender_rate'],
+                'capture_rate': data['capture_rate'], 'base_happiness': data['base_happiness'],
+                'is_baby': flag(data['is_baby']), 'hatch_counter': data['hatch_counter'],
+                'has_gender_differences': flag(data['has_gender_differences']),
+                'growth_rate_id': resource_id(data['growth_rate']), 'is_legendary': flag(data['is_legendary']),
+                'is_mythical': flag(data['is_mythical']), 'order': data['order']
+            })
+
+    tables.update({table: [{'id': name_id, 'identifier': name} for name_id, name in sorted(table_names.items())]
+                   for table, table_names in names.items()})
+
+    os.makedirs(csv_dir, exist_ok=True)
+    for table, rows in tables.items():
+        with open(os.path.join(csv_dir, f'{table}.csv'), 'w', newline='', encoding='utf-8') as file_manager:
+            writer = csv.DictWriter(file_manager, fieldnames=list(rows[0]), lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+    return sum(len(rows) for rows in tables.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic api-data style fixture tree")
+    parser.add_argument('root')
+    parser.add_argument('--dex', type=int, nargs='*', default=DEFAULT_DEX)
+    parser.add_argument('--no-padding', action='store_true', help="Leave out the keys the projection drops")
+    parser.add_argument('--csv', action='store_true', help="Write the CSV dump's tables into root instead")
+    args = parser.parse_args()
+
+    if args.csv:
+        print(f"Wrote {write_csv_dump(args.root, args.dex)} CSV rows into {args.root}")
+    else:
+        print(f"Wrote {write_fixture_tree(args.root, args.dex, not args.no_padding)} responses into {args.root}")
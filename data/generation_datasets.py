@@ -3,7 +3,16 @@ from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 
+import pokeapi_client
+from crawl_planner import process_pokemon_with_planner
+from dataset_schema import save_typed, save_typed_from_csv
+from dataset_snapshot import snapshot_path, write_snapshot, write_snapshot_from_csv
+from dump_ingest import dump_evolution_index, load_dump
+from instrumentation import error_logs, metrics, queued
+from pokemon_table import PokemonTable
 from pokemondata import PokemonData
+from refresh import write_manifest
+from streaming_output import CheckpointedCsvWriter, contiguous_ranges
 
 # Initialise a lock for thread-safe file writing
 log_lock = Lock()
@@ -23,10 +32,12 @@ def setup_logging(generation):
     return start_time, error_log_file, processing_log_file, output_file
 
 
-def process_pokemon_batch(dex_nums, error_file, process_varieties=True):
+def process_pokemon_batch(dex_nums, error_file, process_varieties=True, fields=None, failed=None):
     """
     Processes a batch of Pokémon by dex numbers, including their varieties if process_varieties is set
     This function handles multiple Pokémon in one batch to reduce overhead
+    fields projects each row onto the given columns (see PokemonData.field_dependencies)
+    If a failed list is given, dex numbers that raised part way through are appended to it
     """
     pokemon_data = []
     log_messages = []
@@ -37,7 +48,7 @@ def process_pokemon_batch(dex_nums, error_file, process_varieties=True):
             log_messages.append(start_message)
             print(start_message)
 
-            original_variety = PokemonData(dex_num, error_file)
+            original_variety = PokemonData(dex_num, error_file, fields=fields)
             pokemon_data.append(original_variety.to_dict())
 
             end_message = f"{datetime.now()}: finished {dex_num}"
@@ -51,7 +62,8 @@ def process_pokemon_batch(dex_nums, error_file, process_varieties=True):
                     print(start_message)
 
                     # Passes the original variety's species_data in order to avoid duplicated API calls
-                    additional_variety = PokemonData(variety, error_file, original_variety.species_data)
+                    additional_variety = PokemonData(variety, error_file, original_variety.species_data,
+                                                     fields=fields)
                     pokemon_data.append(additional_variety.to_dict())
 
                     end_message = f"{datetime.now()}: finished {dex_num} {variety}"
@@ -59,6 +71,8 @@ def process_pokemon_batch(dex_nums, error_file, process_varieties=True):
                     print(end_message)
 
         except Exception as e:
+            if failed is not None:
+                failed.append(dex_num)
             error_message = f"Error processing {dex_num}: {str(e)}"
             log_messages.append(error_message)
             print(error_message)
@@ -66,31 +80,54 @@ def process_pokemon_batch(dex_nums, error_file, process_varieties=True):
     return pokemon_data, log_messages
 
 
-def process_pokemon_in_batches(start, end, error_log, process_varieties, batch_size=10):
+def process_pokemon_in_batches(start, end, error_log, process_varieties, batch_size=10, on_batch=None, skip=(),
+                               max_threads=8, fields=None):
     """
-    Manages multithreading to process Pokémon in batches concurrently
+    Manages multithreading to process Pokémon in batches concurrently, with up to max_threads threads
     Each thread will handle a batch of Pokémon to reduce thread management overhead
+    If on_batch is given, it is called with (dex_nums, pokemon_data, logs, failed dex numbers) as each batch
+    completes, instead of the results being collected and returned. Dex numbers in skip are not processed
     """
 
     results = []
     log_buffer = []
 
     # Split Pokémon into batches
-    dex_nums = list(range(start, end))
+    dex_nums = [dex_num for dex_num in range(start, end) if dex_num not in skip]
     batches = [dex_nums[i:i + batch_size] for i in range(0, len(dex_nums), batch_size)]
 
-    with ThreadPoolExecutor(max_workers=8) as executor:  # Limit to 8 threads for Pokémon processing
-        futures = {executor.submit(process_pokemon_batch, batch, error_log, process_varieties): batch for batch in
-                   batches}
+    with ThreadPoolExecutor(max_workers=max_threads) as executor:  # Limit threads for Pokémon processing
+        failures = {tuple(batch): [] for batch in batches}
+        futures = {executor.submit(queued(process_pokemon_batch), batch, error_log, process_varieties, fields,
+                                   failures[tuple(batch)]): batch
+                   for batch in batches}
 
         for future in as_completed(futures):
             pokemon_data, logs = future.result()
-            results.extend(pokemon_data)
-            log_buffer.extend(logs)
+            if on_batch:
+                on_batch(futures[future], pokemon_data, logs, failures[tuple(futures[future])])
+            else:
+                results.extend(pokemon_data)
+                log_buffer.extend(logs)
 
     return results, log_buffer
 
 
+def process_pokemon_with_planner_in_chunks(dex_nums, error_log, process_varieties, chunk_size, on_batch, engine=None,
+                                           fetch=pokeapi_client.get_json, max_workers=8, fields=None,
+                                           evolution_index=None):
+    """
+    Runs the crawl planner over chunks of consecutive dex numbers, calling on_batch with (dex_nums, pokemon_data, logs,
+    the dex numbers whose rows couldn't all be built) as each chunk completes, so that no more than one chunk's rows
+    are held in memory at a time
+    """
+    for start, end in contiguous_ranges(dex_nums, chunk_size):
+        pokemon_data, logs, report = process_pokemon_with_planner(start, end, error_log, process_varieties,
+                                                                  max_workers, engine=engine, fetch=fetch,
+                                                                  evolution_index=evolution_index, fields=fields)
+        on_batch(list(range(start, end)), pokemon_data, logs, report['incomplete'])
+
+
 def write_logs(log_messages, log_file):
     """
     Writes log messages to the log file
@@ -104,55 +141,141 @@ def save_to_csv(pokemon_list, output_file):
     """
     Saves the Pokémon data to a CSV file
     """
-    df = pd.DataFrame(pokemon_list).sort_values('dex_num')
+    df = pd.DataFrame(pokemon_list).sort_values('dex_num', kind='stable')  # Keeps varieties in order
     df.to_csv(output_file, index=False)
 
 
-def process_generation(generation, handle_varieties=True, batch_size=10):
+def save_output(pokemon_list, output_file, output_format='csv'):
     """
-    Processes a given Pokémon generation by running the necessary functions for that generation
-    Includes exception handling to ensure issues don't crash the entire program
+    Saves the Pokémon data as CSV, or as typed Parquet/Feather output with the same base name
     """
+    if output_format == 'csv':
+        save_to_csv(pokemon_list, output_file)
+    else:
+        save_typed(pokemon_list, output_file.replace('.csv', f'.{output_format}'), output_format)
 
-    try:
-        # Get the first and last dex number for the generation
-        first_num = PokemonData.generation_start_dict[generation]
-        final_num = PokemonData.generation_start_dict.get(generation + 1, 1026)  # Default value is 1025 + 1
-
-        # Setup logging for this generation
-        start_time, error_log_file, processing_log_file, output_file = setup_logging(generation)
-
-        # Process Pokémon in batches using multithreading
-        pokemon_list, log_buffer = process_pokemon_in_batches(first_num, final_num, error_log_file, handle_varieties,
-                                                              batch_size)
 
-        finish_time = f"Finished generation {generation} in {datetime.now() - start_time}"
-        print(finish_time)
-        log_buffer.append(finish_time)
+def process_generation(generation, handle_varieties=True, batch_size=10, use_planner=True, engine=None,
+                       dump_dir=None, streaming=False, resume=False, output_format='csv', max_threads=8,
+                       fields=None, snapshot=True):
+    """
+    Processes a given Pokémon generation by running the necessary functions for that generation
+    Includes exception handling to ensure issues don't crash the entire program
+    With use_planner set, every resource the generation needs is planned and fetched exactly once before any rows
+    are built (see crawl_planner.py). Otherwise, Pokémon are fetched and processed in batches
+    An engine (e.g. async_fetch.AsyncFetchEngine) can be given to do the planner's fetching
+    With dump_dir set, everything is read from a local PokeAPI data dump instead (see dump_ingest.py)
+    With streaming set, rows are written to disk batch by batch with a checkpoint, and resume skips the batches that
+    an interrupted run had already finished (see streaming_output.py)
+    output_format can be 'parquet' or 'feather' for typed columnar output instead of CSV (see dataset_schema.py)
+    max_threads is the number of threads fetching (or processing batches) for the generation
+    fields limits the output to the given columns, and only what they depend on is fetched. E.g. a stats-only extract
+    with handle_varieties unset never requests the species or evolution chains
+    With snapshot set, the output is also written as a memory-mapped snapshot (see dataset_snapshot.py). A streaming
+    run's snapshot is built from the merged CSV a chunk at a time, so that memory stays flat
+    CSV output gets a manifest of the resources it was built from, for refresh.py to revalidate against
+    """
 
-        # Write logs and save results to CSV
-        write_logs(log_buffer, processing_log_file)
-        save_to_csv(pokemon_list, output_file)
+    # Metrics scoped to this generation, so that its summary leaves out other generations run in the same process
+    with metrics.scope() as run_metrics:
+        try:
+            # Get the first and last dex number for the generation
+            first_num = PokemonData.generation_start_dict[generation]
+            final_num = PokemonData.generation_start_dict.get(generation + 1, 1026)  # Default value is 1025 + 1
+
+            # Setup logging for this generation
+            start_time, error_log_file, processing_log_file, output_file = setup_logging(generation)
+
+            # A local dump replaces the API entirely, and is always read through the planner
+            fetch = load_dump(dump_dir).get_json if dump_dir else pokeapi_client.get_json
+            evolution_index = dump_evolution_index(dump_dir) if dump_dir else None  # Chains never fall back to the API
+            engine = None if dump_dir else engine
+            use_planner = use_planner or bool(dump_dir)
+
+            if streaming:
+                writer = CheckpointedCsvWriter(output_file, resume)
+
+                def write_batch(dex_nums, pokemon_data, logs, incomplete):
+                    writer.write_batch(dex_nums, pokemon_data, incomplete)
+                    if logs:
+                        write_logs(logs, processing_log_file)
+
+                if use_planner:
+                    remaining = writer.remaining(range(first_num, final_num))
+                    process_pokemon_with_planner_in_chunks(remaining, error_log_file, handle_varieties, batch_size * 8,
+                                                           write_batch, engine, fetch, max_threads, fields,
+                                                           evolution_index)
+                else:
+                    process_pokemon_in_batches(first_num, final_num, error_log_file, handle_varieties, batch_size,
+                                               on_batch=write_batch, skip=writer.completed, max_threads=max_threads,
+                                               fields=fields)
+
+                pokemon_list, log_buffer = None, []
+            elif use_planner:
+                # Typed output is built column by column, without going through a dictionary per row
+                table = PokemonTable() if output_format != 'csv' and fields is None else None
+                pokemon_list, log_buffer, _ = process_pokemon_with_planner(first_num, final_num, error_log_file,
+                                                                           handle_varieties, max_threads, engine=engine,
+                                                                           fetch=fetch, evolution_index=evolution_index,
+                                                                           table=table, fields=fields)
+                if table is not None:
+                    pokemon_list = table.to_frame()
+            else:
+                # Process Pokémon in batches using multithreading
+                pokemon_list, log_buffer = process_pokemon_in_batches(first_num, final_num, error_log_file,
+                                                                      handle_varieties, batch_size,
+                                                                      max_threads=max_threads, fields=fields)
+
+            finish_time = f"Finished generation {generation} in {datetime.now() - start_time}"
+            print(finish_time)
+            log_buffer.append(finish_time)
+
+            # Write logs and save results to CSV, along with a summary of where the run spent its time
+            error_logs.flush(error_log_file)
+            write_logs(log_buffer, processing_log_file)
+            run_metrics.write_summary(f'pokemon_run_gen{generation}.json')
+            if streaming:
+                writer.merge()
+                if output_format != 'csv':  # The merged CSV is converted a chunk at a time, so memory stays flat
+                    save_typed_from_csv(output_file, output_file.replace('.csv', f'.{output_format}'), output_format)
+            else:
+                save_output(pokemon_list, output_file, output_format)
+
+            # A memory-mapped copy for analysis scripts to load without parsing the CSV (see dataset_snapshot.py)
+            if snapshot and pokemon_list is None:
+                write_snapshot_from_csv(output_file, snapshot_path(output_file))
+            elif snapshot:
+                write_snapshot(pokemon_list, snapshot_path(output_file))
+
+            # Hashes and ETags of what the CSV was built from, so that refresh.py only revalidates. A field-limited
+            # extract may not have fetched every species, and can't be refreshed in place anyway
+            if output_format == 'csv' and fields is None:
+                write_manifest(output_file, first_num, final_num, handle_varieties,
+                               fetch if dump_dir else pokeapi_client.get_cached_json)
 
-    except Exception as e:
-        # Log the error specific to this generation
-        error_message = f"Error processing generation {generation}: {str(e)}"
-        print(error_message)
+        except Exception as e:
+            # Log the error specific to this generation
+            error_message = f"Error processing generation {generation}: {str(e)}"
+            print(error_message)
 
-        # Ensure the error is written to the generation-specific error log file
-        with open(f'pokemon_errors_gen{generation}.txt', 'a') as error_file:
-            error_file.write(f"{datetime.now()}: {error_message}\n")
+            # Ensure the error is written to the generation-specific error log file
+            with open(f'pokemon_errors_gen{generation}.txt', 'a') as error_file:
+                error_file.write(f"{datetime.now()}: {error_message}\n")
 
 
-def process_multiple_generations_in_parallel(generations, handle_varieties=True, batch_size=10, max_workers=4):
+def process_multiple_generations_in_parallel(generations, handle_varieties=True, batch_size=10, max_workers=4,
+                                             use_planner=True, engine=None, max_threads=8):
     """
     Processes multiple generations of Pokémon in parallel using threading
     Each generation is processed independently, with exceptions handled locally
     The number of threads for generations is controlled by max_workers
+    If an engine is given, every generation shares it, along with its connection pool and rate limit
+    max_threads is passed on to process_generation, for the threads within each generation
     """
     with ThreadPoolExecutor(max_workers=max_workers) as executor:  # Limit the number of threads for generations
-        futures = {executor.submit(process_generation, generation, handle_varieties, batch_size): generation for
-                   generation in generations}
+        futures = {executor.submit(process_generation, generation, handle_varieties, batch_size, use_planner,
+                                   engine, max_threads=max_threads):
+                   generation for generation in generations}
 
         for future in as_completed(futures):
             generation = futures[future]
@@ -164,6 +287,13 @@ def process_multiple_generations_in_parallel(generations, handle_varieties=True,
 
 
 if __name__ == "__main__":
+    # The same runs can be started without editing this block: python pokemon_cli.py crawl --generations 3
+
+    # Responses are cached on disk (see pokeapi_client.set_cache), so re-running after a crash skips finished lookups
+    # With a warm cache, a rebuild can be run without any network access at all:
+    # pokeapi_client.set_cache(offline_mode=True)
+
+    # To process several generations at once, scheduler.process_generations splits them into per-species tasks
     # generations_to_process = [3, 4]
     # process_multiple_generations_in_parallel(generations_to_process, batch_size=10, max_workers=2)
 
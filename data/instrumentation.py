@@ -0,0 +1,243 @@
+"""
+Run telemetry for dataset creation, to show where a slow generation run actually spends its time
+
+Records, for the whole process:
+- Latency histograms per endpoint, split into cache hits and HTTP fetches (pokeapi_client and the async engine)
+- Time spent in each PokemonData field derivation (safe_get_* and the get_*/id_is_* methods they call)
+- Error counts by field
+- Queue wait against work time per worker thread
+write_summary then dumps all of it as JSON. metrics.scope() also collects what is recorded for one run (a generation,
+say) into a RunMetrics of its own, so that runs in the same process, even at the same time, get separate summaries
+
+Also holds the buffered error log writer, so that PokemonData errors are written in batches under a lock rather than
+opening the error file for every single failure
+"""
+
+import atexit
+import json
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock, current_thread
+
+# Histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf')]
+
+# The run scopes (see RunMetrics.scope) the current context records into. Being a context variable, it follows work
+# onto the async engine's tasks, and queued carries it onto executor threads
+active_scopes = ContextVar('active_scopes', default=())
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, fraction):
+        # The upper bound of the bucket the percentile falls in (or the max, for the last bucket)
+        target = fraction * sum(self.counts)
+        running = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.counts):
+            running += bucket_count
+            if bucket_count and running >= target:
+                return round(min(bound, self.max), 3)
+        return 0.0
+
+    def to_dict(self):
+        count = sum(self.counts)
+        return {
+            'count': count,
+            'mean_ms': round(self.total / count, 3) if count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': round(self.max, 3),
+            'buckets_ms': {str(bound): bucket_count for bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.counts)
+                           if bucket_count},
+        }
+
+
+class RunMetrics:
+    """
+    Thread-safe counters and histograms for a run. One module-level instance (metrics) is shared by everything, and
+    everything recorded through it also goes to whichever scopes are active where it was recorded
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = dict()  # Endpoint -> {'hit': histogram, 'fetch': histogram}
+            self.fields = dict()  # Field -> [calls, seconds]
+            self.errors = dict()  # Field -> count
+            self.workers = dict()  # Thread name -> {'tasks', 'wait_s', 'work_s'}
+
+    @contextmanager
+    def scope(self, run_metrics=None):
+        """
+        Within the block, everything recorded is also collected into run_metrics (a fresh RunMetrics by default),
+        which is yielded. Scopes nest, and tasks submitted through queued inside the block stay in its scope
+        """
+        run_metrics = run_metrics if run_metrics is not None else RunMetrics()
+        token = active_scopes.set(active_scopes.get() + (run_metrics,))
+        try:
+            yield run_metrics
+        finally:
+            active_scopes.reset(token)
+
+    def targets(self):
+        return (self,) + tuple(scope for scope in active_scopes.get() if scope is not self)
+
+    def record_fetch(self, endpoint, seconds, cache_hit):
+        for target in self.targets():
+            with target.lock:
+                histograms = target.endpoints.setdefault(endpoint,
+                                                         {'hit': LatencyHistogram(), 'fetch': LatencyHistogram()})
+                histograms['hit' if cache_hit else 'fetch'].add(seconds)
+
+    def record_field(self, field, seconds):
+        for target in self.targets():
+            with target.lock:
+                totals = target.fields.setdefault(field, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+
+    def record_error(self, field):
+        for target in self.targets():
+            with target.lock:
+                target.errors[field] = target.errors.get(field, 0) + 1
+
+    def record_task(self, wait, work):
+        for target in self.targets():
+            with target.lock:
+                worker = target.workers.setdefault(current_thread().name, {'tasks': 0, 'wait_s': 0.0, 'work_s': 0.0})
+                worker['tasks'] += 1
+                worker['wait_s'] += wait
+                worker['work_s'] += work
+
+    def fetch_latency(self):
+        """
+        HTTP fetch latency across every endpoint, as one histogram
+        """
+        combined = LatencyHistogram()
+        with self.lock:
+            for histograms in self.endpoints.values():
+                fetches = histograms['fetch']
+                combined.counts = [a + b for a, b in zip(combined.counts, fetches.counts)]
+                combined.total += fetches.total
+                combined.max = max(combined.max, fetches.max)
+        return combined.to_dict()
+
+    def summary(self):
+        with self.lock:
+            endpoints = dict()
+            for endpoint, histograms in self.endpoints.items():
+                hits, fetches = histograms['hit'], histograms['fetch']
+                lookups = sum(hits.counts) + sum(fetches.counts)
+                endpoints[endpoint] = {
+                    'cache_hits': sum(hits.counts),
+                    'cache_misses': sum(fetches.counts),
+                    'hit_rate': round(sum(hits.counts) / lookups, 4) if lookups else 0.0,
+                    'cache_latency': hits.to_dict(),
+                    'fetch_latency': fetches.to_dict(),
+                }
+
+            fields = {
+                field: {'calls': calls, 'total_s': round(seconds, 6), 'mean_us': round(seconds / calls * 1e6, 2)}
+                for field, (calls, seconds) in sorted(self.fields.items(), key=lambda item: -item[1][1])
+            }
+            workers = {
+                name: {key: round(value, 6) if isinstance(value, float) else value for key, value in worker.items()}
+                for name, worker in self.workers.items()
+            }
+
+            return {
+                'started': self.started,
+                'elapsed_s': round(time.time() - self.started, 3),
+                'endpoints': endpoints,
+                'fields': fields,
+                'errors_by_field': dict(sorted(self.errors.items(), key=lambda item: -item[1])),
+                'workers': workers,
+            }
+
+    def write_summary(self, path):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as file_manager:
+            json.dump(self.summary(), file_manager, indent=1)
+        os.replace(temporary_path, path)
+
+
+metrics = RunMetrics()
+
+
+@contextmanager
+def timed_field(field):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record_field(field, time.perf_counter() - started)
+
+
+def queued(function):
+    """
+    Wraps a function about to be submitted to an executor, so that its time waiting in the queue and its time running
+    are recorded against whichever worker thread picks it up, in the metrics scopes active where it was submitted
+    """
+    submitted = time.perf_counter()
+    scopes = active_scopes.get()
+
+    def run(*args, **kwargs):
+        token = active_scopes.set(scopes)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.record_task(started - submitted, time.perf_counter() - started)
+            active_scopes.reset(token)
+
+    return run
+
+
+class BufferedLogWriter:
+    """
+    Collects lines per log file and appends them in batches, once flush_every lines are waiting or on flush()
+    """
+
+    def __init__(self, flush_every=100):
+        self.flush_every = flush_every
+        self.lock = Lock()
+        self.buffers = dict()
+
+    def write(self, log_file, line):
+        with self.lock:
+            buffer = self.buffers.setdefault(log_file, [])
+            buffer.append(line)
+            if len(buffer) >= self.flush_every:
+                self.write_buffer(log_file)
+
+    def write_buffer(self, log_file):
+        lines = self.buffers.pop(log_file, [])
+        if lines:
+            with open(log_file, 'a') as file_manager:
+                file_manager.write("".join(f"{line}\n" for line in lines))
+
+    def flush(self, log_file=None):
+        with self.lock:
+            for buffered_file in ([log_file] if log_file else list(self.buffers)):
+                self.write_buffer(buffered_file)
+
+
+error_logs = BufferedLogWriter()
+atexit.register(error_logs.flush)
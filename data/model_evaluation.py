@@ -0,0 +1,190 @@
+"""
+Cross-validation and hyperparameter search for the predictive tasks, spread across a process pool
+
+Every (parameters, fold) pair is its own task. Workers open the feature store's memory-mapped arrays once, when they
+start, and only ever receive a target, a fold number and parameters, so no design matrix is pickled or re-encoded.
+Folds are stratified by label and drawn from a seed, so every worker works out the same folds independently
+
+Models follow the scikit-learn interface (a class taking hyperparameters, with fit(features, labels) and
+predict(features)). RidgeClassifier is built in, so nothing beyond NumPy is needed, and any other class can be named
+by its import path, e.g. sklearn.linear_model.LogisticRegression
+
+Usage:
+    python model_evaluation.py pokemon_data_gen*.csv --target is_legendary --grid alpha=0.1,1,10
+    python model_evaluation.py pokemon_data_gen*.csv --target primary_type --sources hp attack defense sp_attack \\
+        sp_defense speed evolutionary_stage --model sklearn.ensemble.RandomForestClassifier --grid max_depth=4,8
+"""
+
+import argparse
+import importlib
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from feature_store import TARGETS, FeatureStore, build_feature_store
+
+
+class RidgeClassifier:
+    """
+    One-vs-rest least squares on standardised features, solved in closed form, so a fold fits in milliseconds
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+
+    def standardise(self, features):
+        scaled = (features - self.mean) / self.scale
+        return np.column_stack([scaled, np.ones(len(scaled))])
+
+    def fit(self, features, labels):
+        features = np.asarray(features, dtype=np.float64)
+        self.mean = features.mean(axis=0)
+        self.scale = features.std(axis=0)
+        self.scale[self.scale == 0] = 1
+        self.classes = np.unique(labels)
+
+        design = self.standardise(features)
+        targets = np.where(labels[:, None] == self.classes[None, :], 1.0, -1.0)
+        penalty = self.alpha * np.eye(design.shape[1])
+        penalty[-1, -1] = 0  # The intercept isn't penalised
+        self.weights = np.linalg.lstsq(design.T @ design + penalty, design.T @ targets, rcond=None)[0]
+        return self
+
+    def predict(self, features):
+        scores = self.standardise(np.asarray(features, dtype=np.float64)) @ self.weights
+        return self.classes[scores.argmax(axis=1)]
+
+
+MODELS = {'ridge': RidgeClassifier}
+
+
+def load_model(name):
+    if name in MODELS:
+        return MODELS[name]
+    module_name, class_name = name.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def fold_assignments(labels, folds=5, seed=0):
+    """
+    Stratified fold numbers: each label's rows are shuffled and then dealt out across the folds in turn
+    """
+    order = np.lexsort((np.random.default_rng(seed).random(len(labels)), labels))
+    assignments = np.empty(len(labels), dtype=np.int64)
+    assignments[order] = np.arange(len(labels)) % folds
+    return assignments
+
+
+def balanced_accuracy(labels, predictions):
+    # Mean recall over the classes in the test fold, so that rare labels (e.g. legendaries) aren't drowned out
+    return float(np.mean([np.mean(predictions[labels == label] == label) for label in np.unique(labels)]))
+
+
+# Per-process state: the store opened by init_worker, and each design (features, labels, folds) built from it
+worker_store = None
+worker_designs = dict()
+
+
+def init_worker(directory):
+    global worker_store
+    worker_store = FeatureStore(directory)
+    worker_designs.clear()
+
+
+def worker_design(target, sources, exclude, folds, seed):
+    key = (target, sources, exclude, folds, seed)
+    if key not in worker_designs:
+        features, labels = worker_store.design(target, sources, None if exclude is None else list(exclude))
+        worker_designs[key] = features, labels, fold_assignments(labels, folds, seed)
+    return worker_designs[key]
+
+
+def run_fold(model_name, params, target, sources, exclude, fold, folds, seed):
+    features, labels, assignments = worker_design(target, sources, exclude, folds, seed)
+    train, test = assignments != fold, assignments == fold
+    model = load_model(model_name)(**params).fit(features[train], labels[train])
+    predictions = np.asarray(model.predict(features[test]))
+    return {
+        'fold': fold,
+        'accuracy': float(np.mean(predictions == labels[test])),
+        'balanced_accuracy': balanced_accuracy(labels[test], predictions),
+        **params,
+    }
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def cross_validate(store, target, model='ridge', grid=None, folds=5, sources=None, exclude=None, seed=0,
+                   max_workers=None, use_processes=True):
+    """
+    Scores a model on a feature store target for every combination in grid ({parameter: [values]}), with folds-fold
+    stratified cross-validation. Returns (one row per parameter combination with mean and std scores, sorted best
+    first; one row per fold)
+    - sources/exclude: which source columns' features to use, as in FeatureStore.design
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown target {target}, expected one of {list(TARGETS)}")
+    sources = tuple(sources) if sources is not None else None
+    exclude = tuple(exclude) if exclude is not None else None
+    combinations = expand_grid(grid or {})
+
+    if use_processes:
+        executor = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=init_worker,
+                                       initargs=(store.directory,))
+    else:
+        init_worker(store.directory)
+        executor = ThreadPoolExecutor(max_workers=1)  # The worker state is shared, so one thread is enough
+
+    with executor:
+        futures = [executor.submit(run_fold, model, params, target, sources, exclude, fold, folds, seed)
+                   for params in combinations for fold in range(folds)]
+        fold_results = pd.DataFrame([future.result() for future in futures])
+
+    parameters = list(grid or {})
+    scores = ['accuracy', 'balanced_accuracy']
+    if parameters:
+        summary = fold_results.groupby(parameters, sort=False)[scores].agg(['mean', 'std'])
+    else:
+        summary = fold_results[scores].agg(['mean', 'std']).unstack().to_frame().T
+    summary.columns = [f"{score}_{statistic}" for score, statistic in summary.columns]
+    return summary.sort_values('balanced_accuracy_mean', ascending=False), fold_results
+
+
+def parse_grid_value(value):
+    for parse in (int, float):
+        try:
+            return parse(value)
+        except ValueError:
+            pass
+    return {'True': True, 'False': False, 'None': None}.get(value, value)
+
+
+def parse_grid(specs):
+    # name=value1,value2 pairs, e.g. alpha=0.1,1,10
+    return {name: [parse_grid_value(value) for value in values.split(',')]
+            for name, values in (spec.split('=', 1) for spec in specs)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-validate models on the feature store across a process pool")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--target', required=True, choices=list(TARGETS))
+    parser.add_argument('--model', default='ridge', help="'ridge', or the import path of a scikit-learn style class")
+    parser.add_argument('--grid', nargs='*', default=[], help="Hyperparameters as name=value1,value2")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--sources', nargs='*', default=None, help="Source columns to use features from")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--root', default='feature_store')
+    args = parser.parse_args()
+
+    results, _ = cross_validate(build_feature_store(args.paths, args.root), args.target, args.model,
+                                parse_grid(args.grid), args.folds, args.sources, seed=args.seed,
+                                max_workers=args.workers)
+    print(results.to_string())
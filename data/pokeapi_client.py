@@ -0,0 +1,226 @@
+"""
+A small PokeAPI client covering the lookups PokemonData needs, in place of pokebase
+
+Resources are returned with the same attribute-style access as pokebase (e.g. pokemon.species.name), but every
+response goes through a ResponseCache that we control: where it lives, how large it can grow, when entries expire,
+and whether HTTP calls are allowed at all (offline replay mode)
+
+Responses are cut down to the keys the pipeline reads (see resource_projection.py) as soon as they arrive, and only
+that projection is cached and wrapped
+"""
+
+import os
+import time
+from threading import Lock, local
+
+from instrumentation import metrics
+from resource_projection import project
+from retry_queue import record_failure, record_success
+from response_cache import ResponseCache, CacheMissError
+
+BASE_URL = "https://pokeapi.co/api/v2"
+REQUEST_TIMEOUT = 30
+
+# Module-level state, set up with set_cache() in the same spirit as pokebase's own cache configuration
+cache = None
+offline = False
+
+# Counts of lookups served from the cache and HTTP requests actually issued, for run reports
+request_stats = {'cache_hits': 0, 'requests': 0}
+stats_lock = Lock()
+
+# ETags of the responses fetched by this process, for the manifests that refresh.py revalidates against
+etags = dict()
+etags_lock = Lock()
+
+# Each thread gets its own requests session, so that connections are reused without being shared across threads
+thread_state = local()
+
+
+def get_default_cache_path():
+    """
+    Gets the default cache location, following the XDG Base Directory specification like pokebase does
+    """
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg_cache_home, "pokemon-data-analysis", "responses.sqlite")
+
+
+def set_cache(path=None, max_entries=None, ttl=None, offline_mode=False, response_cache=None):
+    """
+    Configures the response cache used for every lookup. Should be called before any lookups are made
+    - path: the cache file, defaulting to get_default_cache_path()
+    - max_entries, ttl: size cap (LRU eviction) and expiry in seconds, both passed on to ResponseCache
+    - offline_mode: if set, a cache miss raises CacheMissError rather than making an HTTP call
+    - response_cache: any object with get(endpoint, id) and set(endpoint, id, data) methods, to plug in a
+      different store. Overrides path, max_entries and ttl
+    """
+    global cache, offline
+
+    cache = response_cache or ResponseCache(path or get_default_cache_path(), max_entries=max_entries, ttl=ttl)
+    offline = offline_mode
+
+    return cache
+
+
+def get_cache():
+    if cache is None:
+        set_cache()
+    return cache
+
+
+def count(stat):
+    with stats_lock:
+        request_stats[stat] += 1
+
+
+def reset_request_stats():
+    with stats_lock:
+        for stat in request_stats:
+            request_stats[stat] = 0
+
+
+def get_request_stats():
+    with stats_lock:
+        return dict(request_stats)
+
+
+def record_etag(endpoint, resource_id, etag):
+    if etag:
+        with etags_lock:
+            etags[(endpoint, resource_id)] = etag
+
+
+def get_etag(endpoint, resource_id):
+    with etags_lock:
+        return etags.get((endpoint, resource_id))
+
+
+def get_session():
+    if not hasattr(thread_state, "session"):
+        import requests  # Only imported once a request actually needs to be made
+        thread_state.session = requests.Session()
+    return thread_state.session
+
+
+def call_api(endpoint, resource_id):
+    response = get_session().get(f"{BASE_URL}/{endpoint}/{resource_id}/", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    record_etag(endpoint, resource_id, response.headers.get('ETag'))
+    return response.json()
+
+
+def get_json(endpoint, resource_id):
+    """
+    Returns the projected JSON for a resource, from the cache if possible and otherwise from PokeAPI
+    """
+    response_cache = get_cache()
+
+    started = time.perf_counter()
+    data = response_cache.get(endpoint, resource_id)
+    if data is not None:
+        count('cache_hits')
+        metrics.record_fetch(endpoint, time.perf_counter() - started, cache_hit=True)
+        return project(endpoint, data)  # Caches written before projection still hold full responses
+
+    if offline:
+        raise CacheMissError(f"{endpoint}/{resource_id} is not cached and offline mode is enabled")
+
+    count('requests')
+    try:
+        data = project(endpoint, call_api(endpoint, resource_id))  # The full response is dropped straight away
+    except Exception as e:
+        record_failure(endpoint, resource_id, e)  # Queued to be retried on its own (see repair.py)
+        raise
+    response_cache.set(endpoint, resource_id, data)
+    record_success(endpoint, resource_id)
+    metrics.record_fetch(endpoint, time.perf_counter() - started, cache_hit=False)
+    return data
+
+
+def get_cached_json(endpoint, resource_id):
+    """
+    Returns the projected JSON for a resource if it is cached, or None, without ever making a request
+    """
+    data = get_cache().get(endpoint, resource_id)
+    return None if data is None else project(endpoint, data)
+
+
+def revalidate(endpoint, resource_id, etag=None):
+    """
+    Makes a conditional request for a resource, returning (data, etag)
+    data is None if the server reports the resource as unchanged (304 Not Modified) since etag was issued. Otherwise,
+    the fresh response is projected and stored in the cache
+    """
+    if offline:
+        raise CacheMissError(f"{endpoint}/{resource_id} cannot be revalidated in offline mode")
+
+    headers = {'If-None-Match': etag} if etag else {}
+    count('requests')
+    response = get_session().get(f"{BASE_URL}/{endpoint}/{resource_id}/", headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304:
+        return None, etag
+
+    response.raise_for_status()
+    data = project(endpoint, response.json())
+    get_cache().set(endpoint, resource_id, data)
+    record_etag(endpoint, resource_id, response.headers.get('ETag'))
+    return data, response.headers.get('ETag')
+
+
+def id_from_url(url):
+    return int(url.strip('/').split('/')[-1])
+
+
+class Resource:
+    """
+    Read-only attribute access over a JSON object, mirroring pokebase's APIResource
+    Nested objects are wrapped on access, and missing keys raise AttributeError so that PokemonData's safe_get_*
+    helpers behave exactly as they did with pokebase
+    """
+
+    __slots__ = ('_data',)  # One wrapper is made per nested object accessed, so these are kept as small as possible
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):  # Avoids recursion when copying or unpickling
+            raise AttributeError(attr)
+
+        try:
+            value = self._data[attr]
+        except KeyError:
+            # References to other resources only carry a name and URL, so the id is taken from the URL
+            if attr == 'id' and 'url' in self._data:
+                return id_from_url(self._data['url'])
+            raise AttributeError(f"{self!r} has no attribute {attr}")
+
+        return wrap(value)
+
+    def __str__(self):  # Matches pokebase, so that resources written to CSV appear as their names
+        return str(self._data.get('name', self._data))
+
+    def __repr__(self):
+        return f"<Resource {self._data.get('name', '')}>"
+
+
+def wrap(value):
+    if isinstance(value, dict):
+        return Resource(value)
+    if isinstance(value, list):
+        return [wrap(item) for item in value]
+    return value
+
+
+# Start of lookups used by PokemonData, named to match pokebase
+def pokemon(id_or_name):
+    return Resource(get_json('pokemon', id_or_name))
+
+
+def pokemon_species(id_or_name):
+    return Resource(get_json('pokemon-species', id_or_name))
+
+
+def evolution_chain(chain_id):
+    return Resource(get_json('evolution-chain', chain_id))
+
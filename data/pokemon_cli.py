@@ -0,0 +1,294 @@
+"""
+One command-line entry point for collecting and maintaining the generation datasets, in place of editing the
+__main__ blocks of the collectors
+
+Only the standard library and the light client modules are imported up front. Everything heavier (pandas, NumPy,
+pyarrow, aiohttp and the modules built on them) is imported inside the subcommand that needs it, so that cheap
+commands such as status start in tens of milliseconds. --profile-imports runs the command again under
+python -X importtime and reports which top-level imports its start-up time went on
+
+Usage:
+    python pokemon_cli.py crawl --generations 1 2 --backend async --workers 8 --format parquet
+    python pokemon_cli.py crawl --range 1 151 --output kanto.csv
+    python pokemon_cli.py refresh 1 2
+    python pokemon_cli.py status
+    python pokemon_cli.py export pokemon_data_gen*.csv --format snapshot --output pokemon_data.snapshot
+    python pokemon_cli.py --profile-imports status
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import pokeapi_client
+import retry_queue
+from pokemondata import PokemonData
+
+FINAL_DEX_NUM = 1025
+BACKENDS = ['planner', 'batch', 'async', 'threads', 'processes']
+
+
+def generation_bounds(generation):
+    # First and last dex numbers of a generation
+    first_num = PokemonData.generation_start_dict[generation]
+    return first_num, PokemonData.generation_start_dict.get(generation + 1, FINAL_DEX_NUM + 1) - 1
+
+
+def configure_cache(args):
+    # Relative paths are taken from where the command was run
+    if args.cache or args.offline:
+        pokeapi_client.set_cache(args.cache and os.path.abspath(args.cache), offline_mode=args.offline)
+    if args.queue:
+        retry_queue.set_retry_queue(os.path.abspath(args.queue))
+
+
+def crawl(args):
+    """
+    Collects whole generations (one output each) or a dex range (one output file), with the chosen backend:
+    - planner: every resource planned and fetched once, on a thread pool (see crawl_planner.py)
+    - batch: Pokémon fetched and processed in batches, as the original collector did
+    - async: the planner, fetching through one rate-limited asyncio engine (see async_fetch.py)
+    - threads, processes: per-species tasks across all the generations on one shared queue (see scheduler.py)
+    """
+    configure_cache(args)
+    handle_varieties = not args.no_varieties
+
+    if args.range:
+        return crawl_range(args, *args.range)
+
+    if args.backend in ('threads', 'processes'):
+        if args.dump_dir or args.streaming:
+            sys.exit("--dump-dir and --streaming only work with the planner, batch and async backends")
+        from scheduler import process_generations
+
+        written = process_generations(args.generations, handle_varieties, args.workers, args.backend == 'processes',
+                                      args.format)
+        print(f"Rows written per generation: {written}")
+        return
+
+    from generation_datasets import process_generation
+
+    engine = make_engine(args)
+    try:
+        for generation in args.generations:
+            process_generation(generation, handle_varieties, use_planner=args.backend != 'batch', engine=engine,
+                               dump_dir=args.dump_dir, streaming=args.streaming or args.resume, resume=args.resume,
+                               output_format=args.format, max_threads=args.workers,
+                               snapshot=not args.no_snapshot)
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def make_engine(args):
+    if args.backend != 'async':
+        return None
+    from async_fetch import AsyncFetchEngine  # Only needed for the async backend
+
+    return AsyncFetchEngine(max_in_flight=args.workers).start()
+
+
+def crawl_range(args, first_num, final_num):
+    """
+    Collects dex numbers first_num to final_num (inclusive) into a single output file
+    """
+    if args.backend in ('threads', 'processes'):
+        sys.exit(f"--range doesn't work with the {args.backend} backend, which schedules whole generations")
+    from crawl_planner import process_pokemon_with_planner
+    from dataset_snapshot import snapshot_path, write_snapshot
+    from dump_ingest import dump_evolution_index, load_dump
+    from generation_datasets import process_pokemon_in_batches, save_output, write_logs
+
+    output_file = args.output or f'pokemon_data_{first_num}-{final_num}.csv'
+    base_name = os.path.splitext(output_file)[0]  # --output needn't end in .csv, e.g. kanto.parquet
+    error_log_file = base_name + '_errors.txt'
+    handle_varieties = not args.no_varieties
+
+    if args.backend == 'batch' and not args.dump_dir:
+        rows, logs = process_pokemon_in_batches(first_num, final_num + 1, error_log_file, handle_varieties,
+                                                max_threads=args.workers)
+    else:
+        fetch = load_dump(args.dump_dir).get_json if args.dump_dir else pokeapi_client.get_json
+        evolution_index = dump_evolution_index(args.dump_dir) if args.dump_dir else None
+        engine = None if args.dump_dir else make_engine(args)
+        try:
+            rows, logs, _ = process_pokemon_with_planner(first_num, final_num + 1, error_log_file, handle_varieties,
+                                                         args.workers, engine=engine, fetch=fetch,
+                                                         evolution_index=evolution_index)
+        finally:
+            if engine is not None:
+                engine.close()
+
+    write_logs(logs, base_name + '_processing.txt')
+    save_output(rows, output_file, args.format)
+    if not args.no_snapshot:
+        write_snapshot(rows, snapshot_path(output_file))
+    print(f"Wrote {len(rows)} rows for {first_num} to {final_num}")
+
+
+def refresh(args):
+    configure_cache(args)
+    from refresh import refresh_generation
+
+    for generation in args.generations:
+        refresh_generation(generation, handle_varieties=not args.no_varieties, max_workers=args.workers)
+
+
+def count_rows(path):
+    with open(path, newline='') as file_manager:
+        return sum(1 for _ in csv.reader(file_manager)) - 1
+
+
+def snapshot_rows(path):
+    # Read from the manifest alone, without loading NumPy
+    try:
+        with open(os.path.join(path, 'manifest.json')) as file_manager:
+            return json.load(file_manager)['rows']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def status(args):
+    """
+    Lists every generation's dex range and output, and the state of the response cache and retry queue. Only reads
+    files that already exist, so it never creates a cache or queue
+    """
+    for generation in sorted(PokemonData.generation_start_dict):
+        first_num, final_num = generation_bounds(generation)
+        output_file = os.path.join(args.output_dir, f'pokemon_data_gen{generation}.csv')
+        description = f"{count_rows(output_file)} rows" if os.path.exists(output_file) else "no output"
+        rows = snapshot_rows(output_file.replace('.csv', '.snapshot'))
+        if rows is not None:
+            description += f", snapshot of {rows} rows"
+        if os.path.isdir(f"{output_file}.parts"):
+            description += ", unfinished streaming run"
+        print(f"Generation {generation}: {first_num}-{final_num}, {description}")
+
+    cache_path = args.cache or pokeapi_client.get_default_cache_path()
+    if os.path.exists(cache_path):
+        from response_cache import ResponseCache
+
+        cache = ResponseCache(cache_path)
+        print(f"Cache {cache_path}: {len(cache)} responses, {os.path.getsize(cache_path) / 1e6:.2f}MB")
+        cache.close()
+    else:
+        print(f"Cache {cache_path}: not created yet")
+
+    queue_path = args.queue or retry_queue.DEFAULT_QUEUE_PATH
+    if os.path.exists(queue_path):
+        queue = retry_queue.RetryQueue(queue_path)
+        print(f"Retry queue {queue_path}: {len(queue)} failed resources, {len(queue.due())} due, "
+              f"{len(queue.given_up())} given up")
+        queue.close()
+    else:
+        print(f"Retry queue {queue_path}: empty")
+
+
+def export(args):
+    """
+    Converts dataset CSVs into typed Parquet or Feather output, or a memory-mapped snapshot
+    """
+    from dataset_schema import read_dataset, save_typed
+
+    data = read_dataset(args.paths)
+    if args.format == 'snapshot':
+        from dataset_snapshot import write_snapshot
+
+        write_snapshot(data, args.output)
+    else:
+        save_typed(data, args.output, args.format, args.partition_by_generation)
+    print(f"Wrote {len(data)} rows to {args.output}")
+
+
+def top_level_imports(importtime_output):
+    """
+    Sums python -X importtime output into (cumulative microseconds, module) per top-level import, slowest first
+    """
+    timings = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '):  # Nested imports are indented further, and already counted
+            timings.append((int(cumulative), name.strip()))
+    return sorted(timings, reverse=True)
+
+
+def profile_imports(argv, limit=15):
+    """
+    Runs the command again under -X importtime, passing its output through, and prints the slowest top-level
+    imports to stderr
+    """
+    import subprocess  # Only needed for profiling
+
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__)] + argv
+    result = subprocess.run(command, stderr=subprocess.PIPE, text=True)
+    timings = top_level_imports(result.stderr)
+    sys.stderr.write("\n".join(line for line in result.stderr.splitlines() if not line.startswith('import time:')))
+
+    print(f"\nImport time: {sum(microseconds for microseconds, _ in timings) / 1000:.1f}ms", file=sys.stderr)
+    for microseconds, name in timings[:limit]:
+        print(f"{microseconds / 1000:8.1f}ms  {name}", file=sys.stderr)
+    return result.returncode
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Collect and maintain the Pokémon generation datasets")
+    parser.add_argument('--profile-imports', action='store_true', help="Report where start-up import time goes")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_client_options(subparser):
+        subparser.add_argument('--cache', default=None, help="Response cache file (default: the XDG cache)")
+        subparser.add_argument('--offline', action='store_true', help="Only read the cache, never the API")
+        subparser.add_argument('--queue', default=None, help="Retry queue file for failed fetches")
+        subparser.add_argument('--workers', type=int, default=8)
+        subparser.add_argument('--no-varieties', action='store_true')
+
+    crawl_parser = commands.add_parser('crawl', help="Collect generations or a dex range")
+    selection = crawl_parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument('--generations', type=int, nargs='+', choices=sorted(PokemonData.generation_start_dict))
+    selection.add_argument('--range', type=int, nargs=2, metavar=('FIRST', 'LAST'))
+    crawl_parser.add_argument('--backend', default='planner', choices=BACKENDS)
+    crawl_parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'feather'])
+    crawl_parser.add_argument('--output', default=None, help="Output file for --range")
+    crawl_parser.add_argument('--dump-dir', default=None, help="Read from a local PokeAPI data dump instead")
+    crawl_parser.add_argument('--streaming', action='store_true', help="Write rows to disk batch by batch")
+    crawl_parser.add_argument('--resume', action='store_true', help="Carry on an interrupted streaming run")
+    crawl_parser.add_argument('--no-snapshot', action='store_true')
+    add_client_options(crawl_parser)
+    crawl_parser.set_defaults(handler=crawl)
+
+    refresh_parser = commands.add_parser('refresh', help="Update generation outputs with what changed upstream")
+    refresh_parser.add_argument('generations', type=int, nargs='+')
+    add_client_options(refresh_parser)
+    refresh_parser.set_defaults(handler=refresh)
+
+    status_parser = commands.add_parser('status', help="List generations, outputs, the cache and the retry queue")
+    status_parser.add_argument('--output-dir', default='.')
+    status_parser.add_argument('--cache', default=None)
+    status_parser.add_argument('--queue', default=None)
+    status_parser.set_defaults(handler=status)
+
+    export_parser = commands.add_parser('export', help="Convert dataset CSVs to Parquet, Feather or a snapshot")
+    export_parser.add_argument('paths', nargs='+')
+    export_parser.add_argument('--format', default='parquet', choices=['parquet', 'feather', 'snapshot'])
+    export_parser.add_argument('--output', required=True)
+    export_parser.add_argument('--partition-by-generation', action='store_true')
+    export_parser.set_defaults(handler=export)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = make_parser().parse_args(argv)
+    if args.profile_imports:
+        return profile_imports([arg for arg in argv if arg != '--profile-imports'])
+    args.handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+In-memory inverted indexes over a generated dataset, for answering type/ability/egg group/category slices without
+scanning (and re-tokenising) every row
+
+Each indexed value gets a bitmap of the rows that have it, held as a Python int so that AND/OR/NOT are single integer
+operations however many rows there are. Queries are built from index.where and combined with &, | and ~:
+    index = PokemonIndex(read_dataset('pokemon_data_gen1.csv'))
+    query = index.where('types', 'grass') & ~index.where('is_legendary', True)
+    index.frame(query)  # or index.positions(query), len(query)
+"""
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import matches_schema, to_typed_frame
+
+INDEXED_COLUMNS = [
+    'types', 'abilities', 'hidden_ability', 'egg_groups', 'generation', 'evolutionary_stage', 'color', 'shape',
+    'is_starter', 'is_pseudo', 'is_legendary', 'is_mythical', 'is_baby', 'is_ultra_beast', 'is_paradox', 'is_mega',
+    'is-totem', 'is_gmax'
+]
+
+
+def index_key(value):
+    # Values are looked up by their string form, so that e.g. where('generation', 1) and where('generation', '1') agree
+    return str(value).strip().lower()
+
+
+class Query:
+    """
+    A set of rows as a bitmap, bit i being row position i
+    """
+
+    def __init__(self, bitmap, length):
+        self.bitmap = bitmap
+        self.length = length
+
+    def __and__(self, other):
+        return Query(self.bitmap & other.bitmap, self.length)
+
+    def __or__(self, other):
+        return Query(self.bitmap | other.bitmap, self.length)
+
+    def __sub__(self, other):
+        return Query(self.bitmap & ~other.bitmap, self.length)
+
+    def __invert__(self):
+        return Query(~self.bitmap & ((1 << self.length) - 1), self.length)
+
+    def __len__(self):
+        return self.bitmap.bit_count()
+
+    def __bool__(self):
+        return bool(self.bitmap)
+
+    def positions(self):
+        """
+        Row positions in the query, as a sorted NumPy array
+        """
+        packed = np.frombuffer(self.bitmap.to_bytes((self.length + 7) // 8 or 1, 'little'), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(packed, bitorder='little')[:self.length])
+
+
+class PokemonIndex:
+    """
+    Bitmaps for every value of INDEXED_COLUMNS in a dataset, built in a single pass over each column
+    Accepts rows, a typed DataFrame or one read straight from the dataset CSVs
+    """
+
+    def __init__(self, data, columns=None):
+        self.df = data if matches_schema(data) else to_typed_frame(data)
+        self.df = self.df.reset_index(drop=True)
+        self.length = len(self.df)
+        self.bitmaps = dict()
+
+        for column in columns or INDEXED_COLUMNS:
+            if column in self.df:
+                self.bitmaps[column] = self.build_column(self.df[column])
+
+    def build_column(self, values):
+        positions = dict()
+        for position, value in enumerate(values):
+            for item in (value if isinstance(value, list) else [value]):
+                if item is pd.NA or item is None:
+                    continue
+                positions.setdefault(index_key(item), []).append(position)
+
+        bitmaps = dict()
+        for key, rows in positions.items():
+            present = np.zeros(self.length, dtype=bool)
+            present[rows] = True
+            bitmaps[key] = int.from_bytes(np.packbits(present, bitorder='little').tobytes(), 'little')
+        return bitmaps
+
+    def values(self, column):
+        return sorted(self.bitmaps[column])
+
+    def all(self):
+        return Query((1 << self.length) - 1, self.length)
+
+    def where(self, column, *values):
+        """
+        Rows where column has any of values (for list columns, rows where any of values is in the list)
+        """
+        if column not in self.bitmaps:
+            raise KeyError(f"{column} is not indexed")
+
+        bitmap = 0
+        for value in values:
+            bitmap |= self.bitmaps[column].get(index_key(value), 0)
+        return Query(bitmap, self.length)
+
+    def where_all(self, column, *values):
+        """
+        Rows where a list column contains every one of values, e.g. where_all('types', 'grass', 'poison')
+        """
+        query = self.all()
+        for value in values:
+            query &= self.where(column, value)
+        return query
+
+    def positions(self, query):
+        return query.positions()
+
+    def frame(self, query):
+        return self.df.iloc[query.positions()]
+
+    def counts(self, column):
+        """
+        How many rows have each value of a column, from the bitmaps alone
+        """
+        return pd.Series({value: bitmap.bit_count() for value, bitmap in self.bitmaps[column].items()},
+                         name=column).sort_values(ascending=False)
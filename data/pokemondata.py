@@ -1,4 +1,13 @@
-import pokebase as pb
+from functools import cached_property
+
+import pokeapi_client
+from evolution_index import EvolutionChainIndex
+from instrumentation import error_logs, metrics, timed_field
+
+
+def species_field(attr, is_obj=False):
+    # A field read straight from the species data, worked out on first access
+    return cached_property(lambda self: self.safe_get_attr(attr, self.species_data, is_obj))
 
 
 class PokemonData:
@@ -30,21 +39,83 @@ class PokemonData:
         'dratini', 'larvitar', 'bagon', 'beldum', 'gible', 'deino', 'goomy', 'jangmo-o', 'dreepy', 'frigibax'
     ]
 
-    def __init__(self, pokemon, error_log_file, species_data=None):
+    # Shared by every instance (and every thread), so each evolution chain is only fetched and walked once
+    evolution_index = EvolutionChainIndex(pseudo_base_forms)
+
+    # Every exported column, in to_dict order, with the resources it is derived from. Only the resources needed by the
+    # requested fields are ever fetched, so e.g. a stats-only extract never touches the species or evolution chain
+    field_dependencies = {
+        'dex_num': {'pokemon'},
+        'name': {'pokemon'},
+        'species': {'pokemon'},
+        'generation': {'species'},
+        'types': {'pokemon'},
+        'abilities': {'pokemon'},
+        'hidden_ability': {'pokemon'},
+        'varieties': {'species'},
+
+        'female_rate': {'species'},
+        'has_gender_differences': {'species'},
+        'capture_rate': {'species'},
+        'growth_rate': {'species'},
+        'base_happiness': {'species'},
+
+        'hatch_counter': {'species'},
+        'egg_groups': {'species'},
+
+        'bst': {'pokemon'},
+        'hp': {'pokemon'},
+        'attack': {'pokemon'},
+        'defense': {'pokemon'},
+        'sp_attack': {'pokemon'},
+        'sp_defense': {'pokemon'},
+        'speed': {'pokemon'},
+
+        'evolves_from': {'species'},
+        'evolutionary_stage': {'species', 'evolution_chain'},
+
+        'is_starter': {'pokemon', 'species'},
+        'is_pseudo': {'species', 'evolution_chain'},
+        'is_legendary': {'species'},
+        'is_mythical': {'species'},
+        'is_baby': {'species'},
+        'is_ultra_beast': {'pokemon'},
+        'is_paradox': {'pokemon'},
+        'is_mega': {'pokemon'},
+        'is-totem': {'pokemon'},
+        'is_gmax': {'pokemon'},
+
+        'color': {'species'},
+        'shape': {'species'},
+        'height_m': {'pokemon'},
+        'weight_kg': {'pokemon'}
+    }
+
+    def __init__(self, pokemon, error_log_file, species_data=None, evolution_index=None, pokemon_data=None,
+                 fields=None):
         """
         Initialises the Pokémon Data object, taking the following as parameters:
         - pokemon: The Pokédex number (413) and specific Pokémon name (e.g. 'wormadam-grass') both work
         - error_log_file: The error log file for the process
         - species_data: The species data to use if provided, in order to avoid making unnecessary API calls
+        - evolution_index: The EvolutionChainIndex to use, if not the one shared by all instances
+        - pokemon_data: The Pokémon data to use if it has already been fetched (e.g. by the crawl planner)
+        - fields: The columns to_dict should export, defaulting to all of them (see field_dependencies)
+        Only the Pokémon itself is fetched here. Everything else, including the species, is worked out the first time
+        it is accessed, and then kept
         """
 
+        if evolution_index is not None:
+            self.evolution_index = evolution_index
+        self.fields = self.select_fields(fields)
+
         # For logging errors during the process
         self.error_log_file = error_log_file
+        self.provided_species_data = species_data
 
         try:
-            # Set the Pokémon, Species and name, since these are important properties
-            self.pokemon_data = pb.pokemon(pokemon)
-            self.species_data = species_data or pb.pokemon_species(self.pokemon_data.species.name)
+            # Set the Pokémon and name, since these are important properties
+            self.pokemon_data = pokemon_data or pokeapi_client.pokemon(pokemon)
             self.name = self.pokemon_data.name
         except AttributeError:
             self.pokemon_data = "missing"
@@ -52,89 +123,137 @@ class PokemonData:
             self.name = pokemon
             self.log_error("initialisation")
 
-        # Basic useful Pokémon information
-        self.dex_num = self.safe_get_attr('id', self.species_data)
         self.name = self.safe_get_attr('name', self.pokemon_data)
-        self.species = self.safe_get_attr('name', self.species_data)
-        self.generation = self.safe_get_method(self.get_generation)
-        self.types = self.safe_get_list('types', self.pokemon_data, lambda t: t.type.name)
-        self.abilities, self.hidden_ability = self.safe_get_method(self.get_abilities, is_list=True)
-        self.varieties = self.safe_get_method(self.get_varieties)
-
-        # Supplemental Pokémon information
-        self.female_rate = self.safe_get_attr('gender_rate', self.species_data)  # In eighths, genderless is -1
-        self.has_gender_differences = self.safe_get_attr('has_gender_differences', self.species_data)
-        self.capture_rate = self.safe_get_attr('capture_rate', self.species_data)
-        self.growth_rate = self.safe_get_attr('growth_rate', self.species_data)
-        self.base_happiness = self.safe_get_attr('base_happiness', self.species_data)
-
-        # Egg information
-        self.hatch_counter = self.safe_get_attr('hatch_counter', self.species_data)
-        self.egg_groups = self.safe_get_list('egg_groups', self.species_data, lambda e: e.name)
-
-        # Stats, including Base Stat Total
-        self.hp, self.attack, self.defense, self.sp_attack, self.sp_defense, self.speed = self.safe_get_stats()
+
+    @classmethod
+    def select_fields(cls, fields=None):
+        if fields is None:
+            return list(cls.field_dependencies)
+
+        unknown = set(fields) - set(cls.field_dependencies)
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}")
+        return [field for field in cls.field_dependencies if field in set(fields)]
+
+    @classmethod
+    def resources_for(cls, fields=None):
+        """
+        The resources ('pokemon', 'species', 'evolution_chain') needed to export the given fields
+        """
+        return set().union(*(cls.field_dependencies[field] for field in cls.select_fields(fields)))
+
+    # The species is only fetched once something needs it
+    @cached_property
+    def species_data(self):
+        try:
+            return self.provided_species_data or pokeapi_client.pokemon_species(self.pokemon_data.species.id)
+        except AttributeError:
+            self.log_error("initialisation")
+            return "missing"
+
+    @cached_property
+    def species_reference(self):  # The Pokémon names its species, so the dex number doesn't need the species data
+        return getattr(self.pokemon_data, 'species', "missing")
+
+    # Basic useful Pokémon information
+    dex_num = cached_property(lambda self: self.safe_get_attr('id', self.species_reference))
+    species = cached_property(lambda self: self.safe_get_attr('name', self.species_reference))
+    generation = cached_property(lambda self: self.safe_get_method(self.get_generation))
+    types = cached_property(lambda self: self.safe_get_list('types', self.pokemon_data, lambda t: t.type.name))
+    ability_pair = cached_property(lambda self: self.safe_get_method(self.get_abilities, is_list=True))
+    abilities = cached_property(lambda self: self.ability_pair[0])
+    hidden_ability = cached_property(lambda self: self.ability_pair[1])
+    varieties = cached_property(lambda self: self.safe_get_method(self.get_varieties))
+
+    # Supplemental Pokémon information
+    female_rate = species_field('gender_rate')  # In eighths, genderless is -1
+    has_gender_differences = species_field('has_gender_differences')
+    capture_rate = species_field('capture_rate')
+    growth_rate = species_field('growth_rate')
+    base_happiness = species_field('base_happiness')
+
+    # Egg information
+    hatch_counter = species_field('hatch_counter')
+    egg_groups = cached_property(lambda self: self.safe_get_list('egg_groups', self.species_data, lambda e: e.name))
+
+    # Stats, including Base Stat Total
+    stat_values = cached_property(lambda self: self.safe_get_stats())
+    hp = cached_property(lambda self: self.stat_values[0])
+    attack = cached_property(lambda self: self.stat_values[1])
+    defense = cached_property(lambda self: self.stat_values[2])
+    sp_attack = cached_property(lambda self: self.stat_values[3])
+    sp_defense = cached_property(lambda self: self.stat_values[4])
+    speed = cached_property(lambda self: self.stat_values[5])
+
+    @cached_property
+    def bst(self):
         try:
-            self.bst = sum([self.hp, self.attack, self.defense, self.sp_attack, self.sp_defense, self.speed])
+            return sum(self.stat_values)
         except TypeError:
-            self.bst = 'missing'
-
-        # Evolution data - note evolutionary stage is -1 for single-stage, 0 for unevolved etc
-        self.evolves_from = self.safe_get_attr('evolves_from_species', self.species_data)  # Can legally be None
-        self.evolutionary_stage = self.safe_get_method(self.get_evolutionary_stage)
-
-        # Category markers
-        self.is_starter = self.safe_get_method(self.id_is_starter)
-        self.is_pseudo = self.safe_get_method(self.id_is_pseudo)
-        self.is_legendary = self.safe_get_attr('is_legendary', self.species_data)
-        self.is_mythical = self.safe_get_attr('is_mythical', self.species_data)
-        self.is_baby = self.safe_get_attr('is_baby', self.species_data)
-        self.is_ultra_beast = self.safe_get_method(self.id_is_ultra_beast)
-        self.is_paradox = self.safe_get_method(self.id_is_paradox)
-        self.is_mega = "-mega" in self.name
-        self.is_totem = "-totem" in self.name
-        self.is_gmax = "-gmax" in self.name
-
-        # Appearance - cannot legally be None, hence usage of is_obj even though name gets pulled by default
-        self.color = self.safe_get_attr('color', self.species_data, is_obj=True)
-        self.shape = self.safe_get_attr('shape', self.species_data, is_obj=True)
-
-        # Dimensions: need to be evaluated before dividing for units
-        self.height_m = self.safe_get_attr('height', self.pokemon_data)
-        if self.height_m != 'missing':
-            self.height_m /= 10.0
-        self.weight_kg = self.safe_get_attr('weight', self.pokemon_data)
-        if self.weight_kg != 'missing':
-            self.weight_kg /= 10.0
-
-    # Logging method for errors
+            return 'missing'
+
+    # Evolution data - note evolutionary stage is -1 for single-stage, 0 for unevolved etc
+    evolves_from = species_field('evolves_from_species')  # Can legally be None
+    evolutionary_stage = cached_property(lambda self: self.safe_get_method(self.get_evolutionary_stage))
+
+    # Category markers
+    is_starter = cached_property(lambda self: self.safe_get_method(self.id_is_starter))
+    is_pseudo = cached_property(lambda self: self.safe_get_method(self.id_is_pseudo))
+    is_legendary = species_field('is_legendary')
+    is_mythical = species_field('is_mythical')
+    is_baby = species_field('is_baby')
+    is_ultra_beast = cached_property(lambda self: self.safe_get_method(self.id_is_ultra_beast))
+    is_paradox = cached_property(lambda self: self.safe_get_method(self.id_is_paradox))
+    is_mega = cached_property(lambda self: "-mega" in self.name)
+    is_totem = cached_property(lambda self: "-totem" in self.name)
+    is_gmax = cached_property(lambda self: "-gmax" in self.name)
+
+    # Appearance - cannot legally be None, hence usage of is_obj even though name gets pulled by default
+    color = species_field('color', is_obj=True)
+    shape = species_field('shape', is_obj=True)
+
+    # Dimensions: need to be evaluated before dividing for units
+    @cached_property
+    def height_m(self):
+        height = self.safe_get_attr('height', self.pokemon_data)
+        return height / 10.0 if height != 'missing attribute' else height
+
+    @cached_property
+    def weight_kg(self):
+        weight = self.safe_get_attr('weight', self.pokemon_data)
+        return weight / 10.0 if weight != 'missing attribute' else weight
+
+    # Logging method for errors, buffered and written in batches (see instrumentation.py)
     def log_error(self, field):
+        metrics.record_error(field)
         if self.pokemon_data != "missing":  # Shouldn't run if there was an initialisation error
-            with open(self.error_log_file, 'a') as log_file:
-                log_file.write(f"Error with {self.name}: {field} could not be parsed\n")
+            error_logs.write(self.error_log_file, f"Error with {self.name}: {field} could not be parsed")
 
-    # Start of helper functions to log errors
+    # Start of helper functions to log errors, each timed per field
     def safe_get_attr(self, attr, obj, is_obj=False):
-        try:
-            return getattr(obj, attr).name if is_obj else getattr(obj, attr)
-        except AttributeError:
-            self.log_error(attr)
-            return "missing attribute"
+        with timed_field(attr):
+            try:
+                return getattr(obj, attr).name if is_obj else getattr(obj, attr)
+            except AttributeError:
+                self.log_error(attr)
+                return "missing attribute"
 
     def safe_get_method(self, method, is_list=False):
-        try:
-            result = method()
-            return result
-        except AttributeError:
-            self.log_error(method.__name__)
-            return "missing attribute" if not is_list else ("missing attribute", "missing attribute")
+        with timed_field(method.__name__):
+            try:
+                result = method()
+                return result
+            except AttributeError:
+                self.log_error(method.__name__)
+                return "missing attribute" if not is_list else ("missing attribute", "missing attribute")
 
     def safe_get_list(self, attr, obj, transform):
-        try:
-            return [transform(item) for item in getattr(obj, attr)]
-        except AttributeError:
-            self.log_error(attr)
-            return "missing attribute"
+        with timed_field(attr):
+            try:
+                return [transform(item) for item in getattr(obj, attr)]
+            except AttributeError:
+                self.log_error(attr)
+                return "missing attribute"
 
     def safe_get_stat(self, index):
         try:
@@ -144,22 +263,23 @@ class PokemonData:
             return "missing attribute"
 
     def safe_get_stats(self):
-        try:
-            stat_dict = dict()
-            stat_object = self.pokemon_data.stats
-            for stat in stat_object:
-                stat_dict[stat.stat.name] = stat.base_stat
-            return (
-                stat_dict['hp'],
-                stat_dict['attack'],
-                stat_dict['defense'],
-                stat_dict['special-attack'],
-                stat_dict['special-defense'],
-                stat_dict['speed']
-            )
-        except AttributeError:
-            self.log_error("stats")
-            return ["missing attribute"] * 6
+        with timed_field('stats'):
+            try:
+                stat_dict = dict()
+                stat_object = self.pokemon_data.stats
+                for stat in stat_object:
+                    stat_dict[stat.stat.name] = stat.base_stat
+                return (
+                    stat_dict['hp'],
+                    stat_dict['attack'],
+                    stat_dict['defense'],
+                    stat_dict['special-attack'],
+                    stat_dict['special-defense'],
+                    stat_dict['speed']
+                )
+            except AttributeError:
+                self.log_error("stats")
+                return ["missing attribute"] * 6
 
     # Start of functions needed to get attributes
     def get_generation(self):  # Return the numerical Generation number
@@ -179,34 +299,21 @@ class PokemonData:
         return normal_abilities, hidden_ability
 
     def get_varieties(self):  # Find all the other varieties of the Pokémon
+        # The species data already names every variety, so no further lookups are needed
         varieties = []
         varieties_data = self.species_data.varieties
         for variety in varieties_data:
             if self.name != variety.pokemon.name:  # Excludes the variety of Pokémon already present
-                pokemon_id = int(variety.pokemon.url.strip('/').split('/')[-1])
-                pokemon_name = pb.pokemon(pokemon_id).name
-                varieties.append(pokemon_name)
+                varieties.append(variety.pokemon.name)
         return varieties
 
     def get_primary_ability(self):  # Used internally to help identify some Pokémon categories
         return self.pokemon_data.abilities[0].ability.name
 
     def get_evolutionary_stage(self):
-        # Get details on the Pokémon's evolutionary chain
+        # The whole chain is walked once by the evolution index, which is then shared by every member of the chain
         evo_chain_id = self.species_data.evolution_chain.id
-        evo_chain = pb.evolution_chain(evo_chain_id)
-
-        if not self.evolves_from:  # Either a single-stage or unevolved Pokémon
-            if not evo_chain.chain.evolves_to:  # Single-stage Pokémon
-                return -1
-            else:  # Unevolved Pokémon
-                return 0
-        else:  # First or second evolution
-            first_evolution_names = [evolution.species.name for evolution in evo_chain.chain.evolves_to]
-            if self.species in first_evolution_names:  # First evolution
-                return 1
-            else:  # Only second evolution Mons remaining, since there are no four-stage evolutions
-                return 2
+        return self.evolution_index.get_stage(evo_chain_id, self.species)
 
     def id_is_starter(self):
         # Need to account for non-standard starters (e.g. Pikachu and Eevee)
@@ -222,12 +329,9 @@ class PokemonData:
         return 0 <= position_in_generation <= 8  # The standard starters are always in the first nine Mons of a Gen
 
     def id_is_pseudo(self):
-        # Get the unevolved form of the Pokémon
+        # Determined by whether the chain's unevolved form is in the list of unevolved pseudo-legendary Pokémon
         evolution_chain_id = self.species_data.evolution_chain.id
-        unevolved_form_name = pb.evolution_chain(evolution_chain_id).chain.species.name
-
-        # Determine if the unevolved form is in the list of unevolved pseudo-legendary Pokémon
-        return unevolved_form_name in PokemonData.pseudo_base_forms
+        return self.evolution_index.get_is_pseudo(evolution_chain_id, self.species)
 
     def id_is_ultra_beast(self):
         # All UBs have Beast Boost as their primary Ability, and no Mons with other Abilities are counted
@@ -244,51 +348,7 @@ class PokemonData:
         else:
             return attr
 
-    # Returns a dictionary of all meaningful attributes. Any lists are converted into space-separated strings
+    # Returns a dictionary of the requested attributes (all of them by default). Any lists are converted into
+    # space-separated strings. 'is-totem' is exported under a different name to its attribute
     def to_dict(self):
-        return {
-            'dex_num': self.dex_num,
-            'name': self.name,
-            'species': self.species,
-            'generation': self.generation,
-            'types': self.process_list_attr(self.types),
-            'abilities': self.process_list_attr(self.abilities),
-            'hidden_ability': self.hidden_ability,
-            'varieties': self.process_list_attr(self.varieties),
-
-            'female_rate': self.female_rate,
-            'has_gender_differences': self.has_gender_differences,
-            'capture_rate': self.capture_rate,
-            'growth_rate': self.growth_rate,
-            'base_happiness': self.base_happiness,
-
-            'hatch_counter': self.hatch_counter,
-            'egg_groups': self.process_list_attr(self.egg_groups),
-
-            'bst': self.bst,
-            'hp': self.hp,
-            'attack': self.attack,
-            'defense': self.defense,
-            'sp_attack': self.sp_attack,
-            'sp_defense': self.sp_defense,
-            'speed': self.speed,
-
-            'evolves_from': self.evolves_from,
-            'evolutionary_stage': self.evolutionary_stage,
-
-            'is_starter': self.is_starter,
-            'is_pseudo': self.is_pseudo,
-            'is_legendary': self.is_legendary,
-            'is_mythical': self.is_mythical,
-            'is_baby': self.is_baby,
-            'is_ultra_beast': self.is_ultra_beast,
-            'is_paradox': self.is_paradox,
-            'is_mega': self.is_mega,
-            'is-totem': self.is_totem,
-            'is_gmax': self.is_gmax,
-
-            'color': self.color,
-            'shape': self.shape,
-            'height_m': self.height_m,
-            'weight_kg': self.weight_kg
-        }
+        return {field: self.process_list_attr(getattr(self, field.replace('-', '_'))) for field in self.fields}
@@ -0,0 +1,249 @@
+"""
+Incremental refresh of an existing generation dataset, re-fetching and re-deriving only what changed upstream
+
+A manifest (<output_file>.manifest.json) keeps a content hash and ETag for every species, Pokémon and evolution chain
+the dataset was built from, and the collectors write it alongside each CSV output (see write_manifest). A refresh
+revalidates each of them with a conditional request, which costs a 304 response for anything unchanged. Only dex
+numbers depending on a changed resource are rebuilt, and their rows are patched back into the existing file in place
+
+Usage: python refresh.py <generation> [--output pokemon_data_gen3.csv]
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pokeapi_client
+from crawl_planner import process_pokemon_with_planner
+from dataset_schema import read_dataset
+from dataset_snapshot import snapshot_path, write_snapshot
+from evolution_index import EvolutionChainIndex
+from pokemondata import PokemonData
+from streaming_output import contiguous_ranges, dex_sort_key
+
+
+def content_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def resource_key(endpoint, resource_id):
+    return f"{endpoint}/{resource_id}"
+
+
+def load_manifest(output_file):
+    try:
+        with open(f"{output_file}.manifest.json") as file_manager:
+            return json.load(file_manager)
+    except FileNotFoundError:
+        return {'resources': {}}
+
+
+def save_manifest(manifest, output_file):
+    temporary_path = f"{output_file}.manifest.json.tmp"
+    with open(temporary_path, 'w') as file_manager:
+        json.dump(manifest, file_manager, indent=1, sort_keys=True)
+    os.replace(temporary_path, f"{output_file}.manifest.json")
+
+
+def species_dependencies(species, handle_varieties=True):
+    """
+    Gets the (endpoint, resource id) of every Pokémon and evolution chain a species' rows are built from
+    """
+    keys = [
+        ('pokemon', pokeapi_client.id_from_url(variety['pokemon']['url']))
+        for variety in species['varieties'] if handle_varieties or variety['is_default']
+    ]
+    if species.get('evolution_chain'):
+        keys.append(('evolution-chain', pokeapi_client.id_from_url(species['evolution_chain']['url'])))
+    return keys
+
+
+def write_manifest(output_file, first_num, final_num, handle_varieties=True, fetch=pokeapi_client.get_cached_json):
+    """
+    Writes the manifest for an output just built from dex numbers first_num to final_num (exclusive), so that the
+    first refresh only revalidates. Hashes come from the resources the crawl left in the cache (or a dump, through
+    fetch), with the ETag wherever this process fetched the resource itself. Anything that can't be read, such as a
+    failed fetch, is left out, and so is fetched in full by the next refresh
+    """
+    resources = dict()
+
+    def record(key, *aliases):
+        # The batch collector fetches varieties by name, so they're cached (and their ETags kept) under the name
+        for lookup in (key,) + aliases:
+            try:
+                data = fetch(*lookup)
+            except Exception:
+                continue
+            if data is not None:
+                resources[resource_key(*key)] = {'hash': content_hash(data), 'etag': pokeapi_client.get_etag(*lookup)}
+                return data
+        return None
+
+    for dex_num in range(first_num, final_num):
+        species = record(('pokemon-species', dex_num))
+        if species is None:
+            continue
+        names = {pokeapi_client.id_from_url(variety['pokemon']['url']): variety['pokemon']['name']
+                 for variety in species['varieties']}
+        for endpoint, resource_id in species_dependencies(species, handle_varieties):
+            record((endpoint, resource_id), *([(endpoint, names[resource_id])] if endpoint == 'pokemon' else []))
+
+    save_manifest({'resources': resources}, output_file)
+
+
+def drop_evolution_records(changed):
+    """
+    Deletes the records EvolutionChainIndex keeps in the cache for every changed evolution chain, so that process
+    pool runs (see scheduler.init_worker) walk the new chain rather than serving its old stages
+    """
+    cache = pokeapi_client.get_cache()
+    if not hasattr(cache, 'delete'):  # A plugged-in store without deletes
+        return
+    for endpoint, resource_id in changed:
+        if endpoint == 'evolution-chain':
+            cache.delete(EvolutionChainIndex.STORE_ENDPOINT, resource_id)
+
+
+def read_rows(output_file):
+    with open(output_file, newline='') as file_manager:
+        reader = csv.DictReader(file_manager)
+        return reader.fieldnames, list(reader)
+
+
+def csv_value(value):
+    # How a value appears once written to CSV, so that new rows can be compared with existing ones
+    return '' if value is None else str(value)
+
+
+def patch_rows(output_file, fieldnames, old_rows, dex_nums, new_rows):
+    """
+    Replaces every row of the given dex numbers with new_rows, leaving every other row exactly as it was, and returns
+    counts of changed, new, removed and unchanged rows. A snapshot of the output is rewritten to match, if there is one
+    """
+    dex_set = set(dex_nums)
+    old_by_name = {row['name']: row for row in old_rows if dex_sort_key(row) in dex_set}
+    new_names = {row['name'] for row in new_rows}
+    report = {
+        'changed': sum(1 for row in new_rows if row['name'] in old_by_name and row != old_by_name[row['name']]),
+        'new': sum(1 for row in new_rows if row['name'] not in old_by_name),
+        'removed': sum(1 for name in old_by_name if name not in new_names),
+    }
+    report['unchanged'] = len(old_rows) - report['changed'] - report['removed']
+
+    patched_rows = [row for row in old_rows if dex_sort_key(row) not in dex_set] + new_rows
+    patched_rows.sort(key=dex_sort_key)
+
+    temporary_path = f"{output_file}.tmp"
+    with open(temporary_path, 'w', newline='') as file_manager:
+        writer = csv.DictWriter(file_manager, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(patched_rows)
+    os.replace(temporary_path, output_file)
+
+    if os.path.isdir(snapshot_path(output_file)):
+        write_snapshot(read_dataset(output_file), snapshot_path(output_file))
+    return report
+
+
+def revalidate_resources(keys, manifest, max_workers=8):
+    """
+    Revalidates each (endpoint, resource id), updating the manifest and returning the sets of keys that changed and
+    keys that could not be revalidated. Resources missing from the manifest are fetched in full and count as changed
+    """
+    resources = manifest['resources']
+
+    def revalidate(key):
+        entry = resources.get(resource_key(*key), {})
+        try:
+            data, etag = pokeapi_client.revalidate(*key, etag=entry.get('etag'))
+        except Exception:
+            return key, None, False
+        if data is None:  # 304 Not Modified
+            return key, entry, False
+
+        new_entry = {'hash': content_hash(data), 'etag': etag}
+        return key, new_entry, new_entry['hash'] != entry.get('hash')
+
+    changed = set()
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for key, entry, is_changed in executor.map(revalidate, keys):
+            if entry is None:
+                failed.add(key)
+                continue
+
+            resources[resource_key(*key)] = entry
+            if is_changed:
+                changed.add(key)
+
+    return changed, failed
+
+
+def refresh_generation(generation, output_file=None, handle_varieties=True, max_workers=8):
+    """
+    Refreshes a generation's dataset in place, returning a report of changed, unchanged, new and removed rows
+    """
+    first_num = PokemonData.generation_start_dict[generation]
+    final_num = PokemonData.generation_start_dict.get(generation + 1, 1026)
+    output_file = output_file or f'pokemon_data_gen{generation}.csv'
+    error_log_file = f'pokemon_errors_gen{generation}.txt'
+    stats_before = pokeapi_client.get_request_stats()
+
+    manifest = load_manifest(output_file)
+    fieldnames, old_rows = read_rows(output_file)
+
+    # Species first, since they name the Pokémon and evolution chain each dex number depends on
+    dex_nums = list(range(first_num, final_num))
+    changed, failed = revalidate_resources([('pokemon-species', dex_num) for dex_num in dex_nums], manifest,
+                                           max_workers)
+
+    # Dex numbers whose species can't be revalidated are left exactly as they are
+    dex_nums = [dex_num for dex_num in dex_nums if ('pokemon-species', dex_num) not in failed]
+
+    dependencies = {
+        dex_num: species_dependencies(pokeapi_client.get_json('pokemon-species', dex_num), handle_varieties)
+        for dex_num in dex_nums
+    }
+
+    dependency_keys = sorted({key for keys in dependencies.values() for key in keys})
+    dependency_changes, dependency_failures = revalidate_resources(dependency_keys, manifest, max_workers)
+    changed |= dependency_changes
+    failed |= dependency_failures
+    drop_evolution_records(dependency_changes)
+
+    affected = [
+        dex_num for dex_num in dex_nums
+        if ('pokemon-species', dex_num) in changed or any(key in changed for key in dependencies[dex_num])
+    ]
+
+    # Rebuild only the affected dex numbers, with a fresh evolution index so that no stale chains are reused
+    new_rows = []
+    evolution_index = EvolutionChainIndex(PokemonData.pseudo_base_forms)
+    for start, end in contiguous_ranges(affected, 80):
+        rows, _, _ = process_pokemon_with_planner(start, end, error_log_file, handle_varieties,
+                                                  evolution_index=evolution_index)
+        new_rows.extend({column: csv_value(value) for column, value in row.items()} for row in rows)
+
+    report = patch_rows(output_file, fieldnames, old_rows, affected, new_rows)
+    save_manifest(manifest, output_file)
+
+    stats_after = pokeapi_client.get_request_stats()
+    report['requests_issued'] = stats_after['requests'] - stats_before['requests']
+    report['changed_resources'] = len(changed)
+    report['failed_resources'] = len(failed)
+    print(f"{datetime.now()}: refreshed generation {generation}: {report}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh a generation dataset with only what changed upstream")
+    parser.add_argument('generation', type=int)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    refresh_generation(args.generation, args.output)
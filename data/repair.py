@@ -0,0 +1,154 @@
+"""
+Repair pass for generation datasets: retries only the resources in the retry queue (see retry_queue.py) and patches
+the rows depending on them into the existing output, rather than re-running whole generations
+
+Each queued resource whose backoff has passed gets one more fetch, with a circuit breaker that stops attempting any
+more if the API looks to be down (whatever is left stays queued for next time). A resource that now fetches is traced
+back to the dex numbers depending on it:
+- pokemon-species: its own dex number
+- pokemon: its species' dex number
+- evolution-chain: the dex number of every species in the chain
+Those dex numbers are rebuilt from the now cached resources, and their rows replace the old ones in
+pokemon_data_gen<N>.csv, or are added back if the dex number had been dropped from the output. A dex number that
+still can't be rebuilt completely keeps its old rows, and whatever failed is queued again
+
+Usage: python repair.py [--queue retry_queue.sqlite] [--now] [--status]
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+import pokeapi_client
+import retry_queue
+from crawl_planner import process_pokemon_with_planner
+from refresh import csv_value, patch_rows, read_rows
+from retry_queue import CircuitBreaker, is_transient
+from scheduler import generation_of
+
+
+def dependent_dex_nums(endpoint, resource_id, data):
+    """
+    The dex numbers whose rows are built from a resource
+    """
+    if endpoint == 'pokemon-species':
+        return {int(resource_id)}
+    if endpoint == 'pokemon':
+        return {pokeapi_client.id_from_url(data['species']['url'])}
+    if endpoint == 'evolution-chain':
+        dex_nums = set()
+        to_visit = [data['chain']]
+        while to_visit:
+            link = to_visit.pop()
+            dex_nums.add(pokeapi_client.id_from_url(link['species']['url']))
+            to_visit.extend(link['evolves_to'])
+        return dex_nums
+    return set()
+
+
+def retry_resources(queue, breaker, ignore_backoff=False):
+    """
+    Attempts each due resource once, returning (dex numbers to rebuild, report). Failures are queued again with a
+    longer backoff by pokeapi_client itself
+    """
+    dex_nums = set()
+    report = {'retried': 0, 'recovered': 0, 'still_failing': 0, 'dropped': 0, 'skipped': 0}
+
+    for entry in queue.due(ignore_backoff=ignore_backoff):
+        if not breaker.allow():
+            report['skipped'] += 1
+            continue
+
+        endpoint, resource_id = entry['endpoint'], entry['resource_id']
+        report['retried'] += 1
+        try:
+            data = pokeapi_client.get_json(endpoint, resource_id)
+        except Exception as e:
+            if not is_transient(e):  # E.g. removed upstream, so retrying again would never help
+                queue.resolve(endpoint, resource_id)
+                report['dropped'] += 1
+                continue
+            breaker.record_failure()
+            report['still_failing'] += 1
+            print(f"{datetime.now()}: {endpoint}/{resource_id} still failing: {e}")
+            continue
+
+        breaker.record_success()
+        queue.resolve(endpoint, resource_id)
+        report['recovered'] += 1
+        dex_nums |= dependent_dex_nums(endpoint, resource_id, data)
+
+    return sorted(dex_nums), report
+
+
+def rebuild_rows(dex_nums, error_log_file, handle_varieties=True):
+    """
+    Rebuilds each dex number on its own, returning (the dex numbers rebuilt completely, their rows as CSV values)
+    """
+    rebuilt, new_rows = [], []
+    for dex_num in dex_nums:
+        rows, _, run_report = process_pokemon_with_planner(dex_num, dex_num + 1, error_log_file, handle_varieties)
+        if run_report['failed'] or not rows:  # A partial rebuild would drop varieties the output still has
+            continue
+        rebuilt.append(dex_num)
+        new_rows.extend({column: csv_value(value) for column, value in row.items()} for row in rows)
+    return rebuilt, new_rows
+
+
+def repair(queue=None, handle_varieties=True, ignore_backoff=False, output_dir='.', breaker=None):
+    """
+    Retries the queued resources and patches every generation output they affect, returning a report
+    - ignore_backoff: retry everything queued now, rather than only what is due
+    """
+    queue = queue or retry_queue.get_retry_queue()
+    breaker = breaker or CircuitBreaker()
+    stats_before = pokeapi_client.get_request_stats()
+
+    dex_nums, report = retry_resources(queue, breaker, ignore_backoff)
+    report['generations'] = dict()
+
+    by_generation = dict()
+    for dex_num in dex_nums:
+        by_generation.setdefault(generation_of(dex_num), []).append(dex_num)
+
+    for generation, generation_dex_nums in sorted(by_generation.items()):
+        output_file = os.path.join(output_dir, f'pokemon_data_gen{generation}.csv')
+        if not os.path.exists(output_file):
+            report['generations'][generation] = 'no output to patch'
+            continue
+
+        error_log_file = os.path.join(output_dir, f'pokemon_errors_gen{generation}.txt')
+        rebuilt, new_rows = rebuild_rows(generation_dex_nums, error_log_file, handle_varieties)
+        fieldnames, old_rows = read_rows(output_file)
+        generation_report = patch_rows(output_file, fieldnames, old_rows, rebuilt, new_rows)
+        generation_report['not_rebuilt'] = len(generation_dex_nums) - len(rebuilt)
+        report['generations'][generation] = generation_report
+
+    report['requests_issued'] = pokeapi_client.get_request_stats()['requests'] - stats_before['requests']
+    report['queued'] = len(queue)
+    report['given_up'] = len(queue.given_up())
+    report['breaker_open'] = breaker.is_open
+    print(f"{datetime.now()}: repair finished: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retry failed resources and patch them into existing outputs")
+    parser.add_argument('--queue', default=retry_queue.DEFAULT_QUEUE_PATH)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--now', action='store_true', help="Retry everything queued, ignoring backoff")
+    parser.add_argument('--no-varieties', action='store_true')
+    parser.add_argument('--status', action='store_true', help="Only list what is queued")
+    args = parser.parse_args()
+
+    failure_queue = retry_queue.set_retry_queue(args.queue)
+    if args.status:
+        for queued_entry in failure_queue.entries():
+            if queued_entry['attempts'] >= failure_queue.max_attempts:
+                next_attempt = "given up"
+            else:
+                next_attempt = f"next at {datetime.fromtimestamp(queued_entry['next_attempt'])}"
+            print(f"{queued_entry['endpoint']}/{queued_entry['resource_id']}: {queued_entry['attempts']} attempts, "
+                  f"{next_attempt}, last error: {queued_entry['last_error']}")
+    else:
+        repair(failure_queue, not args.no_varieties, args.now, args.output_dir)
@@ -0,0 +1,85 @@
+"""
+Slim projections of PokeAPI responses, keeping only the keys that PokemonData, the crawl planner and refresh read
+
+A full pokemon response carries every move with its version group details, sprites, game indices and held items, and a
+species carries every flavour text and name translation. None of that is used, so responses are projected as soon as
+they arrive, and the projection is what gets cached and wrapped. The raw response can then be dropped straight away
+
+Projections are nested specs: True keeps a value as it is, and a dictionary keeps only the listed keys of an object
+(or of every object in a list). Projecting an already projected response returns the same thing
+
+To project an existing response cache in place: python resource_projection.py [cache path]
+"""
+
+NAMED_REFERENCE = {'name': True, 'url': True}
+
+# Evolution chain links nest to any depth, so the spec refers to itself
+CHAIN_LINK = {'species': NAMED_REFERENCE, 'is_baby': True}
+CHAIN_LINK['evolves_to'] = CHAIN_LINK
+
+PROJECTIONS = {
+    'pokemon': {
+        'id': True,
+        'name': True,
+        'is_default': True,
+        'species': NAMED_REFERENCE,
+        'types': {'slot': True, 'type': NAMED_REFERENCE},
+        'abilities': {'ability': NAMED_REFERENCE, 'is_hidden': True, 'slot': True},
+        'stats': {'base_stat': True, 'stat': NAMED_REFERENCE},
+        'height': True,
+        'weight': True,
+    },
+    'pokemon-species': {
+        'id': True,
+        'name': True,
+        'generation': NAMED_REFERENCE,
+        'gender_rate': True,
+        'has_gender_differences': True,
+        'capture_rate': True,
+        'growth_rate': NAMED_REFERENCE,
+        'base_happiness': True,
+        'hatch_counter': True,
+        'egg_groups': NAMED_REFERENCE,
+        'evolves_from_species': NAMED_REFERENCE,
+        'evolution_chain': {'url': True},
+        'is_legendary': True,
+        'is_mythical': True,
+        'is_baby': True,
+        'color': NAMED_REFERENCE,
+        'shape': NAMED_REFERENCE,
+        'varieties': {'is_default': True, 'pokemon': NAMED_REFERENCE},
+    },
+    'evolution-chain': {
+        'id': True,
+        'chain': CHAIN_LINK,
+    },
+}
+
+
+def project_value(value, spec):
+    if spec is True or value is None:
+        return value
+    if isinstance(value, list):
+        return [project_value(item, spec) for item in value]
+    return {key: project_value(value[key], sub_spec) for key, sub_spec in spec.items() if key in value}
+
+
+def project(endpoint, data):
+    """
+    Returns the slim projection of a response from endpoint. Endpoints without a projection are returned unchanged
+    """
+    spec = PROJECTIONS.get(endpoint)
+    return project_value(data, spec) if spec is not None and data is not None else data
+
+
+if __name__ == "__main__":
+    import sys
+
+    from pokeapi_client import get_default_cache_path
+    from response_cache import ResponseCache
+
+    cache_path = sys.argv[1] if len(sys.argv) > 1 else get_default_cache_path()
+    response_cache = ResponseCache(cache_path)
+    before, after = response_cache.compact(project)
+    response_cache.close()
+    print(f"Compacted {cache_path} from {before / 2 ** 20:.2f}MB to {after / 2 ** 20:.2f}MB")
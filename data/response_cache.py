@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+class CacheMissError(LookupError):
+    """
+    Raised in offline replay mode when a resource is not in the cache, instead of making an HTTP call
+    """
+
+
+class ResponseCache:
+    """
+    On-disk store of PokeAPI responses, keyed by endpoint and resource id (e.g. 'pokemon/413' or
+    'pokemon/wormadam-grass')
+    Backed by a single SQLite file, so several threads and processes can share the same cache
+    - path: the SQLite file to use, created if it doesn't already exist
+    - max_entries: size cap, where the least recently used entries are evicted first. None means no cap
+    - ttl: number of seconds an entry stays valid for. None means entries never expire
+    """
+
+    def __init__(self, path, max_entries=None, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # A generous timeout, since another process may be holding the write lock
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, stored_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @staticmethod
+    def make_key(endpoint, resource_id):
+        return f"{endpoint}/{resource_id}"
+
+    def is_expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def get(self, endpoint, resource_id):
+        """
+        Returns the cached response, or None if it is missing or has expired
+        Reading an entry marks it as recently used for the purposes of LRU eviction
+        """
+        key = self.make_key(endpoint, resource_id)
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT data, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            data, stored_at = row
+            if self.is_expired(stored_at):
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+
+        return json.loads(data)
+
+    def set(self, endpoint, resource_id, data):
+        """
+        Stores a response, evicting the least recently used entries if this takes the cache over its size cap
+        """
+        key = self.make_key(endpoint, resource_id)
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, data, stored_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(data), now, now)
+            )
+            if self.max_entries is not None:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+
+    def compact(self, transform):
+        """
+        Rewrites every entry as transform(endpoint, data), then shrinks the file to fit
+        Used to bring caches written before projection down to projected responses (see resource_projection.py)
+        Returns the file size in bytes before and after
+        """
+        size_before = os.path.getsize(self.path)
+        with self.lock, self.connection:
+            rows = self.connection.execute("SELECT key, data FROM responses").fetchall()
+            for key, data in rows:
+                endpoint = key.split('/', 1)[0]
+                self.connection.execute("UPDATE responses SET data = ? WHERE key = ?",
+                                        (json.dumps(transform(endpoint, json.loads(data))), key))
+        with self.lock:
+            self.connection.execute("VACUUM")
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # In WAL mode, the file only shrinks here
+        return size_before, os.path.getsize(self.path)
+
+    def delete(self, endpoint, resource_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (self.make_key(endpoint, resource_id),))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses")
+
+    def __contains__(self, key):
+        endpoint, resource_id = key
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT stored_at FROM responses WHERE key = ?", (self.make_key(endpoint, resource_id),)
+            ).fetchone()
+        return row is not None and not self.is_expired(row[0])
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,224 @@
+"""
+Persistent queue of PokeAPI resources that failed to fetch, so that they can be retried on their own later (see
+repair.py) rather than by re-running a whole generation
+
+Every fetch that fails transiently (a timeout, connection reset, 429 or 5xx) is recorded here by pokeapi_client and
+the async engine, one entry per (endpoint, resource id), and removed again by the next fetch of it that succeeds.
+Other errors, such as a 404 or a response that doesn't parse, would fail the same way every time, so they aren't
+queued. Each entry keeps its attempt count, last error and when it may next be tried, backing off exponentially with
+jitter between attempts, and is given up on after max_attempts. The queue lives in SQLite, like the response cache,
+so that threads and processes can all record to the same one. By default it sits next to the response cache, at an
+absolute path worked out once on import, so failures recorded from any working directory all end up in the same
+queue
+
+CircuitBreaker is there for whatever retries the queue: after enough consecutive failures it stops any more attempts
+for a while, so that an API that is down isn't hammered by every queued resource in turn
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import time
+from threading import Lock
+
+
+def get_default_queue_path():
+    """
+    Gets the default queue location, in the same XDG cache directory as pokeapi_client.get_default_cache_path
+    """
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(xdg_cache_home, "pokemon-data-analysis", "retry_queue.sqlite")
+
+
+DEFAULT_QUEUE_PATH = get_default_queue_path()
+
+
+def error_status(error):
+    # The HTTP status of a failed request, from requests (response.status_code) or aiohttp (status)
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None) or getattr(error, 'status', None)
+
+
+def is_network_error(error):
+    """
+    Whether an error without an HTTP status came from the connection: a timeout, reset, refused connection...
+    requests' exceptions are all OSErrors, but its JSON decoding errors are also ValueErrors, and aren't included
+    """
+    if isinstance(error, ValueError):
+        return False
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+
+    # Checked only if already imported, since an error can't have come from a library that never was
+    asyncio, aiohttp = sys.modules.get('asyncio'), sys.modules.get('aiohttp')
+    if asyncio is not None and isinstance(error, asyncio.TimeoutError):  # Not yet TimeoutError before Python 3.11
+        return True
+    return aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError)
+
+
+def is_transient(error):
+    """
+    Whether a failed fetch might succeed if tried again: connection errors and timeouts, rate limiting, and server
+    errors. Anything else, such as a response that doesn't parse or project (a KeyError), would fail the same way
+    """
+    status = error_status(error)
+    if status is None:
+        return is_network_error(error)
+    return status in (408, 429) or status >= 500
+
+
+def backoff_delay(attempts, base=2.0, cap=3600.0, rng=random):
+    """
+    Seconds to wait before the next attempt, doubling with each attempt up to cap. Half of the delay is random, so
+    resources that failed together aren't all retried at the same moment
+    """
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class RetryQueue:
+    """
+    Failed resources keyed by 'endpoint/resource id', in a SQLite file shared by every thread and process
+    - max_attempts: entries that have failed this many times are no longer due, and are reported as given up
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_attempts=8, base_delay=2.0, max_delay=3600.0):
+        self.path = os.path.abspath(path)  # Worker processes are handed the path, whatever their working directory
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "key TEXT PRIMARY KEY, endpoint TEXT NOT NULL, resource_id TEXT NOT NULL, attempts INTEGER NOT NULL, "
+                "first_failed REAL NOT NULL, last_failed REAL NOT NULL, next_attempt REAL NOT NULL, "
+                "last_error TEXT NOT NULL)"
+            )
+
+    def record(self, endpoint, resource_id, error):
+        """
+        Records a failed fetch, scheduling the resource's next attempt with backoff
+        """
+        key = f"{endpoint}/{resource_id}"
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT attempts FROM failures WHERE key = ?", (key,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            next_attempt = now + backoff_delay(attempts, self.base_delay, self.max_delay)
+            self.connection.execute(
+                "INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "attempts = excluded.attempts, last_failed = excluded.last_failed, "
+                "next_attempt = excluded.next_attempt, last_error = excluded.last_error",
+                (key, endpoint, str(resource_id), attempts, now, now, next_attempt, str(error) or type(error).__name__)
+            )
+
+    def resolve(self, endpoint, resource_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM failures WHERE key = ?", (f"{endpoint}/{resource_id}",))
+
+    def entries(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT endpoint, resource_id, attempts, first_failed, last_failed, next_attempt, last_error "
+                "FROM failures ORDER BY next_attempt"
+            ).fetchall()
+        names = ['endpoint', 'resource_id', 'attempts', 'first_failed', 'last_failed', 'next_attempt', 'last_error']
+        return [dict(zip(names, row)) for row in rows]
+
+    def due(self, now=None, ignore_backoff=False):
+        """
+        Entries whose backoff has passed (or all of them, with ignore_backoff), leaving out those given up on
+        """
+        now = time.time() if now is None else now
+        return [entry for entry in self.entries()
+                if entry['attempts'] < self.max_attempts and (ignore_backoff or entry['next_attempt'] <= now)]
+
+    def given_up(self):
+        return [entry for entry in self.entries() if entry['attempts'] >= self.max_attempts]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM failures").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, refusing attempts until reset_timeout seconds have passed.
+    Then a single trial attempt is let through: success closes the breaker again, and failure reopens it
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial_running and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial_running = True  # Half-open: one attempt decides whether to close again
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+
+# The queue fetch failures are recorded to, created on first use (see set_retry_queue)
+retry_queue = None
+queue_lock = Lock()
+
+
+def set_retry_queue(path=DEFAULT_QUEUE_PATH, **kwargs):
+    global retry_queue
+    with queue_lock:
+        retry_queue = RetryQueue(path, **kwargs)
+    return retry_queue
+
+
+def get_retry_queue():
+    global retry_queue
+    with queue_lock:
+        if retry_queue is None:
+            retry_queue = RetryQueue()
+        return retry_queue
+
+
+def record_failure(endpoint, resource_id, error):
+    if is_transient(error):
+        get_retry_queue().record(endpoint, resource_id, error)
+
+
+def record_success(endpoint, resource_id):
+    # A resource fetched by a later crawl no longer needs retrying by repair.py
+    get_retry_queue().resolve(endpoint, resource_id)
@@ -0,0 +1,165 @@
+"""
+One scheduler for any set of generations, splitting them into per-species tasks on a single shared work queue
+
+process_multiple_generations_in_parallel gives each generation its own thread, so a run lasts as long as its slowest
+generation, with the other workers idle towards the end. Here every species of every requested generation is its own
+task, and whichever worker is free takes the next one, so workers stay busy until the queue is empty. Tasks are
+queued most expensive first (by number of varieties, where the species is already cached), so that large species
+aren't left until last. Each generation's output is saved as soon as its final species finishes
+
+With use_processes set, the CPU-bound work (parsing and to_dict) runs in a process pool rather than under the GIL.
+Processes share the same on-disk response cache, and the same evolution chain records through it, so a resource
+fetched by one process is never fetched again by another
+
+Usage: python scheduler.py 1 2 3 --workers 8 --processes
+"""
+
+import argparse
+import os
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pokeapi_client
+import retry_queue
+from dataset_snapshot import snapshot_path, write_snapshot
+from evolution_index import EvolutionChainIndex
+from generation_datasets import process_pokemon_batch, save_output, setup_logging, write_logs
+from instrumentation import RunMetrics, error_logs, metrics, queued
+from pokemondata import PokemonData
+from refresh import write_manifest
+
+
+def generation_range(generation):
+    first_num = PokemonData.generation_start_dict[generation]
+    final_num = PokemonData.generation_start_dict.get(generation + 1, 1026)
+    return range(first_num, final_num)
+
+
+def generation_of(dex_num):
+    starts = sorted(PokemonData.generation_start_dict.items(), key=lambda item: item[1])
+    return starts[bisect_right([start for _, start in starts], dex_num) - 1][0]
+
+
+def estimated_cost(dex_num):
+    # Each variety is a further Pokémon lookup and row, so species with many forms take longest. This only reads
+    # what is already cached, and never makes a request just to plan
+    try:
+        species = pokeapi_client.get_cache().get('pokemon-species', dex_num)
+    except Exception:
+        species = None
+    return len(species['varieties']) if species else 1
+
+
+def init_worker(cache_path, max_entries, ttl, offline_mode, queue_path):
+    """
+    Points a worker process at the parent's response cache and retry queue, and shares evolution chain records
+    through the cache
+    """
+    cache = pokeapi_client.set_cache(cache_path, max_entries=max_entries, ttl=ttl, offline_mode=offline_mode)
+    retry_queue.set_retry_queue(queue_path)
+    PokemonData.evolution_index = EvolutionChainIndex(PokemonData.pseudo_base_forms, store=cache)
+
+
+def process_species(generation, dex_num, error_log_file, handle_varieties):
+    pokemon_data, logs = process_pokemon_batch([dex_num], error_log_file, handle_varieties)
+    error_logs.flush(error_log_file)  # Worker processes exit without running atexit handlers
+    return generation, dex_num, pokemon_data, logs
+
+
+def save_generation(generation, state, output_format, handle_varieties=True):
+    """
+    Writes a finished generation's logs, output and snapshot, with rows back in dex order whatever order species
+    finished in. CSV output also gets the manifest that refresh.py revalidates against
+    """
+    rows = [row for dex_num in sorted(state['rows']) for row in state['rows'][dex_num]]
+    finish_time = f"Finished generation {generation} in {datetime.now() - state['start_time']}"
+    print(finish_time)
+    state['logs'].append(finish_time)
+
+    try:
+        write_logs(state['logs'], state['processing_log_file'])
+        save_output(rows, state['output_file'], output_format)
+        write_snapshot(rows, snapshot_path(state['output_file']))
+        if output_format == 'csv':
+            dex_nums = generation_range(generation)
+            write_manifest(state['output_file'], dex_nums.start, dex_nums.stop, handle_varieties)
+        state['metrics'].write_summary(f'pokemon_run_gen{generation}.json')
+    except Exception as e:
+        error_message = f"Error processing generation {generation}: {str(e)}"
+        print(error_message)
+        with open(state['error_log_file'], 'a') as error_file:
+            error_file.write(f"{datetime.now()}: {error_message}\n")
+    return len(rows)
+
+
+def process_generations(generations, handle_varieties=True, max_workers=8, use_processes=False,
+                        output_format='csv'):
+    """
+    Processes any set of generations as per-species tasks on one shared queue, writing one output per generation
+    - use_processes: run tasks in a process pool sharing the response cache, rather than a thread pool
+    Returns {generation: number of rows written}, and writes a summary of the whole run to
+    pokemon_run_summary.json and of each generation's tasks to pokemon_run_gen<N>.json (with processes, fetches,
+    fields and queue waits are timed in the workers, so the summaries only cover the parent)
+    """
+    cache = pokeapi_client.get_cache()
+    generation_state = dict()
+    tasks = []
+
+    for generation in generations:
+        start_time, error_log_file, processing_log_file, output_file = setup_logging(generation)
+        dex_nums = generation_range(generation)
+        generation_state[generation] = {
+            'start_time': start_time, 'error_log_file': error_log_file, 'processing_log_file': processing_log_file,
+            'output_file': output_file, 'remaining': len(dex_nums), 'rows': dict(), 'logs': [],
+            'metrics': RunMetrics()
+        }
+        tasks.extend((estimated_cost(dex_num), generation, dex_num, error_log_file) for dex_num in dex_nums)
+
+    # Longest tasks first, so that the end of the run isn't waiting on one large species
+    tasks.sort(key=lambda task: -task[0])
+
+    if use_processes:
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=init_worker,
+            initargs=(getattr(cache, 'path', None), getattr(cache, 'max_entries', None), getattr(cache, 'ttl', None),
+                      pokeapi_client.offline, retry_queue.get_retry_queue().path)
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)  # Threads already share PokemonData.evolution_index
+
+    written = dict()
+    with executor, metrics.scope() as run_metrics:
+        # Queue timings are taken in the worker threads, which a process pool doesn't share. Each task is submitted
+        # in its generation's scope, which queued carries over to the worker thread
+        futures = []
+        for _, generation, dex_num, error_log_file in tasks:
+            with metrics.scope(generation_state[generation]['metrics']):
+                futures.append(executor.submit(process_species if use_processes else queued(process_species),
+                                               generation, dex_num, error_log_file, handle_varieties))
+
+        for future in as_completed(futures):
+            generation, dex_num, pokemon_data, logs = future.result()
+            state = generation_state[generation]
+            state['rows'][dex_num] = pokemon_data
+            state['logs'].extend(logs)
+            state['remaining'] -= 1
+
+            if not state['remaining']:
+                written[generation] = save_generation(generation, state, output_format, handle_varieties)
+                del generation_state[generation]  # Frees the generation's rows once they're saved
+
+    run_metrics.write_summary('pokemon_run_summary.json')
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process generations as per-species tasks on a shared queue")
+    parser.add_argument('generations', type=int, nargs='+')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--processes', action='store_true', help="Use a process pool rather than threads")
+    parser.add_argument('--no-varieties', action='store_true')
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'feather'])
+    args = parser.parse_args()
+
+    process_generations(args.generations, not args.no_varieties, args.workers, args.processes, args.format)
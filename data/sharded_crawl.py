@@ -0,0 +1,447 @@
+"""
+Sharded crawl across several machines: the dex range is split into deterministic shards, each crawled by its own
+worker into a sorted partial output, and the partial outputs are then merged back into the usual dataset files
+
+A plan splits the range into contiguous shards of roughly equal expected cost, where a species' cost is its number
+of varieties (see scheduler.estimated_cost) as far as the local cache knows, and 1 otherwise. The plan is identified
+by a hash of its ranges, so every worker and the merge can check they agree on it. Make the plan once and copy the
+file to every node, or leave out --costs, in which case every node works out the same uniform plan by itself
+
+Each worker crawls its shard through the crawl planner, streaming rows to disk with a checkpoint (so --resume carries
+on after a crash), and leaves shard_<i>_of_<N>.csv, sorted by dex number, next to shard_<i>_of_<N>.json. The
+manifest records the plan, the shard's range, its row count, header and file hash, the dex numbers that ended up
+with no rows, and those that failed (which a --resume run fetches again). The merge checks the manifests against
+each other before reading any rows: every shard of one plan present exactly once, ranges meeting without gaps or
+overlaps, files unchanged since they were written. It then
+streams a k-way merge of the shard files on dex number, one row per shard in memory at a time, into
+pokemon_data_gen<N>.csv files (or one pokemon_data_all.csv), refusing rows outside their shard's range and duplicate
+(dex number, name) rows. Outputs are written to temporary files and only moved into place once the merge succeeds
+
+Usage:
+    python sharded_crawl.py plan --shards 4 --costs --output plan.json
+    python sharded_crawl.py worker plan.json 0 --output-dir shards   # On each node, with its own shard number
+    python sharded_crawl.py merge shards --output-dir . [--whole]
+    python sharded_crawl.py local [api-data root] --shards 3 --end 152 --error-rate 0.2   # Locally, with a StubServer
+"""
+
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from bisect import bisect_left
+from datetime import datetime
+from itertools import accumulate
+
+import pokeapi_client
+import retry_queue
+from crawl_planner import process_pokemon_with_planner
+from dataset_schema import read_dataset
+from dataset_snapshot import snapshot_path, write_snapshot_from_csv
+from generation_datasets import process_pokemon_with_planner_in_chunks, save_output, write_logs
+from instrumentation import error_logs
+from scheduler import estimated_cost, generation_of
+from streaming_output import CheckpointedCsvWriter, dex_sort_key
+
+SHARD_FORMAT = 1
+FINAL_DEX_NUM = 1025
+
+
+def shard_ranges(start, end, shards, costs=None):
+    """
+    Splits [start, end) into shards contiguous (start, end) ranges, cutting where the running total of costs (one per
+    dex number, all 1 if not given) passes each multiple of total / shards. Every shard gets at least one dex number
+    """
+    count = end - start
+    if shards < 1 or shards > count:
+        raise ValueError(f"Can't split {count} dex numbers into {shards} shards")
+    costs = list(costs) if costs is not None else [1] * count
+    if len(costs) != count:
+        raise ValueError(f"Expected {count} costs, got {len(costs)}")
+
+    running = list(accumulate(costs))
+    total = running[-1]
+    bounds = [0]
+    for shard in range(1, shards):
+        cut = bisect_left(running, total * shard / shards) + 1
+        bounds.append(min(max(cut, bounds[-1] + 1), count - (shards - shard)))
+    bounds.append(count)
+    return [(start + low, start + high) for low, high in zip(bounds, bounds[1:])]
+
+
+def plan_id(ranges):
+    return hashlib.sha1(json.dumps([list(dex_range) for dex_range in ranges]).encode()).hexdigest()[:16]
+
+
+def make_plan(shards, start=1, end=FINAL_DEX_NUM + 1, use_costs=False):
+    """
+    A shard plan for [start, end). With use_costs set, shards are balanced by estimated_cost, which only reads the
+    local cache, so the plan then has to be shared with the workers rather than worked out again on each node
+    """
+    costs = [estimated_cost(dex_num) for dex_num in range(start, end)] if use_costs else None
+    ranges = shard_ranges(start, end, shards, costs)
+    return {
+        'format': SHARD_FORMAT, 'id': plan_id(ranges), 'start': start, 'end': end,
+        'shards': [list(dex_range) for dex_range in ranges], 'costs': 'varieties' if use_costs else 'uniform'
+    }
+
+
+def write_json(data, path):
+    # Written to a temporary file and renamed, so a reader never sees half of one
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'w') as file_manager:
+        json.dump(data, file_manager, indent=2)
+    os.replace(temporary_path, path)
+
+
+def load_plan(path):
+    with open(path) as file_manager:
+        plan = json.load(file_manager)
+    if plan.get('format') != SHARD_FORMAT or plan['id'] != plan_id(plan['shards']):
+        raise ValueError(f"{path} isn't a valid shard plan")
+    return plan
+
+
+def shard_name(shard, shards):
+    width = len(str(shards))
+    return f"shard_{shard:0{width}d}_of_{shards}"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file_manager:
+        for block in iter(lambda: file_manager.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_shard(output_file, plan, shard):
+    """
+    The manifest for a finished shard output, read back from disk so that it describes exactly what was written
+    """
+    start, end = plan['shards'][shard]
+    rows, dex_nums, previous = 0, set(), float('-inf')
+
+    with open(output_file, newline='') as file_manager:
+        reader = csv.DictReader(file_manager)
+        for row in reader:
+            key = dex_sort_key(row)
+            if key < previous:
+                raise ValueError(f"{output_file} isn't sorted by dex number")
+            previous = key
+            rows += 1
+            dex_nums.add(key)
+        fieldnames = reader.fieldnames or []
+
+    return {
+        'format': SHARD_FORMAT, 'plan': plan['id'], 'plan_shards': plan['shards'], 'shard': shard,
+        'shards': len(plan['shards']), 'range': [start, end], 'file': os.path.basename(output_file),
+        'sha256': file_hash(output_file), 'rows': rows, 'fieldnames': fieldnames,
+        'missing': [dex_num for dex_num in range(start, end) if dex_num not in dex_nums]
+    }
+
+
+def run_shard(plan, shard, output_dir='.', handle_varieties=True, chunk_size=80, max_workers=8, resume=False):
+    """
+    Crawls one shard of a plan into output_dir, returning its manifest
+    """
+    if not 0 <= shard < len(plan['shards']):
+        raise ValueError(f"Shard {shard} isn't in a plan of {len(plan['shards'])} shards")
+    start, end = plan['shards'][shard]
+    name = shard_name(shard, len(plan['shards']))
+    output_file = os.path.join(output_dir, f'{name}.csv')
+    error_log_file = os.path.join(output_dir, f'{name}_errors.txt')
+    processing_log_file = os.path.join(output_dir, f'{name}_processing.txt')
+    os.makedirs(output_dir, exist_ok=True)
+    start_time = datetime.now()
+    print(f"{start_time}: {name} of plan {plan['id']} crawling {start} to {end - 1}")
+
+    writer = CheckpointedCsvWriter(output_file, resume)
+
+    def write_batch(dex_nums, pokemon_data, logs, incomplete):
+        writer.write_batch(dex_nums, pokemon_data, incomplete)
+        if logs:
+            write_logs(logs, processing_log_file)
+
+    process_pokemon_with_planner_in_chunks(writer.remaining(range(start, end)), error_log_file, handle_varieties,
+                                           chunk_size, write_batch, max_workers=max_workers)
+    error_logs.flush(error_log_file)
+    incomplete = writer.remaining(range(start, end))
+    writer.merge(keep_parts=bool(incomplete))  # A --resume run then only fetches the incomplete dex numbers again
+
+    manifest = describe_shard(output_file, plan, shard)
+    manifest['incomplete'] = incomplete
+    write_json(manifest, os.path.join(output_dir, f'{name}.json'))
+    print(f"{datetime.now()}: {name} finished in {datetime.now() - start_time}, {manifest['rows']} rows, "
+          f"{len(manifest['missing'])} dex numbers without rows, {len(manifest['incomplete'])} incomplete")
+    return manifest
+
+
+def verify_shards(shard_dir):
+    """
+    Loads and cross-checks every shard manifest in shard_dir, returning them in shard order. Raises ValueError if
+    the shards don't come from one plan, don't cover it exactly, or don't match their files
+    """
+    manifests = []
+    for file_name in sorted(os.listdir(shard_dir)):
+        if file_name.startswith('shard_') and file_name.endswith('.json'):
+            with open(os.path.join(shard_dir, file_name)) as file_manager:
+                manifests.append(json.load(file_manager))
+    if not manifests:
+        raise ValueError(f"No shard manifests in {shard_dir}")
+
+    plans = {manifest['plan'] for manifest in manifests}
+    if len(plans) > 1:
+        raise ValueError(f"Shards from different plans: {sorted(plans)}")
+    plan_shards = manifests[0]['plan_shards']
+    if plan_id(plan_shards) != manifests[0]['plan']:
+        raise ValueError(f"Shard manifests don't match their plan {manifests[0]['plan']}")
+
+    by_shard = dict()
+    for manifest in manifests:
+        if manifest['shard'] in by_shard:
+            raise ValueError(f"Shard {manifest['shard']} appears more than once")
+        by_shard[manifest['shard']] = manifest
+    absent = [shard for shard in range(len(plan_shards)) if shard not in by_shard]
+    if absent or len(by_shard) != len(plan_shards):
+        raise ValueError(f"Missing shards {absent} of {len(plan_shards)}")
+
+    manifests = [by_shard[shard] for shard in range(len(plan_shards))]
+    for previous, manifest in zip([None] + manifests, manifests):
+        if manifest['range'] != plan_shards[manifest['shard']]:
+            raise ValueError(f"Shard {manifest['shard']} covers {manifest['range']}, but the plan has "
+                             f"{plan_shards[manifest['shard']]}")
+        if previous is not None and previous['range'][1] != manifest['range'][0]:
+            raise ValueError(f"Shards {previous['shard']} and {manifest['shard']} leave a gap or overlap")
+
+        path = os.path.join(shard_dir, manifest['file'])
+        if not os.path.exists(path) or file_hash(path) != manifest['sha256']:
+            raise ValueError(f"{path} is missing or has changed since its shard finished")
+
+    headers = {tuple(manifest['fieldnames']) for manifest in manifests if manifest['rows']}
+    if len(headers) > 1:
+        raise ValueError("Shard outputs have different columns")
+    return manifests
+
+
+def shard_rows(reader, manifest):
+    # A shard's rows, refusing any outside the shard's own range or out of order (which would hide duplicates)
+    start, end = manifest['range']
+    previous = float('-inf')
+    for row in reader:
+        key = dex_sort_key(row)
+        if key != float('inf') and not start <= key < end:
+            raise ValueError(f"Shard {manifest['shard']} has a row for {key}, outside its range {start} to {end - 1}")
+        if key < previous:
+            raise ValueError(f"Shard {manifest['shard']} isn't sorted by dex number at {key}")
+        previous = key
+        yield row
+
+
+def merge_shards(shard_dir, output_dir='.', whole=False, snapshot=True):
+    """
+    Verifies the shards in shard_dir and merges them into pokemon_data_gen<N>.csv files in output_dir (or one
+    pokemon_data_all.csv with whole set), along with their snapshots. Returns a report of the rows written per file
+    and the dex numbers without rows. Rows whose dex number didn't parse are only kept in whole output
+    """
+    manifests = verify_shards(shard_dir)
+    fieldnames = next((manifest['fieldnames'] for manifest in manifests if manifest['rows']), None)
+    if fieldnames is None:
+        raise ValueError(f"No shard in {shard_dir} has any rows")
+    os.makedirs(output_dir, exist_ok=True)
+
+    outputs = dict()  # Output file -> (temporary path, file manager, writer, rows written)
+    file_managers = [open(os.path.join(shard_dir, manifest['file']), newline='') for manifest in manifests]
+    report = {'plan': manifests[0]['plan'], 'files': dict(), 'unplaced': 0,
+              'missing': [dex_num for manifest in manifests for dex_num in manifest['missing']]}
+    try:
+        readers = [shard_rows(csv.DictReader(file_manager), manifest)
+                   for file_manager, manifest in zip(file_managers, manifests)]
+        current, names = None, set()
+
+        for row in heapq.merge(*readers, key=dex_sort_key):
+            key = dex_sort_key(row)
+            if key != current:
+                current, names = key, set()
+            if key != float('inf'):
+                if row['name'] in names:
+                    raise ValueError(f"Duplicate row for {key} {row['name']}")
+                names.add(row['name'])
+
+            if whole:
+                output_file = os.path.join(output_dir, 'pokemon_data_all.csv')
+            elif key == float('inf'):
+                report['unplaced'] += 1
+                continue
+            else:
+                output_file = os.path.join(output_dir, f'pokemon_data_gen{generation_of(key)}.csv')
+
+            if output_file not in outputs:
+                temporary_path = f"{output_file}.merging"
+                output = open(temporary_path, 'w', newline='')
+                outputs[output_file] = [temporary_path, output, csv.DictWriter(output, fieldnames=fieldnames), 0]
+                outputs[output_file][2].writeheader()
+            outputs[output_file][2].writerow(row)
+            outputs[output_file][3] += 1
+    except Exception:
+        for temporary_path, output, _, _ in outputs.values():
+            output.close()
+            os.remove(temporary_path)
+        raise
+    finally:
+        for file_manager in file_managers:
+            file_manager.close()
+
+    # Only moved into place once every shard has merged cleanly
+    for output_file, (temporary_path, output, _, rows) in outputs.items():
+        output.close()
+        os.replace(temporary_path, output_file)
+        report['files'][output_file] = rows
+        if snapshot:
+            write_snapshot_from_csv(output_file, snapshot_path(output_file))
+
+    print(f"{datetime.now()}: merged {len(manifests)} shards of plan {report['plan']}: {report['files']}, "
+          f"{len(report['missing'])} dex numbers without rows, {report['unplaced']} rows without a dex number")
+    return report
+
+
+def use_api(base_url=None, cache_path=None, queue_path=None):
+    # Points this process at another API (e.g. a StubServer) and its own cache and retry queue
+    if base_url:
+        pokeapi_client.BASE_URL = base_url
+    if cache_path:
+        pokeapi_client.set_cache(cache_path)
+    if queue_path:
+        retry_queue.set_retry_queue(queue_path)
+
+
+def run_workers(plan_file, shards, shard_dir, base_url, handle_varieties, resume=False):
+    # One process per shard, each with its own cache and retry queue as if on its own node
+    workers = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker', plan_file, str(shard),
+                          '--output-dir', shard_dir, '--base-url', base_url,
+                          '--cache', os.path.join(shard_dir, f'cache_{shard}.sqlite'),
+                          '--queue', os.path.join(shard_dir, f'retry_queue_{shard}.sqlite')]
+                         + ([] if handle_varieties else ['--no-varieties']) + (['--resume'] if resume else []))
+        for shard in shards
+    ]
+    return [shard for shard, worker in zip(shards, workers) if worker.wait() != 0]
+
+
+def run_local(root=None, shards=3, start=1, end=152, work_dir=None, handle_varieties=True, whole=False,
+              error_rate=0.0):
+    """
+    Runs a sharded crawl end to end on this machine against a StubServer serving the responses in root (a fixture
+    tree from fixture_tree.py, written into the work directory, if root isn't given): one worker process per shard,
+    then the merge. The merged output is compared with a single unsharded crawl of the same range. Returns whether
+    they match
+    With error_rate set, that proportion of the workers' requests fail, and every shard left with incomplete dex
+    numbers is run again with --resume against a healthy server before the merge, as after a crash
+    """
+    from stub_server import StubServer  # Only needed for local runs
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix='sharded-crawl-')
+    shard_dir = os.path.join(work_dir, 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    plan_file = os.path.join(work_dir, 'plan.json')
+    write_json(make_plan(shards, start, end), plan_file)
+    if root is None:
+        from fixture_tree import write_fixture_tree
+
+        root = os.path.join(work_dir, 'fixture_tree')
+        write_fixture_tree(root, range(start, end))
+
+    with StubServer(root, error_rate=error_rate, seed=0) as stub:
+        failed_workers = run_workers(plan_file, range(shards), shard_dir, stub.base_url, handle_varieties)
+
+        stub.error_rate = 0.0
+        resumed = [manifest['shard'] for manifest in verify_shards(shard_dir) if manifest['incomplete']]
+        if resumed and not failed_workers:
+            print(f"Resuming shards {resumed}")
+            failed_workers = run_workers(plan_file, resumed, shard_dir, stub.base_url, handle_varieties, resume=True)
+        if failed_workers:
+            print(f"Shard workers {failed_workers} failed")
+            return False
+
+        report = merge_shards(shard_dir, os.path.join(work_dir, 'merged'), whole)
+
+        use_api(stub.base_url, os.path.join(work_dir, 'reference.sqlite'),
+                os.path.join(work_dir, 'reference_retry_queue.sqlite'))
+        rows, _, _ = process_pokemon_with_planner(start, end, os.path.join(work_dir, 'reference_errors.txt'),
+                                                  handle_varieties)
+
+    reference_file = os.path.join(work_dir, 'reference.csv')
+    save_output(rows, reference_file)
+    merged = read_dataset(sorted(report['files'], key=dex_order))
+    matches = merged.equals(read_dataset(reference_file))
+    print(f"{'Merged output matches' if matches else 'Merged output differs from'} the unsharded crawl "
+          f"({len(merged)} rows, work directory {work_dir})")
+    return matches
+
+
+def dex_order(path):
+    # Generation outputs in dex order, which isn't the order of their file names past generation 9
+    with open(path, newline='') as file_manager:
+        return dex_sort_key(next(csv.DictReader(file_manager)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl the dex in deterministic shards and merge the results")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = commands.add_parser('plan', help="Split the dex range into shards")
+    plan_parser.add_argument('--shards', type=int, required=True)
+    plan_parser.add_argument('--start', type=int, default=1)
+    plan_parser.add_argument('--end', type=int, default=FINAL_DEX_NUM + 1, help="One past the last dex number")
+    plan_parser.add_argument('--costs', action='store_true', help="Balance by variety counts in the local cache")
+    plan_parser.add_argument('--cache', default=None, help="The response cache to read variety counts from")
+    plan_parser.add_argument('--output', default='shard_plan.json')
+
+    worker_parser = commands.add_parser('worker', help="Crawl one shard of a plan")
+    worker_parser.add_argument('plan', help="A plan file, or a number of shards for a uniform plan of the whole dex")
+    worker_parser.add_argument('shard', type=int)
+    worker_parser.add_argument('--output-dir', default='shards')
+    worker_parser.add_argument('--resume', action='store_true')
+    worker_parser.add_argument('--no-varieties', action='store_true')
+    worker_parser.add_argument('--workers', type=int, default=8)
+    worker_parser.add_argument('--base-url', default=None)
+    worker_parser.add_argument('--cache', default=None)
+    worker_parser.add_argument('--queue', default=None)
+
+    merge_parser = commands.add_parser('merge', help="Verify and merge finished shards")
+    merge_parser.add_argument('shard_dir')
+    merge_parser.add_argument('--output-dir', default='.')
+    merge_parser.add_argument('--whole', action='store_true', help="One file for the whole dex, not per generation")
+    merge_parser.add_argument('--no-snapshot', action='store_true')
+
+    local_parser = commands.add_parser('local', help="Run every shard and the merge locally against a StubServer")
+    local_parser.add_argument('root', nargs='?', default=None,
+                              help="Responses laid out like the api-data dump (default: a generated fixture tree)")
+    local_parser.add_argument('--shards', type=int, default=3)
+    local_parser.add_argument('--start', type=int, default=1)
+    local_parser.add_argument('--end', type=int, default=152)
+    local_parser.add_argument('--work-dir', default=None)
+    local_parser.add_argument('--whole', action='store_true')
+    local_parser.add_argument('--no-varieties', action='store_true')
+    local_parser.add_argument('--error-rate', type=float, default=0.0,
+                              help="Fail this proportion of the workers' requests, then resume them")
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        use_api(cache_path=args.cache)
+        write_json(make_plan(args.shards, args.start, args.end, args.costs), args.output)
+        print(f"Wrote {args.output}: {load_plan(args.output)['shards']}")
+    elif args.command == 'worker':
+        use_api(args.base_url, args.cache, args.queue)
+        shard_plan = make_plan(int(args.plan)) if args.plan.isdigit() else load_plan(args.plan)
+        run_shard(shard_plan, args.shard, args.output_dir, not args.no_varieties, max_workers=args.workers,
+                  resume=args.resume)
+    elif args.command == 'merge':
+        merge_shards(args.shard_dir, args.output_dir, args.whole, not args.no_snapshot)
+    else:
+        sys.exit(0 if run_local(args.root, args.shards, args.start, args.end, args.work_dir, not args.no_varieties,
+                                args.whole, args.error_rate) else 1)
@@ -0,0 +1,257 @@
+"""
+Generative stat spreads: samples plausible stat spreads for a type and evolutionary stage, e.g. "give me a stat spread
+for a base form Electric-type Pokémon"
+
+Stats are modelled as a multivariate normal over log stats, so sampled stats are always positive and skewed the way
+real ones are. A model is fitted for every condition in one batched pass: everything, each evolutionary stage, each
+type, and each (type, stage) pair. Rows are assigned to all of their groups at once, and every group's mean and
+covariance come from the same scatter-add of log stats and their outer products. Groups with few members are shrunk
+towards their parent ((type, stage) towards the stage, and a stage or type towards everything), weighted by members
+against the shrinkage, so rare combinations still get a plausible spread rather than a degenerate one
+
+Samples are drawn as one batch through each condition's Cholesky factor, then constrained without any rejection loop:
+each spread is scaled so its BST falls inside the BST range of its condition, then rounded and clipped to 1-255, with
+any rounding drift put back onto its largest stat
+
+Fitted models are cached by a hash of the columns they read (plus the filter and shrinkage), in memory and optionally
+on disk, so repeated queries against the same data never refit
+
+Usage:
+    python stat_sampler.py pokemon_data_gen*.csv --type electric --stage 0 --count 10 --is_legendary False
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import STAT_COLUMNS, matches_schema, to_typed_frame
+from eda_report import group_codes
+from type_coverage import dataset_version, filter_mask, parse_flag_value
+from type_effectiveness import TYPES
+
+STAGES = [-1, 0, 1, 2]  # Single-stage, unevolved, first and second evolutions
+MIN_STAT, MAX_STAT = 1, 255
+MODEL_COLUMNS = STAT_COLUMNS + ['types', 'evolutionary_stage']
+
+# Model cache key -> StatSpreadModel
+fitted_models = dict()
+
+
+def condition_keys():
+    """
+    Every condition a model is fitted for, as (type, stage) with None meaning any, with parents before children
+    """
+    return ([(None, None)] + [(None, stage) for stage in STAGES] + [(type_name, None) for type_name in TYPES]
+            + [(type_name, stage) for type_name in TYPES for stage in STAGES])
+
+
+def group_memberships(df, stage_codes):
+    """
+    Every (row, condition position) membership, following the order of condition_keys
+    """
+    type_rows, type_codes, _ = group_codes(df, 'type')
+    staged_rows = np.flatnonzero(stage_codes >= 0)
+    staged_types = stage_codes[type_rows] >= 0
+
+    stage_offset = 1
+    type_offset = stage_offset + len(STAGES)
+    pair_offset = type_offset + len(TYPES)
+
+    rows = np.concatenate([np.arange(len(df)), staged_rows, type_rows, type_rows[staged_types]])
+    groups = np.concatenate([
+        np.zeros(len(df), dtype=np.int64),
+        stage_offset + stage_codes[staged_rows],
+        type_offset + type_codes,
+        pair_offset + type_codes[staged_types] * len(STAGES) + stage_codes[type_rows[staged_types]],
+    ])
+    return rows, groups
+
+
+def parent_positions():
+    # Where each condition is shrunk towards: (type, stage) to the stage, everything else to the whole dataset
+    return np.array([0 if type_name is None or stage is None else 1 + STAGES.index(stage)
+                     for type_name, stage in condition_keys()])
+
+
+def fit_parameters(df, shrinkage=10):
+    """
+    Fits every condition at once, returning (member counts, log stat means, log stat covariances, BST bounds)
+    """
+    stats = np.column_stack([df[stat].to_numpy(dtype=float, na_value=np.nan) for stat in STAT_COLUMNS])
+    complete = np.all(stats > 0, axis=1)  # Also drops rows with missing stats, since NaN > 0 is False
+    if complete.sum() < 2:
+        raise ValueError("Not enough Pokémon with complete stats to fit a model")
+    df, stats = df[complete].reset_index(drop=True), stats[complete]
+
+    stages = df['evolutionary_stage'].to_numpy(dtype=float, na_value=np.nan)
+    stage_codes = np.full(len(df), -1, dtype=np.int64)
+    for code, stage in enumerate(STAGES):
+        stage_codes[stages == stage] = code
+
+    rows, groups = group_memberships(df, stage_codes)
+    group_count = len(condition_keys())
+    log_stats = np.log(stats)[rows]
+    bst = stats.sum(axis=1)[rows]
+
+    counts = np.bincount(groups, minlength=group_count).astype(float)
+    sums = np.zeros((group_count, len(STAT_COLUMNS)))
+    np.add.at(sums, groups, log_stats)
+    products = np.zeros((group_count, len(STAT_COLUMNS), len(STAT_COLUMNS)))
+    np.add.at(products, groups, log_stats[:, :, None] * log_stats[:, None, :])
+    bst_bounds = np.column_stack([np.full(group_count, np.inf), np.full(group_count, -np.inf)])
+    np.minimum.at(bst_bounds[:, 0], groups, bst)
+    np.maximum.at(bst_bounds[:, 1], groups, bst)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts[:, None]
+        covariances = products / counts[:, None, None] - means[:, :, None] * means[:, None, :]
+
+    # Shrunk a level at a time (stages and types, then pairs), so that every parent is already shrunk when used
+    parents = parent_positions()
+    pair_offset = 1 + len(STAGES) + len(TYPES)
+    for level in (slice(1, pair_offset), slice(pair_offset, group_count)):
+        parent = parents[level]
+        with np.errstate(invalid='ignore'):  # Empty groups with no shrinkage, which take their parent's anyway
+            weight = np.nan_to_num(counts[level] / (counts[level] + shrinkage))
+        means[level] = np.where(counts[level, None] > 0, weight[:, None] * np.nan_to_num(means[level]), 0) \
+            + (1 - weight)[:, None] * means[parent]
+        covariances[level] = np.where(counts[level, None, None] > 0,
+                                      weight[:, None, None] * np.nan_to_num(covariances[level]), 0) \
+            + (1 - weight)[:, None, None] * covariances[parent]
+
+        # Too few members to trust their own BST range, so the parent's range is included too
+        few = counts[level] < shrinkage
+        bst_bounds[level, 0] = np.where(few, np.minimum(bst_bounds[level, 0], bst_bounds[parent, 0]),
+                                        bst_bounds[level, 0])
+        bst_bounds[level, 1] = np.where(few, np.maximum(bst_bounds[level, 1], bst_bounds[parent, 1]),
+                                        bst_bounds[level, 1])
+
+    return counts.astype(np.int64), means, covariances, bst_bounds
+
+
+def constrain(stats, bst_min, bst_max):
+    """
+    Turns continuous samples into valid stat spreads, in place of rejection sampling: each spread is scaled so its BST
+    lies in [bst_min, bst_max], then rounded and clipped to MIN_STAT-MAX_STAT, with the rounding drift added back to
+    its largest stat
+    """
+    bst = stats.sum(axis=1)
+    stats = stats * (np.clip(bst, bst_min, bst_max) / bst)[:, None]
+    target = np.rint(stats.sum(axis=1))
+    stats = np.clip(np.rint(stats), MIN_STAT, MAX_STAT)
+
+    rows = np.arange(len(stats))
+    largest = stats.argmax(axis=1)
+    stats[rows, largest] = np.clip(stats[rows, largest] + target - stats.sum(axis=1), MIN_STAT, MAX_STAT)
+    return stats.astype(np.int16)
+
+
+class StatSpreadModel:
+    """
+    Fitted log stat distributions for every (type, stage) condition, with None meaning any type or stage
+    """
+
+    def __init__(self, counts, means, covariances, bst_bounds):
+        self.keys = condition_keys()
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.counts = counts  # (conditions,) members before shrinkage
+        self.means = means  # (conditions, stats)
+        self.covariances = covariances  # (conditions, stats, stats)
+        self.bst_bounds = bst_bounds  # (conditions, 2)
+        # A small ridge keeps every factorisation possible, even for a condition whose members are all identical
+        self.factors = np.linalg.cholesky(covariances + 1e-9 * np.eye(len(STAT_COLUMNS)))
+
+    def position(self, type_name=None, stage=None):
+        key = (type_name.lower() if type_name else None, None if stage is None else int(stage))
+        if key not in self.positions:
+            raise ValueError(f"Unknown condition: type {type_name}, stage {stage}")
+        return self.positions[key]
+
+    def sample(self, size, type_name=None, stage=None, seed=None):
+        """
+        Draws size stat spreads for a condition as one (size, 6) integer array, in STAT_COLUMNS order
+        """
+        position = self.position(type_name, stage)
+        normals = np.random.default_rng(seed).standard_normal((size, len(STAT_COLUMNS)))
+        log_stats = self.means[position] + normals @ self.factors[position].T
+        return constrain(np.exp(log_stats), *self.bst_bounds[position])
+
+    def sample_frame(self, size, type_name=None, stage=None, seed=None):
+        stats = self.sample(size, type_name, stage, seed)
+        frame = pd.DataFrame(stats, columns=STAT_COLUMNS)
+        frame.insert(0, 'bst', stats.sum(axis=1, dtype=np.int32))
+        return frame
+
+    def summary(self):
+        """
+        One row per condition, with its member count, typical (geometric mean) stats and BST range
+        """
+        frame = pd.DataFrame(np.exp(self.means).round(1), columns=STAT_COLUMNS,
+                             index=pd.MultiIndex.from_tuples(self.keys, names=['type', 'evolutionary_stage']))
+        frame.insert(0, 'count', self.counts)
+        frame['bst_min'], frame['bst_max'] = self.bst_bounds[:, 0], self.bst_bounds[:, 1]
+        return frame
+
+    def save(self, path):
+        np.savez(path, counts=self.counts, means=self.means, covariances=self.covariances,
+                 bst_bounds=self.bst_bounds)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['counts'], arrays['means'], arrays['covariances'], arrays['bst_bounds'])
+
+
+def fit(data, shrinkage=10, cache_dir=None, **flags):
+    """
+    Returns the StatSpreadModel for a dataset, fitting it only if this data hasn't been fitted before
+    - shrinkage: how many members a condition needs before its own distribution counts as much as its parent's
+    - cache_dir: also keeps fitted models on disk, so that they survive between runs
+    - flags: column=value filters on the rows fitted, as in type_coverage.filter_mask (e.g. is_legendary=False)
+    """
+    # Hashed before any conversion, so that a cached model is returned without building a typed frame
+    raw = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    filters = tuple(sorted((column, str(value)) for column, value in flags.items()))
+    key = (dataset_version(raw, MODEL_COLUMNS + list(flags)), shrinkage, filters)
+    if key in fitted_models:
+        return fitted_models[key]
+
+    path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"stat_model_{hashlib.sha1(repr(key).encode()).hexdigest()[:16]}.npz")
+
+    if path is not None and os.path.exists(path):
+        model = StatSpreadModel.load(path)
+    else:
+        df = (raw if matches_schema(raw) else to_typed_frame(raw)).reset_index(drop=True)
+        fitted = df[filter_mask(df, **flags)] if flags else df
+        model = StatSpreadModel(*fit_parameters(fitted, shrinkage))
+        if path is not None:
+            model.save(path)
+
+    fitted_models[key] = model
+    return model
+
+
+if __name__ == "__main__":
+    from dataset_schema import read_dataset
+
+    parser = argparse.ArgumentParser(description="Sample stat spreads for a type and evolutionary stage")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--type', dest='type_name', default=None)
+    parser.add_argument('--stage', type=int, default=None, choices=STAGES)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--shrinkage', type=float, default=10)
+    parser.add_argument('--cache-dir', default=None)
+    args, unknown = parser.parse_known_args()
+
+    # Any other --column value pairs are filters, e.g. --is_legendary False --is_mega False
+    filter_flags = {unknown[i].lstrip('-'): parse_flag_value(unknown[i + 1]) for i in range(0, len(unknown) - 1, 2)}
+
+    stat_model = fit(read_dataset(args.paths), args.shrinkage, args.cache_dir, **filter_flags)
+    print(stat_model.sample_frame(args.count, args.type_name, args.stage, args.seed).to_string())
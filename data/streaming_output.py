@@ -0,0 +1,187 @@
+"""
+Streaming output for generation runs, so that rows are written to disk as each batch completes rather than being held
+in memory until the whole generation is done
+
+Each completed batch is written as its own dex-sorted run file, and then recorded in a checkpoint file. On restart
+with resume set, dex numbers in the checkpoint are skipped, so only unfinished batches are fetched again. Dex numbers
+that failed (wholly, or for some of their varieties) are checkpointed as incomplete, so that a resumed run fetches
+them again, and their rows from the failed attempt are left out of the merge once they have been redone. Once every
+batch is done, the run files are combined with a streaming k-way merge into the final dex-sorted CSV
+"""
+
+import csv
+import heapq
+import os
+import shutil
+from itertools import count
+
+
+def dex_sort_key(row):
+    # Rows that failed to parse a dex number sort last, rather than breaking the merge
+    try:
+        return int(row['dex_num'])
+    except (TypeError, ValueError):
+        return float('inf')
+
+
+def live_rows(reader, skip):
+    # A function of its own, so that each run file's generator keeps its own dex numbers to skip
+    return (row for row in reader if dex_sort_key(row) not in skip)
+
+
+class CheckpointedCsvWriter:
+    """
+    Writes batches of rows for a single output file, keeping them in <output_file>.parts until merged
+    - resume: keep the run files and checkpoint left by an interrupted run, rather than starting afresh
+    """
+
+    def __init__(self, output_file, resume=False):
+        self.output_file = output_file
+        self.parts_dir = f"{output_file}.parts"
+        self.checkpoint_file = os.path.join(self.parts_dir, 'checkpoint.txt')
+
+        if not resume and os.path.isdir(self.parts_dir):
+            shutil.rmtree(self.parts_dir)
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+        self.parts, self.completed, self.batches = self.read_checkpoint()
+        self.discard_unrecorded_parts()
+        self.part_numbers = count(len(self.parts))
+
+    def read_checkpoint(self):
+        """
+        Each checkpoint line is a run file followed by the dex numbers it covers, with a ! before those that are
+        incomplete. Returns (run files, completed dex numbers, {run file: (its dex numbers, the incomplete ones)})
+        """
+        parts = []
+        completed = set()
+        batches = dict()
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as file_manager:
+                for line in file_manager:
+                    fields = line.split()
+                    if fields:
+                        dex_nums = {int(field.lstrip('!')) for field in fields[1:]}
+                        incomplete = {int(field[1:]) for field in fields[1:] if field.startswith('!')}
+                        parts.append(fields[0])
+                        batches[fields[0]] = dex_nums, incomplete
+                        completed = (completed | dex_nums) - incomplete
+        return parts, completed, batches
+
+    def discard_unrecorded_parts(self):
+        # Run files that never made it into the checkpoint belong to batches that will be redone
+        for file_name in os.listdir(self.parts_dir):
+            if file_name.startswith('part_') and file_name not in self.parts:
+                os.remove(os.path.join(self.parts_dir, file_name))
+
+    def remaining(self, dex_nums):
+        return [dex_num for dex_num in dex_nums if dex_num not in self.completed]
+
+    def write_batch(self, dex_nums, rows, incomplete=()):
+        """
+        Writes a completed batch, making it durable before it is recorded as done
+        - incomplete: dex numbers in the batch that failed, which remaining() will return again
+        """
+        incomplete = set(incomplete)
+        part = f"part_{next(self.part_numbers):05d}.csv"
+        path = os.path.join(self.parts_dir, part)
+
+        if rows:
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, 'w', newline='') as file_manager:
+                writer = csv.DictWriter(file_manager, fieldnames=list(rows[0].keys()))
+                writer.writeheader()
+                writer.writerows(sorted(rows, key=dex_sort_key))
+                file_manager.flush()
+                os.fsync(file_manager.fileno())
+            os.replace(temporary_path, path)
+
+        with open(self.checkpoint_file, 'a') as file_manager:
+            file_manager.write(" ".join([part] + [f"!{dex_num}" if dex_num in incomplete else str(dex_num)
+                                                  for dex_num in dex_nums]) + "\n")
+            file_manager.flush()
+            os.fsync(file_manager.fileno())
+
+        self.parts.append(part)
+        self.batches[part] = set(dex_nums), incomplete
+        self.completed = (self.completed | set(dex_nums)) - incomplete
+
+    def superseded(self):
+        """
+        {run file: dex numbers whose rows it holds from a failed attempt that a later batch has redone}
+        """
+        superseded = dict()
+        redone = set()
+        for part in reversed(self.parts):
+            dex_nums, incomplete = self.batches[part]
+            superseded[part] = incomplete & redone
+            redone |= dex_nums
+        return superseded
+
+    def merge(self, keep_parts=False):
+        """
+        Streams every run file through a k-way merge on dex number into the final output file
+        Only one row per run file is held in memory at a time
+        """
+        superseded = self.superseded()
+        # Batches with no rows have no run file
+        parts = [part for part in self.parts if os.path.exists(os.path.join(self.parts_dir, part))]
+
+        file_managers = [open(os.path.join(self.parts_dir, part), newline='') for part in parts]
+        try:
+            readers = [csv.DictReader(file_manager) for file_manager in file_managers]
+            fieldnames = readers[0].fieldnames if readers else []
+            readers = [live_rows(reader, superseded[part]) for reader, part in zip(readers, parts)]
+
+            with open(self.output_file, 'w', newline='') as output:
+                writer = csv.DictWriter(output, fieldnames=fieldnames)
+                writer.writeheader()
+                writer.writerows(heapq.merge(*readers, key=dex_sort_key))
+        finally:
+            for file_manager in file_managers:
+                file_manager.close()
+
+        if not keep_parts:
+            shutil.rmtree(self.parts_dir)
+
+
+def contiguous_ranges(dex_nums, max_length):
+    """
+    Splits sorted dex numbers into (start, end) ranges of consecutive numbers, each at most max_length long
+    """
+    ranges = []
+    for dex_num in dex_nums:
+        if ranges and ranges[-1][1] == dex_num and ranges[-1][1] - ranges[-1][0] < max_length:
+            ranges[-1][1] = dex_num + 1
+        else:
+            ranges.append([dex_num, dex_num + 1])
+    return [tuple(dex_range) for dex_range in ranges]
+
+
+def check_resume_merge():
+    """
+    Writes a batch with a dex number marked incomplete, resumes, redoes it and merges, returning the merged rows if
+    the failed attempt's rows were left out, and raising AssertionError otherwise
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, 'output.csv')
+        writer = CheckpointedCsvWriter(output_file)
+        writer.write_batch([1, 2], [{'dex_num': 1, 'name': 'a'}, {'dex_num': 2, 'name': 'b'}], incomplete=[2])
+
+        writer = CheckpointedCsvWriter(output_file, resume=True)
+        assert writer.remaining([1, 2]) == [2]
+        writer.write_batch([2], [{'dex_num': 2, 'name': 'b'}, {'dex_num': 2, 'name': 'b-alt'}])
+        writer.write_batch([3], [{'dex_num': 3, 'name': 'c'}])
+        writer.merge()
+
+        with open(output_file, newline='') as file_manager:
+            rows = [(row['dex_num'], row['name']) for row in csv.DictReader(file_manager)]
+    assert rows == [('1', 'a'), ('2', 'b'), ('2', 'b-alt'), ('3', 'c')], rows
+    return rows
+
+
+if __name__ == "__main__":
+    # python streaming_output.py checks that a resumed run merges without the rows it redid
+    print(f"Resumed merge OK: {check_resume_merge()}")
@@ -0,0 +1,169 @@
+"""
+A local stand-in for PokeAPI, serving recorded JSON so that the fetch engines can be run and measured without
+touching the real API
+
+Recorded responses are read from a directory laid out like PokeAPI's static api-data dump:
+    <root>/api/v2/<endpoint>/<id>/index.json
+Resources can be requested by id or, where the response has a name, by name. Responses carry an ETag, so
+conditional requests are answered with 304 Not Modified. Latency (with jitter), 429 and 500 responses can be injected
+
+Usage: python stub_server.py <root> [--port 8000] [--latency 0.05] [--jitter 0.02] [--rate-limit-rate 0.1]
+                              [--error-rate 0.01]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+
+def load_responses(root):
+    """
+    Reads every recorded response under root into a dictionary keyed by (endpoint, id or name)
+    """
+    responses = dict()
+    api_root = os.path.join(root, 'api', 'v2')
+
+    for endpoint in os.listdir(api_root):
+        endpoint_dir = os.path.join(api_root, endpoint)
+        for resource_id in os.listdir(endpoint_dir):
+            path = os.path.join(endpoint_dir, resource_id, 'index.json')
+            if not os.path.isfile(path):
+                continue
+
+            with open(path, 'rb') as file_manager:
+                body = file_manager.read()
+
+            responses[(endpoint, resource_id)] = body
+            name = json.loads(body).get('name')
+            if name:
+                responses[(endpoint, name)] = body
+
+    return responses
+
+
+class StubServer:
+    """
+    Serves recorded PokeAPI responses from a background thread
+    - latency: seconds added to every response
+    - jitter: up to this many further seconds added to each response, drawn uniformly
+    - rate_limit_rate: proportion of requests answered with 429 Too Many Requests (with a Retry-After header)
+    - error_rate: proportion of requests answered with 500 Internal Server Error
+    - seed: makes the injected jitter and error responses reproducible
+    """
+
+    def __init__(self, root, port=0, latency=0.0, rate_limit_rate=0.0, retry_after=1, seed=None, jitter=0.0,
+                 error_rate=0.0):
+        self.responses = load_responses(root)
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = Lock()
+        self.request_counts = {'ok': 0, 'not_modified': 0, 'not_found': 0, 'rate_limited': 0, 'server_error': 0}
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v2"
+
+    def count(self, outcome):
+        with self.lock:
+            self.request_counts[outcome] += 1
+
+    def draw(self):
+        with self.lock:
+            return self.random.random()
+
+    def reset_counts(self):
+        with self.lock:
+            for outcome in self.request_counts:
+                self.request_counts[outcome] = 0
+
+    def make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Allows connections to be kept alive and reused
+
+            def do_GET(self):
+                roll = stub.draw()
+                delay = stub.latency + (stub.jitter * stub.draw() if stub.jitter > 0 else 0)
+                if delay > 0:
+                    time.sleep(delay)
+
+                if roll < stub.rate_limit_rate:
+                    stub.count('rate_limited')
+                    return self.reply(429, b'Too Many Requests', {'Retry-After': str(stub.retry_after)})
+                if roll < stub.rate_limit_rate + stub.error_rate:
+                    stub.count('server_error')
+                    return self.reply(500, b'Internal Server Error')
+
+                parts = self.path.split('?')[0].strip('/').split('/')
+                body = stub.responses.get((parts[-2], parts[-1])) if len(parts) >= 2 else None
+                if body is None:
+                    stub.count('not_found')
+                    return self.reply(404, b'Not Found')
+
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    stub.count('not_modified')
+                    return self.reply(304, b'', {'ETag': etag})
+
+                stub.count('ok')
+                self.reply(200, body, {'Content-Type': 'application/json', 'ETag': etag})
+
+            def reply(self, status, body, headers=None):
+                self.send_response(status)
+                for header, value in (headers or {}).items():
+                    self.send_header(header, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # Keeps benchmark output readable
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded PokeAPI JSON locally")
+    parser.add_argument('root')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    stub_server = StubServer(args.root, args.port, args.latency, args.rate_limit_rate, seed=args.seed,
+                             jitter=args.jitter, error_rate=args.error_rate)
+    print(f"Serving {len(stub_server.responses)} recorded responses at {stub_server.base_url}")
+    stub_server.server.serve_forever()
@@ -0,0 +1,177 @@
+"""
+Offensive coverage and defensive rankings over all 171 type combinations, weighted by how types are spread across
+real Pokémon (assuming each Pokémon has one STAB move of each of its types)
+
+Everything is scored from one 171x171 matchup matrix, where entry [defending combination, attacking combination] is
+the best multiplier the attacker's STAB moves get against the defender. Given a weight vector of how many Pokémon
+have each type combination:
+- Defence: matrix @ weights, the average multiplier each combination takes from the Pokémon it could face
+- Offence: weights @ matrix, the average multiplier each combination's STAB moves get against the Pokémon it could hit
+The matrix doesn't depend on the data, and each row's combination is worked out once per dataset version, so
+re-ranking under a different filter is a mask and a bincount followed by two matrix products
+
+Usage:
+    python type_coverage.py pokemon_data_gen1.csv pokemon_data_gen2.csv --generation 1 2 --is_legendary False
+"""
+
+import argparse
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from type_effectiveness import TYPES, combination_table, type_indices
+
+
+@lru_cache(maxsize=None)
+def combination_index():
+    """
+    An 18x18 lookup from (type index, type index) to the combination's row in combination_table, which works for
+    either order of a dual type. Single types are looked up on the diagonal
+    """
+    lookup = np.empty((len(TYPES), len(TYPES)), dtype=np.int64)
+    for position, (first, second) in enumerate(combination_table().index):
+        i = TYPES.index(first)
+        j = TYPES.index(second) if isinstance(second, str) else i  # The index stores None as NaN
+        lookup[i, j] = lookup[j, i] = position
+    return lookup
+
+
+@lru_cache(maxsize=None)
+def matchup_matrix():
+    """
+    The 171x171 matrix of [defending combination, attacking combination], each entry being the better of the
+    attacker's (up to two) STAB multipliers against the defender
+    """
+    table = combination_table()
+    effectiveness = table.to_numpy()  # [defending combination, attacking type]
+    first = np.array([TYPES.index(f) for f, _ in table.index])
+    second = np.array([TYPES.index(t) if isinstance(t, str) else TYPES.index(f) for f, t in table.index])
+    return np.maximum(effectiveness[:, first], effectiveness[:, second])
+
+
+def dataset_version(df, columns=('types', 'type1', 'type2')):
+    """
+    A hash of the columns an analysis reads (by default the type columns this one reads), so that cached
+    intermediates are reused until the data changes
+    """
+    columns = [column for column in columns if column in df]
+    hashed = pd.util.hash_pandas_object(df[columns].astype(str), index=False)
+    return int(np.bitwise_xor.reduce(hashed.to_numpy() * np.arange(1, len(hashed) + 1, dtype=np.uint64)) ^ len(df))
+
+
+# Dataset version -> each row's combination index, with -1 for rows without a known type
+combination_codes = dict()
+
+
+def row_combinations(df):
+    version = dataset_version(df)
+    if version not in combination_codes:
+        primary, secondary = type_indices(df)
+        codes = combination_index()[primary.clip(0), np.where(secondary >= 0, secondary, primary.clip(0))]
+        combination_codes[version] = np.where(primary >= 0, codes, -1)
+    return combination_codes[version]
+
+
+def filter_mask(df, generation=None, **flags):
+    """
+    Boolean mask of the rows to weight by
+    - generation: a generation number or list of them
+    - flags: column=value pairs, e.g. is_legendary=False or evolutionary_stage=2, with lists allowed as values
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if generation is not None:
+        flags['generation'] = generation
+
+    for column, value in flags.items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        column_values = df[column].astype(str).str.strip()
+        mask &= column_values.isin([str(v) for v in values]).to_numpy()
+    return mask
+
+
+def combination_weights(df, mask=None):
+    """
+    How many of the (masked) rows have each of the 171 type combinations
+    """
+    codes = row_combinations(df)
+    if mask is not None:
+        codes = codes[mask]
+    return np.bincount(codes[codes >= 0], minlength=len(combination_table())).astype(float)
+
+
+def score_combinations(weights):
+    """
+    Offensive and defensive scores for every type combination, given combination weights
+    """
+    matrix = matchup_matrix()
+    total = weights.sum()
+    if not total:
+        raise ValueError("No Pokémon match the filter")
+    weights = weights / total
+
+    # Shares of weighted Pokémon hit super-effectively / resisting, from the same matrix
+    super_effective = (matrix > 1).astype(float)
+    not_very_effective = (matrix < 1).astype(float)
+
+    scores = pd.DataFrame({
+        'count': weights * total,
+        'offence': weights @ matrix,
+        'offence_super_effective': weights @ super_effective,
+        'offence_resisted': weights @ not_very_effective,
+        'defence': matrix @ weights,
+        'defence_weak': super_effective @ weights,
+        'defence_resists': not_very_effective @ weights,
+    }, index=combination_table().index)
+    return scores
+
+
+def rank_types(df=None, generation=None, existing_only=False, **flags):
+    """
+    Scores every type combination, with offence higher-is-better and defence lower-is-better
+    With no dataset, every combination is weighted equally. With existing_only set, combinations no (filtered)
+    Pokémon have are left out of the results, though they never contribute weight either way
+    """
+    if df is None:
+        weights = np.ones(len(combination_table()))
+    else:
+        mask = filter_mask(df, generation, **flags) if generation is not None or flags else None
+        weights = combination_weights(df, mask)
+
+    scores = score_combinations(weights)
+    if existing_only:
+        scores = scores[scores['count'] > 0]
+    return scores
+
+
+def best_offence(scores, top=10):
+    return scores.sort_values(['offence', 'offence_super_effective'], ascending=False).head(top)
+
+
+def best_defence(scores, top=10):
+    return scores.sort_values(['defence', 'defence_weak'], ascending=True).head(top)
+
+
+def parse_flag_value(value):
+    # Command line values are compared as strings, so booleans and numbers need no special handling
+    return value.split(',') if ',' in value else value
+
+
+if __name__ == "__main__":
+    from dataset_schema import read_dataset
+
+    parser = argparse.ArgumentParser(description="Rank type combinations offensively and defensively")
+    parser.add_argument('paths', nargs='*', help="Dataset CSVs to weight by (all combinations equally if none)")
+    parser.add_argument('--generation', type=int, nargs='*', default=None)
+    parser.add_argument('--top', type=int, default=10)
+    args, unknown = parser.parse_known_args()
+
+    # Any other --column value pairs are filters, e.g. --is_legendary False --evolutionary_stage 2,-1
+    flags = {unknown[i].lstrip('-'): parse_flag_value(unknown[i + 1]) for i in range(0, len(unknown) - 1, 2)}
+
+    dataset = read_dataset(args.paths) if args.paths else None
+    results = rank_types(dataset, args.generation, existing_only=dataset is not None, **flags)
+    print("Best offensively:")
+    print(best_offence(results, args.top).to_string())
+    print("\nBest defensively:")
+    print(best_defence(results, args.top).to_string())
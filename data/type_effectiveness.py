@@ -0,0 +1,245 @@
+"""
+Vectorised type effectiveness, for the against_* columns that the v0.1 Kaggle dataset has and ours doesn't
+
+The 18x18 type chart is held as a NumPy array, and the effectiveness of every attacking type against every row is
+computed in one pass by indexing the chart with each row's type indices, rather than looping over Pokémon in Python.
+Ability-based modifiers (Levitate, Flash Fire, Wonder Guard etc.) can also be applied, in the same vectorised way
+
+Usage as a parity check against the v0.1 dataset:
+    python type_effectiveness.py v0.1_data/pokemon.csv
+"""
+
+import argparse
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from dataset_schema import parse_list
+
+# Alphabetical, matching the order of the against_* columns in the v0.1 dataset
+TYPES = [
+    'bug', 'dark', 'dragon', 'electric', 'fairy', 'fighting', 'fire', 'flying', 'ghost',
+    'grass', 'ground', 'ice', 'normal', 'poison', 'psychic', 'rock', 'steel', 'water'
+]
+TYPE_INDEX = {pokemon_type: index for index, pokemon_type in enumerate(TYPES)}
+
+# Attacking type -> {defending type: multiplier}, for every matchup that isn't neutral (as of Gen 6 onward)
+MATCHUPS = {
+    'normal': {'rock': 0.5, 'ghost': 0, 'steel': 0.5},
+    'fire': {'fire': 0.5, 'water': 0.5, 'grass': 2, 'ice': 2, 'bug': 2, 'rock': 0.5, 'dragon': 0.5, 'steel': 2},
+    'water': {'fire': 2, 'water': 0.5, 'grass': 0.5, 'ground': 2, 'rock': 2, 'dragon': 0.5},
+    'electric': {'water': 2, 'electric': 0.5, 'grass': 0.5, 'ground': 0, 'flying': 2, 'dragon': 0.5},
+    'grass': {'fire': 0.5, 'water': 2, 'grass': 0.5, 'poison': 0.5, 'ground': 2, 'flying': 0.5, 'bug': 0.5,
+              'rock': 2, 'dragon': 0.5, 'steel': 0.5},
+    'ice': {'fire': 0.5, 'water': 0.5, 'grass': 2, 'ice': 0.5, 'ground': 2, 'flying': 2, 'dragon': 2, 'steel': 0.5},
+    'fighting': {'normal': 2, 'ice': 2, 'poison': 0.5, 'flying': 0.5, 'psychic': 0.5, 'bug': 0.5, 'rock': 2,
+                 'ghost': 0, 'dark': 2, 'steel': 2, 'fairy': 0.5},
+    'poison': {'grass': 2, 'poison': 0.5, 'ground': 0.5, 'rock': 0.5, 'ghost': 0.5, 'steel': 0, 'fairy': 2},
+    'ground': {'fire': 2, 'electric': 2, 'grass': 0.5, 'poison': 2, 'flying': 0, 'bug': 0.5, 'rock': 2, 'steel': 2},
+    'flying': {'electric': 0.5, 'grass': 2, 'fighting': 2, 'bug': 2, 'rock': 0.5, 'steel': 0.5},
+    'psychic': {'fighting': 2, 'poison': 2, 'psychic': 0.5, 'dark': 0, 'steel': 0.5},
+    'bug': {'fire': 0.5, 'grass': 2, 'fighting': 0.5, 'poison': 0.5, 'flying': 0.5, 'psychic': 2, 'ghost': 0.5,
+            'dark': 2, 'steel': 0.5, 'fairy': 0.5},
+    'rock': {'fire': 2, 'ice': 2, 'fighting': 0.5, 'ground': 0.5, 'flying': 2, 'bug': 2, 'steel': 0.5},
+    'ghost': {'normal': 0, 'psychic': 2, 'ghost': 2, 'dark': 0.5},
+    'dragon': {'dragon': 2, 'steel': 0.5, 'fairy': 0},
+    'dark': {'fighting': 0.5, 'psychic': 2, 'ghost': 2, 'dark': 0.5, 'fairy': 0.5},
+    'steel': {'fire': 0.5, 'water': 0.5, 'electric': 0.5, 'ice': 2, 'rock': 2, 'steel': 0.5, 'fairy': 2},
+    'fairy': {'fire': 0.5, 'fighting': 2, 'poison': 0.5, 'dragon': 2, 'dark': 2, 'steel': 0.5},
+}
+
+# Abilities that change how much damage a Pokémon takes from certain types: {attacking type: multiplier}
+ABILITY_MODIFIERS = {
+    'levitate': {'ground': 0},
+    'earth-eater': {'ground': 0},
+    'flash-fire': {'fire': 0},
+    'well-baked-body': {'fire': 0},
+    'water-absorb': {'water': 0},
+    'storm-drain': {'water': 0},
+    'dry-skin': {'water': 0, 'fire': 1.25},
+    'volt-absorb': {'electric': 0},
+    'lightning-rod': {'electric': 0},
+    'motor-drive': {'electric': 0},
+    'sap-sipper': {'grass': 0},
+    'thick-fat': {'fire': 0.5, 'ice': 0.5},
+    'heatproof': {'fire': 0.5},
+    'water-bubble': {'fire': 0.5},
+    'purifying-salt': {'ghost': 0.5},
+    'fluffy': {'fire': 2},
+}
+# Abilities that only let super-effective hits through, and abilities that soften them
+WONDER_GUARD_ABILITIES = {'wonder-guard'}
+SUPER_EFFECTIVE_REDUCTIONS = {'filter': 0.75, 'solid-rock': 0.75, 'prism-armor': 0.75}
+ABILITIES = ['none'] + sorted(set(ABILITY_MODIFIERS) | WONDER_GUARD_ABILITIES | set(SUPER_EFFECTIVE_REDUCTIONS))
+ABILITY_INDEX = {ability: index for index, ability in enumerate(ABILITIES)}
+
+
+def build_chart():
+    """
+    The type chart as an 18x18 array, indexed [attacking type, defending type]
+    """
+    chart = np.ones((len(TYPES), len(TYPES)))
+    for attacking_type, matchups in MATCHUPS.items():
+        for defending_type, multiplier in matchups.items():
+            chart[TYPE_INDEX[attacking_type], TYPE_INDEX[defending_type]] = multiplier
+    return chart
+
+
+def build_ability_arrays():
+    """
+    Per-ability arrays: multipliers by attacking type, Wonder Guard flags and super-effective reductions
+    Row 0 is 'none', which leaves everything unchanged, so that rows can be padded with it
+    """
+    modifiers = np.ones((len(ABILITIES), len(TYPES)))
+    for ability, type_modifiers in ABILITY_MODIFIERS.items():
+        for attacking_type, multiplier in type_modifiers.items():
+            modifiers[ABILITY_INDEX[ability], TYPE_INDEX[attacking_type]] = multiplier
+
+    wonder_guard = np.array([ability in WONDER_GUARD_ABILITIES for ability in ABILITIES])
+    reductions = np.array([SUPER_EFFECTIVE_REDUCTIONS.get(ability, 1.0) for ability in ABILITIES])
+    return modifiers, wonder_guard, reductions
+
+
+TYPE_CHART = build_chart()
+ABILITY_MODIFIER_ARRAY, WONDER_GUARD_ARRAY, SUPER_EFFECTIVE_REDUCTION_ARRAY = build_ability_arrays()
+
+
+def normalise_name(name):
+    # The v0.1 dataset writes names as e.g. 'Flash Fire', where PokeAPI uses 'flash-fire'
+    return str(name).strip().lower().replace(' ', '-')
+
+
+def type_indices(df):
+    """
+    Returns (primary, secondary) type index arrays for every row, with -1 for no secondary type
+    Works with either a types column (generated datasets) or type1/type2 columns (v0.1 dataset)
+    """
+    if 'types' in df:
+        type_lists = df['types'].map(parse_list)
+        first = type_lists.map(lambda types: types[0] if isinstance(types, list) and types else None)
+        second = type_lists.map(lambda types: types[1] if isinstance(types, list) and len(types) > 1 else None)
+    else:
+        first, second = df['type1'], df['type2']
+
+    primary = first.map(lambda t: TYPE_INDEX.get(normalise_name(t), -1) if isinstance(t, str) else -1)
+    secondary = second.map(lambda t: TYPE_INDEX.get(normalise_name(t), -1) if isinstance(t, str) else -1)
+    return primary.to_numpy(dtype=np.int64), secondary.to_numpy(dtype=np.int64)
+
+
+def effectiveness_from_indices(primary, secondary):
+    """
+    Effectiveness of every attacking type against every row, as an (rows, 18) array
+    Rows without a known primary type come out as NaN, and a secondary type repeating the primary counts as none
+    """
+    defending = TYPE_CHART.T  # [defending type, attacking type]
+    has_secondary = (secondary >= 0) & (secondary != primary)  # The v0.1 dataset repeats e.g. Raichu's type
+    result = defending[primary.clip(0)] * np.where(has_secondary[:, None], defending[secondary.clip(0)], 1.0)
+    result[primary < 0] = np.nan
+    return result
+
+
+def ability_indices(df):
+    """
+    Every row's potential abilities (normal and hidden) as an (rows, max abilities) array of ABILITIES indices,
+    padded with -1. Abilities with no effect on type matchups are mapped to 'none', and rows of a dataset with no
+    abilities column are all padding
+    """
+    if 'abilities' in df:
+        ability_lists = df['abilities'].map(parse_list)
+        ability_lists = [abilities if isinstance(abilities, list) else [] for abilities in ability_lists]
+    else:
+        ability_lists = [[] for _ in range(len(df))]
+    if 'hidden_ability' in df:
+        ability_lists = [
+            abilities + ([hidden] if isinstance(hidden, str) else [])
+            for abilities, hidden in zip(ability_lists, df['hidden_ability'])
+        ]
+
+    width = max((len(abilities) for abilities in ability_lists), default=0) or 1
+    indices = np.full((len(ability_lists), width), -1, dtype=np.int64)
+    for row, abilities in enumerate(ability_lists):
+        indices[row, :len(abilities)] = [ABILITY_INDEX.get(normalise_name(a), 0) for a in abilities]
+    return indices
+
+
+def apply_abilities(effectiveness, abilities):
+    """
+    Applies ability modifiers, choosing for each row the potential ability that leaves it with the lowest total
+    damage taken. Returns (effectiveness, index into ABILITIES of the chosen ability)
+    Padding slots are never chosen, so a row whose only ability is harmful (e.g. Fluffy) gets its modifier. Rows with
+    no abilities at all are left unmodified
+    """
+    padding = abilities < 0
+    abilities = abilities.clip(0)
+
+    # (rows, abilities, types): each row's effectiveness under each of its potential abilities
+    candidates = effectiveness[:, None, :] * ABILITY_MODIFIER_ARRAY[abilities]
+    super_effective = candidates > 1
+    candidates = np.where(super_effective, candidates * SUPER_EFFECTIVE_REDUCTION_ARRAY[abilities][:, :, None],
+                          candidates)
+    candidates = np.where(WONDER_GUARD_ARRAY[abilities][:, :, None] & ~super_effective, 0.0, candidates)
+
+    totals = np.nan_to_num(candidates, nan=np.inf).sum(axis=2)
+    totals[padding & ~padding.all(axis=1)[:, None]] = np.inf
+    best = totals.argmin(axis=1)
+    rows = np.arange(len(effectiveness))
+    return candidates[rows, best], abilities[rows, best]
+
+
+def against_columns(df, abilities=False):
+    """
+    Computes against_<type> columns for every row of a generated (or v0.1) dataset in one vectorised pass
+    With abilities set, each row's most favourable potential ability is applied, and recorded in against_ability
+    """
+    effectiveness = effectiveness_from_indices(*type_indices(df))
+    if abilities:
+        effectiveness, chosen = apply_abilities(effectiveness, ability_indices(df))
+
+    columns = {f'against_{attacking_type}': effectiveness[:, index] for index, attacking_type in enumerate(TYPES)}
+    if abilities:
+        columns['against_ability'] = [ABILITIES[index] if index else None for index in chosen]
+    return pd.DataFrame(columns, index=df.index)
+
+
+@lru_cache(maxsize=None)
+def combination_table():
+    """
+    Effectiveness of every attacking type against all 171 defending type combinations (18 single types and
+    153 dual types), indexed by (type1, type2) with type2 None for single types
+    """
+    combinations = [(TYPES[i], None) for i in range(len(TYPES))]
+    combinations += [(TYPES[i], TYPES[j]) for i in range(len(TYPES)) for j in range(i + 1, len(TYPES))]
+
+    primary = np.array([TYPE_INDEX[first] for first, _ in combinations])
+    secondary = np.array([TYPE_INDEX[second] if second else -1 for _, second in combinations])
+    index = pd.MultiIndex.from_tuples(combinations, names=['type1', 'type2'])
+    return pd.DataFrame(effectiveness_from_indices(primary, secondary), index=index,
+                        columns=[f'against_{t}' for t in TYPES])
+
+
+def check_against_v01(path='v0.1_data/pokemon.csv'):
+    """
+    Compares computed against_* values with those in the v0.1 dataset, returning the rows that differ
+    (the v0.1 values ignore abilities, so abilities aren't applied here)
+    The v0.1 dataset gives Pokémon with regional forms (e.g. Rattata, Vulpix) their Alolan types but their original
+    form's against_* values, so those 9 rows are expected to differ
+    """
+    df = pd.read_csv(path)
+    computed = against_columns(df)
+    columns = [f'against_{t}' for t in TYPES]
+    expected = df.rename(columns={'against_fight': 'against_fighting'})[columns]
+
+    differs = ~np.isclose(computed[columns].to_numpy(), expected.to_numpy()).all(axis=1)
+    return df.loc[differs, ['name', 'type1', 'type2']].join(computed[differs])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check computed type effectiveness against the v0.1 dataset")
+    parser.add_argument('path', nargs='?', default='v0.1_data/pokemon.csv')
+    args = parser.parse_args()
+
+    mismatches = check_against_v01(args.path)
+    print(f"{len(mismatches)} rows differ from the v0.1 against_* values")
+    if len(mismatches):
+        print(mismatches.to_string())
@@ -1,26 +1,33 @@
-import pandas as pd
 from datetime import datetime
 
 from pokemondata import PokemonData
 
-pokemon_list = []
 final_mon_dex_num = 1025
 
-start_time = datetime.now()
 
-for dex_num in range(1, final_mon_dex_num + 1):
-    print(dex_num)  # For logging dataset collation progress
+def main():
+    import pandas as pd  # Only needed once the data is collected, so importing this module stays cheap
 
-    original_variety = PokemonData(dex_num)
-    pokemon_list.append(original_variety.to_dict())
+    pokemon_list = []
+    start_time = datetime.now()
 
-    for variety in original_variety.varieties:  # Logs Pokémon varieties (e.g. Wormadam-Grass, Mega Evolutions)
-        print(dex_num, variety)  # For logging dataset collation progress
+    for dex_num in range(1, final_mon_dex_num + 1):
+        print(dex_num)  # For logging dataset collation progress
 
-        additional_variety = PokemonData(variety)
-        pokemon_list.append(additional_variety.to_dict())
+        original_variety = PokemonData(dex_num)
+        pokemon_list.append(original_variety.to_dict())
 
-df = pd.DataFrame(pokemon_list)
-df.to_csv('pokemon_data.csv')
+        for variety in original_variety.varieties:  # Logs Pokémon varieties (e.g. Wormadam-Grass, Mega Evolutions)
+            print(dex_num, variety)  # For logging dataset collation progress
 
-print(f"Total time taken: {datetime.now() - start_time}")
+            additional_variety = PokemonData(variety)
+            pokemon_list.append(additional_variety.to_dict())
+
+    df = pd.DataFrame(pokemon_list)
+    df.to_csv('pokemon_data.csv')
+
+    print(f"Total time taken: {datetime.now() - start_time}")
+
+
+if __name__ == "__main__":
+    main()